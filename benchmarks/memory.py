@@ -0,0 +1,110 @@
+"""Measures the memory used by parsed entries and check results.
+
+Parses a synthetic BibTeX file with a Checker, builds problems and
+differences, and reports the memory retained for them, as measured by
+tracemalloc. The entries are parsed once as in a normal run and once as
+for a shard, which keeps the entry dicts. Run it at two revisions to
+compare them:
+
+    python benchmarks/memory.py [entries] [results]
+"""
+import gc
+import random
+import sys
+import tracemalloc
+
+from bibchex.checker import Checker
+from bibchex.data import Difference, Problem
+from bibchex.ui import UI
+
+WORDS = ["graph", "network", "linear", "generation", "algorithm", "load",
+         "balancing", "consumption", "scheduling", "theory", "computing",
+         "approximation", "random", "efficient", "parallel", "distributed"]
+JOURNALS = ["Network Science", "Journal of Algorithms",
+            "Theoretical Computer Science", "Algorithmica"]
+NAMES = ["Lukas", "Dorothea", "Jane", "John", "Ada", "Alan", "Grace"]
+LAST_NAMES = ["Barth", "Wagner", "Doe", "Roe", "Lovelace", "Turing",
+              "Hopper"]
+
+
+def synthetic_bentries(count, rng):
+    """Returns entry dicts like the ones bibtexparser produces."""
+    bentries = []
+    for i in range(count):
+        title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 10)))
+        authors = " and ".join("{} {}".format(rng.choice(NAMES),
+                                              rng.choice(LAST_NAMES))
+                               for _ in range(rng.randint(1, 4)))
+        page = i % 500
+        bentries.append({
+            'ID': "entry{}".format(i),
+            'ENTRYTYPE': 'article',
+            'title': title.capitalize(),
+            'author': authors,
+            'journal': rng.choice(JOURNALS),
+            'year': str(rng.randint(1990, 2020)),
+            'pages': "{}--{}".format(page, page + 10),
+            'doi': "10.1000/{}".format(i),
+            'url': "https://doi.org/10.1000/{}".format(i)})
+    return bentries
+
+
+def to_bibtex(bentries):
+    parts = []
+    for bentry in bentries:
+        fields = ",\n".join("  {} = {{{}}}".format(name, value)
+                            for (name, value) in bentry.items()
+                            if name not in ('ID', 'ENTRYTYPE'))
+        parts.append("@{}{{{},\n{}\n}}\n".format(
+            bentry['ENTRYTYPE'], bentry['ID'], fields))
+    return "\n".join(parts)
+
+
+def parsed_memory(text, shard=None):
+    """Returns a checker that parsed *text* and the memory it retained."""
+    tracemalloc.start()
+    checker = Checker('memory.bib', '/dev/null', text=text, shard=shard)
+    checker._parse()
+    # The parser leaves reference cycles behind
+    gc.collect()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (checker, memory)
+
+
+def main():
+    entry_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    result_count = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+
+    rng = random.Random(0)
+    bentries = synthetic_bentries(entry_count, rng)
+    text = to_bibtex(bentries)
+    UI.select_silent()
+    # The parser's grammar is built once and should not be measured
+    Checker('memory.bib', '/dev/null', text=to_bibtex(bentries[:1]))._parse()
+    del bentries
+
+    (_, shard_memory) = parsed_memory(text, shard=(0, 1))
+    (checker, entry_memory) = parsed_memory(text)
+    entries = list(checker._entries.values())
+
+    tracemalloc.start()
+
+    problems = [Problem(entries[i % entry_count].get_id(), 'journal_abbrev',
+                        'journal_abbrev', "Problem {}".format(i), "")
+                for i in range(result_count)]
+    diffs = [Difference(entries[i % entry_count].get_id(), 'crossref',
+                        'title', ["Suggestion {}".format(i)])
+             for i in range(result_count)]
+    result_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print("{} entries: {:.1f} MB".format(len(entries), entry_memory / 1e6))
+    print("{} entries with entry dicts (shards, watch mode): {:.1f} MB"
+          .format(len(entries), shard_memory / 1e6))
+    print("{} problems and {} differences: {:.1f} MB".format(
+        len(problems), len(diffs), result_memory / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -6,8 +6,12 @@ import os.path
 import sys
 
 from bibchex.ui import UI
-from bibchex.checker import Checker
+from bibchex.checker import Checker, MultiChecker
 from bibchex.config import Config
+from bibchex.server import CheckServer
+from bibchex.lsp import LanguageServer
+from bibchex.shard import ShardMerger, parse_shard_spec
+from bibchex.journal import Journal
 
 parser = argparse.ArgumentParser(description="Check BibTex files")
 
@@ -25,11 +29,71 @@ parser.add_argument('--silent', dest='ui_silent', action='store_const',
 parser.add_argument('--config', nargs='?', type=str,
                     help="Path to the JSON config file")
 
-parser.add_argument('input_file', nargs=1, type=str,
-                    help='Input BibTex file')
+parser.add_argument('--watch', dest='watch', action='store_const',
+                    const=True, default=False,
+                    help=("Keep running, and re-check changed entries "
+                          "whenever the input file is modified"))
+
+parser.add_argument('--changed-since', dest='changed_since', type=str,
+                    metavar='REV',
+                    help=("Only check entries that were added or changed "
+                          "since the given git revision"))
+
+parser.add_argument('--journal', type=str, metavar='FILE',
+                    help=("Record all finished work in this journal file, "
+                          "such that an interrupted run can be resumed"))
+parser.add_argument('--resume', dest='resume', action='store_const',
+                    const=True, default=False,
+                    help=("Resume an interrupted run, skipping all work "
+                          "recorded in the journal file"))
+
+parser.add_argument('--shard', type=str, metavar='i/N',
+                    help=("Only check the i-th of N shards of the input "
+                          "file, and write the results as JSON to the "
+                          "output file, to be merged with --merge"))
+parser.add_argument('--merge', dest='merge', action='store_const',
+                    const=True, default=False,
+                    help=("Merge the JSON files written by sharded runs "
+                          "(all but the last positional argument) into "
+                          "one HTML or JSON report (the last one)"))
+
+parser.add_argument('--serve', dest='serve', action='store_const',
+                    const=True, default=False,
+                    help=("Run as a server that checks BibTeX data posted "
+                          "to a local HTTP/JSON API"))
+parser.add_argument('--host', type=str, default='127.0.0.1',
+                    help="Address to listen on in server mode")
+parser.add_argument('--port', type=int, default=8080,
+                    help="Port to listen on in server mode")
+
+parser.add_argument('--lsp', dest='lsp', action='store_const',
+                    const=True, default=False,
+                    help=("Run as a language server, speaking the Language "
+                          "Server Protocol on stdin / stdout"))
+
+parser.add_argument('--output-dir', dest='output_dir', type=str,
+                    help=("Check all given input files in one run, and "
+                          "write one HTML file per input file into this "
+                          "directory"))
 
-parser.add_argument('output_file', nargs=1, type=str,
-                    help='Output HTML file')
+parser.add_argument('files', nargs='*', type=str, metavar='file',
+                    help=("Input BibTex file and output HTML file or, "
+                          "with --output-dir, any number of input files"))
+
+
+def output_filenames(input_filenames, output_dir):
+    result = []
+    for filename in input_filenames:
+        name = os.path.splitext(os.path.basename(filename))[0]
+        out_filename = os.path.join(output_dir, "{}.html".format(name))
+        i = 1
+        while out_filename in result:
+            out_filename = os.path.join(output_dir,
+                                        "{}-{}.html".format(name, i))
+            i += 1
+        result.append(out_filename)
+
+    return result
 
 
 def main(passed_args=None):
@@ -37,8 +101,33 @@ def main(passed_args=None):
         passed_args = sys.argv[1:]
 
     args = parser.parse_args(passed_args)
-
-    if args.ui_gui:
+    if args.output_dir:
+        if not args.files:
+            parser.error("at least one input file is required")
+        if args.watch:
+            parser.error("--watch cannot be used with --output-dir")
+    elif args.merge:
+        if len(args.files) < 2:
+            parser.error("shard files and an output file are required")
+    elif not (args.serve or args.lsp) and len(args.files) != 2:
+        parser.error("an input file and an output file are required")
+
+    if args.resume and not args.journal:
+        parser.error("--resume requires --journal")
+
+    shard = None
+    if args.shard:
+        try:
+            shard = parse_shard_spec(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
+        if args.watch:
+            parser.error("--watch cannot be used with --shard")
+
+    if args.lsp:
+        # stdout is reserved for the protocol
+        UI.select_silent()
+    elif args.ui_gui:
         UI.select_gui()
     elif args.ui_cli:
         UI.select_cli()
@@ -61,14 +150,44 @@ def main(passed_args=None):
     loop.set_debug(True)
     loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(20))
 
+    c = None
+    journal = None
     try:
-        c = Checker(args.input_file[0], args.output_file[0])
-        loop.run_until_complete(c.run())
+        if args.lsp:
+            loop.run_until_complete(LanguageServer().serve())
+        elif args.serve:
+            c = CheckServer()
+            loop.run_until_complete(c.start(args.host, args.port))
+            loop.run_forever()
+        elif args.merge:
+            merger = ShardMerger(args.files[:-1], args.files[-1])
+            loop.run_until_complete(merger.run())
+        elif args.output_dir:
+            c = MultiChecker(args.files,
+                             output_filenames(args.files, args.output_dir))
+            loop.run_until_complete(c.run())
+        else:
+            if args.journal:
+                journal = Journal(args.journal, resume=args.resume)
+            c = Checker(args.files[0], args.files[1],
+                        changed_since=args.changed_since, shard=shard,
+                        journal=journal)
+            if args.watch:
+                loop.run_until_complete(c.watch())
+            else:
+                loop.run_until_complete(c.run())
+    except KeyboardInterrupt:
+        pass
     except Exception as e:
         exc_str = traceback.format_exc()
         ui.error("Exception", str(e))
         ui.error("Traceback", exc_str)
 
+    if c:
+        loop.run_until_complete(c.close())
+    if journal:
+        journal.close()
+
     ui.wait()
 
 
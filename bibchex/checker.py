@@ -1,61 +1,390 @@
-import concurrent
+from collections import Counter
+import concurrent.futures
+from functools import partial
+import hashlib
+import io
+import json
+import os
 import sys
 import asyncio
 import logging
 
-import bibtexparser
-
-from bibchex.data import Entry, Problem
+from bibchex.data import Entry, Problem, Suggestion
 from bibchex.differ import Differ
-from bibchex.sources import SOURCES, CrossrefSource
+from bibchex.sources import SOURCES, CachedSource, CrossrefSource
 from bibchex.ui import UI
 from bibchex.checks import CCHECKERS
 from bibchex.output import HTMLOutput
 from bibchex.config import Config
 from bibchex.unify import Unifier
+from bibchex.util import unify_hyphens
+from bibchex.strutil import crush_spaces
+from bibchex.vcs import git_show
+from bibchex.shard import shard_of
+from bibchex.parsing import parse_bibtex, iter_bibtex, split_for_parallel
+from bibchex.parsing import parse_entries, SourceIndex
+from bibchex.parallel import WorkerPool
 
 LOGGER = logging.getLogger(__name__)
 
+
+class DuplicateKeyError(Exception):
+    """Exception thrown if the BibTeX file contains a key twice."""
+
+
+def read_bibtex(filename, text=None):
+    """Parses the BibTeX file *filename* (or the BibTeX data in *text*, if
+    given) and returns a dictionary mapping keys to bibtexparser's entry
+    dicts. Raises a DuplicateKeyError if a key occurs twice."""
+    if text is None:
+        with open(filename) as bibtex_file:
+            text = bibtex_file.read()
+    return _by_key(parse_bibtex(text))
+
+
+def _by_key(bentries):
+    raw_entries = {bentry['ID']: bentry for bentry in bentries}
+    if len(raw_entries) != len(bentries):
+        raise DuplicateKeyError("Duplicate keys detected!")
+
+    return raw_entries
+
+
+def stream_bibtex(filename, text=None):
+    """Like read_bibtex, but yields the entry dicts one after the other,
+    while the file is still being read. Raises a DuplicateKeyError once a
+    key occurs for the second time."""
+    seen_keys = set()
+    if text is not None:
+        bentries = iter_bibtex(io.StringIO(text))
+    else:
+        bentries = _iter_bibtex_file(filename)
+
+    for bentry in bentries:
+        if bentry['ID'] in seen_keys:
+            raise DuplicateKeyError(
+                "Duplicate key detected: {}".format(bentry['ID']))
+        seen_keys.add(bentry['ID'])
+        yield bentry
+
+
+def _iter_bibtex_file(filename):
+    with open(filename) as bibtex_file:
+        yield from iter_bibtex(bibtex_file)
+
+
+def changed_keys(old_entries, new_entries):
+    """Returns the keys of all entries in *new_entries* that are not in
+    *old_entries* or differ from the entry there. Both must map keys
+    to bibtexparser's entry dicts."""
+    return set((key for (key, bentry) in new_entries.items()
+                if old_entries.get(key) != bentry))
+
+
+def _hash_bentry(bentry):
+    serialized = json.dumps(bentry, sort_keys=True)
+    return hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+
+
 class Checker(object):
-    def __init__(self, filename, out_filename):
+    def __init__(self, filename, out_filename, text=None, sources=None,
+                 doi_source=None, changed_since=None, shard=None,
+                 journal=None):
         self._fname = filename
         self._out_filename = out_filename
-
-        self._bibtex_data = None
+        # If given, the BibTeX data is read from this string instead of
+        # from the input file.
+        self._text = text
+        # If given, only entries that changed since this git revision
+        # are checked.
+        self._changed_since = changed_since
+        # If given as (index, count), only the entries of this shard are
+        # checked, and the results are written as JSON to be merged later.
+        self._shard = shard
+        self._positions = {}
+        # If given, finished work is recorded in this journal, and work
+        # that is already recorded there is not done again.
+        self._journal = journal
+        # With a journal, maps entry IDs to hashes of their entry dicts
+        self._entry_hashes = {}
+        # In watch mode, the index of the input file, such that only the
+        # changed parts of the file are parsed again
+        self._index = None
+        # In watch mode, the global checkers keep the data they collected
+        # from all entries between checks. Only the data of changed
+        # entries is replaced.
+        self._warm_global_checks = False
+
+        # The entry dicts as parsed, only kept where they are needed (see
+        # _keeps_raw_entries())
+        self._raw_entries = {}
         self._entries = {}
         self._suggestions = {}
 
-        self._retrieval_errors = []
+        # Maps entry IDs to the errors that occurred while retrieving data
+        # for the entry
+        self._retrieval_errors = {}
         self._diffs = []
         self._problems = []
         self._global_problems = []
 
         self._unifier = Unifier()
+        # Sources are kept for the lifetime of the checker, such that rate
+        # limiters and connection pools survive re-checks in watch mode.
+        # They can also be passed in to share them between checkers.
+        self._doi_source = doi_source
+        self._sources = sources
 
         self._ui = UI()
         self._cfg = Config()
 
     async def run(self):
-        LOGGER.info("Parsing BibTeX")
-        self._parse()
+        # Shards and incremental checks need to know all entries up front
+        if self._cfg.get('parse_mode', None, 'full') == 'streaming' and \
+           not self._shard and not self._changed_since:
+            LOGGER.info("Parsing BibTeX and retrieving metadata")
+            await self._process_streaming()
+        else:
+            LOGGER.info("Parsing BibTeX")
+            if self._cfg.get('parse_mode', None, 'full') == 'parallel':
+                await self._parse_parallel()
+            else:
+                self._parse()
+            if self._shard:
+                self._select_shard()
+
+            entries = list(self._entries.values())
+            if self._changed_since:
+                entries = self._get_changed_entries(self._changed_since)
+            await self._process(entries)
+
+        LOGGER.info("Writing output")
+        if self._shard:
+            await self._output_shard()
+        else:
+            self._output()
+        LOGGER.info("Done.")
+
+    async def check(self, lock=None):
+        """Parses the input and runs all checks, without writing any output.
+        Raises a DuplicateKeyError if a key occurs twice in the input.
+
+        The input is parsed in a separate thread, such that the event loop
+        keeps serving other checkers in the meantime. Global checkers keep
+        their state on the checker classes. If multiple checkers run
+        concurrently, they must pass a shared *lock*, which is held while
+        the consistency checks run."""
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self._load_entries)
+        await self._process(list(self._entries.values()), lock)
+
+    async def watch(self, interval=1.0):
+        """Runs a full check, then keeps watching the input file. Whenever
+        the file is modified, only the entries that were added or changed
+        are re-checked. Results for all other entries are kept."""
+        self._index = SourceIndex(self._fname)
+        await self.run()
+        self._warm_global_checks = True
+
+        last_mtime = os.stat(self._fname).st_mtime
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                mtime = os.stat(self._fname).st_mtime
+            except FileNotFoundError:
+                # Some editors save by removing and re-creating the file
+                continue
+
+            if mtime == last_mtime:
+                continue
+            last_mtime = mtime
+
+            LOGGER.info("Input file changed, re-checking")
+            await self._recheck()
+            LOGGER.info("Writing output")
+            self._output()
+            LOGGER.info("Done. Waiting for changes.")
+
+    async def close(self):
+        for source in (self._sources or []):
+            if hasattr(source, 'close'):
+                await source.close()
+
+    async def _process(self, entries, lock=None):
         LOGGER.info("Applying unification rules")
-        self._unify()
+        self._unify(entries)
         LOGGER.info("Retrieving missing DOIs")
-        await self._find_dois()
+        await self._find_dois(entries)
         LOGGER.info("Retrieving metadata")
-        await self._retrieve()
+        await self._retrieve(entries)
+        await self._evaluate(entries, lock)
+
+    async def _process_streaming(self, batch_size=100):
+        """Like _parse() followed by _process(), but starts to retrieve
+        data for the first entries while the rest of the input is still
+        being parsed (in a separate thread)."""
+        loop = asyncio.get_event_loop()
+        queue = asyncio.Queue()
+
+        def parse():
+            try:
+                batch = []
+                for bentry in stream_bibtex(self._fname, self._text):
+                    batch.append((bentry, Entry(bentry, self._ui)))
+                    if len(batch) == batch_size:
+                        loop.call_soon_threadsafe(queue.put_nowait, batch)
+                        batch = []
+                loop.call_soon_threadsafe(queue.put_nowait, batch)
+                loop.call_soon_threadsafe(queue.put_nowait, None)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+
+        parser = loop.run_in_executor(None, parse)
+        retrievals = []
+        try:
+            while True:
+                batch = await queue.get()
+                if batch is None:
+                    break
+                if isinstance(batch, Exception):
+                    raise batch
+
+                for (bentry, entry) in batch:
+                    self._add_entry(bentry, entry)
+                retrievals.append(asyncio.ensure_future(
+                    self._retrieve_batch([entry for (_, entry) in batch])))
+        except DuplicateKeyError as e:
+            for retrieval in retrievals:
+                retrieval.cancel()
+            LOGGER.error("ERROR! {}".format(e))
+            sys.exit(-1)
+        finally:
+            await parser
+
+        await asyncio.gather(*retrievals)
+        await self._evaluate(list(self._entries.values()))
+
+    async def _retrieve_batch(self, entries):
+        self._unify(entries)
+        await self._find_dois(entries)
+        await self._retrieve(entries)
+
+    async def _evaluate(self, entries, lock=None):
         LOGGER.info("Calculating differences")
-        self._diff()
+        self._diff(entries)
         LOGGER.info("Running consistency checks")
-        await self._check_consistency()
+        if lock:
+            async with lock:
+                await self._check_consistency(entries)
+        else:
+            await self._check_consistency(entries)
         # TODO Retrieval Errors should be part of the HTML output
 
         self._filter_diffs()
         self._filter_problems()
 
-        LOGGER.info("Writing output")
-        self._output()
-        LOGGER.info("Done.")
+    async def _recheck(self):
+        try:
+            raw_entries = self._read_bibtex()
+        except DuplicateKeyError as e:
+            LOGGER.error("ERROR! {}".format(e))
+            return
+        except Exception as e:
+            # The file may be saved in the middle of an edit. Keep the
+            # previous results until it can be parsed again.
+            LOGGER.error("ERROR! Could not parse {}: {}".format(
+                self._fname, e))
+            return
+
+        changed = changed_keys(self._raw_entries, raw_entries)
+        stale = changed | (set(self._raw_entries.keys()) -
+                           set(raw_entries.keys()))
+
+        self._drop_results(stale)
+        if self._warm_global_checks:
+            for CChecker in CCHECKERS:
+                if hasattr(CChecker, 'forget'):
+                    await CChecker.forget(stale)
+
+        entries = self._entries
+        self._raw_entries = {}
+        self._entries = {}
+        for (key, bentry) in raw_entries.items():
+            if key in changed:
+                self._add_entry(bentry, Entry(bentry, self._ui))
+            else:
+                self._raw_entries[key] = bentry
+                self._entries[key] = entries[key]
+
+        LOGGER.info("{} entries changed".format(len(changed)))
+        if self._index is not None:
+            for key in changed:
+                segment = self._index.get_segment(key)
+                LOGGER.debug("Entry {} (lines {}-{}) changed".format(
+                    key, segment.first_line, segment.last_line))
+        await self._process([self._entries[key] for key in changed])
+
+    def _get_changed_entries(self, rev):
+        old_text = git_show(self._fname, rev)
+        if old_text is None:
+            LOGGER.info("{} did not exist in {}, checking all entries"
+                        .format(self._fname, rev))
+            return list(self._entries.values())
+
+        changed = changed_keys(read_bibtex(None, text=old_text),
+                               self._raw_entries)
+        LOGGER.info("{} of {} entries changed since {}".format(
+            len(changed), len(self._entries), rev))
+
+        # Keep the order of the file
+        return [entry for (key, entry) in self._entries.items()
+                if key in changed]
+
+    def _select_shard(self):
+        (index, count) = self._shard
+        # Shards are merged in the order of the input file
+        self._positions = {key: i for (i, key)
+                           in enumerate(self._entries.keys())}
+        self._raw_entries = {key: bentry for (key, bentry)
+                             in self._raw_entries.items()
+                             if shard_of(key, count) == index}
+        self._entries = {key: entry for (key, entry) in self._entries.items()
+                         if key in self._raw_entries}
+        LOGGER.info("Shard {}/{} contains {} entries".format(
+            index, count, len(self._entries)))
+
+    async def _output_shard(self):
+        global_state = {}
+        for CChecker in CCHECKERS:
+            if hasattr(CChecker, 'export_state'):
+                global_state[CChecker.NAME] = await CChecker.export_state()
+
+        data = {
+            'shard': list(self._shard),
+            'input_file': self._fname,
+            'entries': [(self._positions[key], bentry) for (key, bentry)
+                        in self._raw_entries.items()],
+            'diffs': [(diff.entry_id, diff.source, diff.field,
+                       diff.suggestion) for diff in self._diffs],
+            'problems': [(prob.entry_id, prob.source, prob.problem_type,
+                          prob.message, prob.details)
+                         for prob in self._problems],
+            'global_state': global_state
+        }
+
+        with open(self._out_filename, 'w') as outfile:
+            json.dump(data, outfile)
+
+    def _drop_results(self, entry_ids):
+        for entry_id in entry_ids:
+            self._suggestions.pop(entry_id, None)
+            self._retrieval_errors.pop(entry_id, None)
+            self._entry_hashes.pop(entry_id, None)
+
+        self._diffs = [diff for diff in self._diffs
+                       if diff.entry_id not in entry_ids]
+        self._problems = [prob for prob in self._problems
+                          if prob.entry_id not in entry_ids]
 
     def _filter_diffs(self):
         filtered_diffs = [diff for diff in self._diffs
@@ -71,10 +400,13 @@ class Checker(object):
 
         self._problems = filtered_probs
 
+    def get_output(self, output_class=HTMLOutput):
+        return output_class(list(self._entries.values()), self._diffs,
+                            self._problems, self._global_problems,
+                            self._fname)
+
     def _output(self):
-        html_out = HTMLOutput(list(self._entries.values()), self._diffs,
-                              self._problems, self._global_problems,
-                              self._fname)
+        html_out = self.get_output(HTMLOutput)
         html_out.write(self._out_filename)
 
     def _print_retrieval_errors(self):
@@ -82,27 +414,53 @@ class Checker(object):
         LOGGER.warn("##    Errors occurred during retrieval    ##")
         LOGGER.warn("############################################")
 
-        for p in self._retrieval_errors:
-            LOGGER.warn("main", " - {}".format(p))
+        for errors in self._retrieval_errors.values():
+            for p in errors:
+                LOGGER.warn("main", " - {}".format(p))
 
-    def _diff(self):
-        for (_, entry) in self._entries.items():
+    def _diff(self, entries=None):
+        if entries is None:
+            entries = self._entries.values()
+
+        for entry in entries:
             d = Differ(entry)
             for s in self._suggestions.get(entry.get_id(), []):
                 self._diffs.extend(d.diff(s))
 
-    async def _check_consistency(self):
+    async def _check_consistency(self, entries=None):
+        if entries is None:
+            entries = self._entries.values()
+
         tasks = []
         task_info = []
         for CChecker in CCHECKERS:
-            if hasattr(CChecker, 'reset'):
+            if hasattr(CChecker, 'reset') and not self._warm_global_checks:
                 await CChecker.reset()
 
         for CChecker in CCHECKERS:
-            for entry in self._entries.values():
+            # Checkers collecting data for global checks must see all
+            # entries, unless they still have the data of all unchanged
+            # entries
+            if hasattr(CChecker, 'complete') and \
+               not self._warm_global_checks:
+                checked_entries = self._entries.values()
+            else:
+                checked_entries = entries
+
+            for entry in checked_entries:
                 ccheck = CChecker()
                 if self._cfg.get("check_{}".format(CChecker.NAME), entry, True):
-                    task = ccheck.check(entry)
+                    if hasattr(CChecker, 'complete'):
+                        # Must always run to collect its data
+                        task = ccheck.check(entry)
+                    elif entry.should_ignore_checker(CChecker):
+                        continue
+                    else:
+                        task = self._journaled(
+                            'check', CChecker.NAME, entry,
+                            partial(ccheck.check, entry),
+                            Checker._encode_problems,
+                            Checker._decode_problems)
                     task_info.append((CChecker, entry))
                     tasks.append(task)
 
@@ -113,18 +471,44 @@ class Checker(object):
                     Problem(entry.get_id(), CChecker.NAME, problem_type,
                             message, details))
 
-        for CChecker in CCHECKERS:
-            if hasattr(CChecker, 'complete'):
-                global_results = await CChecker.complete(self._ui)
-                for (problem_type, message, details) in global_results:
-                    self._global_problems.append(
-                        Problem(None, CChecker.NAME, problem_type,
-                                message, details))
+        self._global_problems = []
+        if self._shard:
+            # Global checks are run once all shards are merged
+            return
+
+        # Global checkers are independent of each other. The enabled ones
+        # share the worker processes.
+        global_checkers = [CChecker for CChecker in CCHECKERS
+                           if hasattr(CChecker, 'complete')]
+        enabled = [CChecker for CChecker in global_checkers
+                   if self._cfg.get("check_{}".format(CChecker.NAME), None,
+                                    True)]
+        with WorkerPool.shared_by(len(enabled)):
+            all_global_results = await asyncio.gather(
+                *(CChecker.complete(self._ui)
+                  for CChecker in global_checkers))
+        for (CChecker, global_results) in zip(global_checkers,
+                                              all_global_results):
+            for (problem_type, message, details) in global_results:
+                self._global_problems.append(
+                    Problem(None, CChecker.NAME, problem_type,
+                            message, details))
 
-    async def _find_dois(self):
-        cs = CrossrefSource(self._ui)
+    def _get_sources(self):
+        if self._sources is None:
+            self._sources = [SourceClass(self._ui) for SourceClass in SOURCES]
 
-        entry_order = (entry for entry in self._entries.values()
+        return self._sources
+
+    async def _find_dois(self, entries=None):
+        if entries is None:
+            entries = self._entries.values()
+
+        if self._doi_source is None:
+            self._doi_source = CrossrefSource(self._ui)
+        cs = self._doi_source
+
+        entry_order = (entry for entry in entries
                        if entry.get_doi() is None)
 
         # Filter out entries for which bibchex-nodoi is set.
@@ -133,7 +517,9 @@ class Checker(object):
 
         tasks = []
         for entry in entry_order:
-            task = cs.get_doi(entry)
+            task = self._journaled('doi', '', entry,
+                                   partial(cs.get_doi, entry),
+                                   Checker._encode_doi, Checker._decode_doi)
             tasks.append(task)
 
         results = await asyncio.gather(*tasks)
@@ -141,72 +527,338 @@ class Checker(object):
             if result:
                 entry.add_suggested_doi(result)
             if retrieval_error:
-                self._retrieval_errors.append(retrieval_error)
-
-    async def _retrieve(self):
-        entry_order = []
-        tasks = []
-        indices = []
-
-        for SourceClass in SOURCES:
-            #        for SourceClass in [ DataCiteSource ]:
-            source = SourceClass(self._ui)
-
-            i = 0
-            for entry in self._entries.values():
-                task = source.query(entry)
-                entry_order.append(entry)
-                tasks.append(task)
-                indices.append(i)
-                i += 1
-
-        results = await asyncio.gather(*tasks)
-        for (entry_index, raw_result) in zip(indices, results):
-            entry = entry_order[entry_index]
-
-            if not isinstance(raw_result, list):
-                raw_result = [raw_result]
-
-            for (result, retrieval_error) in raw_result:
-                if result:
-                    # Unify all suggested data
-                    self._unifier.unify_suggestion(result)
-                    self._suggestions[entry.get_id()].append(result)
-                if retrieval_error:
-                    if isinstance(retrieval_error, list):
-                        self._retrieval_errors.extend(retrieval_error)
-                    else:
-                        self._retrieval_errors.append(retrieval_error)
-
-    def _unify(self):
-        for entry in self._entries.values():
+                self._retrieval_errors.setdefault(entry.get_id(), []) \
+                                      .append(retrieval_error)
+
+    async def _retrieve(self, entries=None):
+        if entries is None:
+            entries = self._entries.values()
+
+        # Sources are queried in tiers of equal cost, cheapest first
+        costs = self._cfg.get('source_costs', None, {})
+        tiers = {}
+        for source in self._get_sources():
+            cost = costs.get(source.NAME, source.COST)
+            tiers.setdefault(cost, []).append(source)
+        tiers = [tiers[cost] for cost in sorted(tiers.keys())]
+
+        await asyncio.gather(*(self._retrieve_entry(entry, tiers)
+                               for entry in entries))
+
+    async def _retrieve_entry(self, entry, tiers):
+        stop_when_covered = self._cfg.get('stop_when_covered', entry, True)
+
+        for tier in tiers:
+            tasks = []
+            for source in tier:
+                if not source.applies_to(entry) or \
+                   not self._cfg.get("query_{}".format(source.NAME), entry,
+                                     True):
+                    continue
+                # Everything this source would find is ignored anyway
+                if all((entry.should_ignore_source(name)
+                        for name in source.SUGGESTION_SOURCES)):
+                    continue
+
+                tasks.append(self._journaled(
+                    'retrieve', source.NAME, entry,
+                    partial(source.query, entry),
+                    Checker._encode_retrieval,
+                    partial(Checker._decode_retrieval, entry)))
+
+            for raw_result in await asyncio.gather(*tasks):
+                self._add_retrieval_result(entry, raw_result)
+
+            if stop_when_covered and self._is_covered(entry):
+                return
+
+    def _add_retrieval_result(self, entry, raw_result):
+        if not isinstance(raw_result, list):
+            raw_result = [raw_result]
+
+        compared_fields = None
+        for (result, retrieval_error) in raw_result:
+            if result:
+                # Unify the suggested data that will be compared
+                if compared_fields is None:
+                    compared_fields = Differ(entry).compared_fields()
+                self._unifier.unify_suggestion(result, compared_fields)
+                self._suggestions[entry.get_id()].append(result)
+            if retrieval_error:
+                errors = self._retrieval_errors.setdefault(entry.get_id(), [])
+                if isinstance(retrieval_error, list):
+                    errors.extend(retrieval_error)
+                else:
+                    errors.append(retrieval_error)
+
+    def _is_covered(self, entry):
+        """Returns whether every wanted field that applies to the entry is
+        covered by sufficiently many retrieved suggestions that agree on its
+        value. Then, querying further sources is not necessary. The fields
+        that apply are those the entry has and those required for its type.
+        A required field that the entry lacks is uncovered until the
+        retrieved suggestions supply it."""
+        required = self._cfg.get('sources_required_agreement', entry, 1)
+        present = set(entry.data.keys())
+        if entry.authors:
+            present.add('author')
+        if entry.editors:
+            present.add('editor')
+        applicable = present | set((field.lower() for field
+                                    in self._cfg.get('required', entry, [])))
+        wanted = (set(self._cfg.get('wanted', entry, [])) & applicable) - \
+            set(self._cfg.get('forbidden', entry, []))
+        retrieved = [s for s in self._suggestions[entry.get_id()]
+                     if s.source != 'unifier']
+
+        for field in wanted:
+            if field in ('author', 'editor'):
+                counts = Counter((tuple(getattr(s, field + 's'))
+                                  for s in retrieved
+                                  if getattr(s, field + 's')))
+            else:
+                counts = Counter((crush_spaces(unify_hyphens(d)).lower()
+                                  for s in retrieved
+                                  for d in set((d for (d, _)
+                                                in s.data.get(field, [])))))
+
+            if not counts or max(counts.values()) < required:
+                return False
+
+        return True
+
+    async def _journaled(self, stage, name, entry, make_coroutine,
+                         encode, decode):
+        """Runs the coroutine created by *make_coroutine* and records its
+        (encoded) result in the journal. If a result is already recorded,
+        the decoded result is returned instead. *encode* may return None
+        for results that should not be recorded, e.g. failed retrievals."""
+        if self._journal is None:
+            return await make_coroutine()
+
+        entry_hash = self._entry_hashes[entry.get_id()]
+        data = self._journal.get(stage, name, entry.get_id(), entry_hash)
+        if data is not None:
+            return decode(data)
+
+        result = await make_coroutine()
+        data = encode(result)
+        if data is not None:
+            self._journal.record(stage, name, entry.get_id(), entry_hash,
+                                 data)
+        return result
+
+    @staticmethod
+    def _encode_doi(result):
+        (doi, retrieval_error) = result
+        if retrieval_error:
+            return None
+        return {'doi': doi}
+
+    @staticmethod
+    def _decode_doi(data):
+        return (data['doi'], None)
+
+    @staticmethod
+    def _encode_retrieval(raw_result):
+        if not isinstance(raw_result, list):
+            raw_result = [raw_result]
+
+        if any((retrieval_error for (_, retrieval_error) in raw_result)):
+            return None
+
+        return {'suggestions': [result.to_dict()
+                                for (result, _) in raw_result if result]}
+
+    @staticmethod
+    def _decode_retrieval(entry, data):
+        return [(Suggestion.from_dict(d, entry), None)
+                for d in data['suggestions']]
+
+    @staticmethod
+    def _encode_problems(problems):
+        return {'problems': problems}
+
+    @staticmethod
+    def _decode_problems(data):
+        return [tuple(problem) for problem in data['problems']]
+
+    def _unify(self, entries=None):
+        if entries is None:
+            entries = self._entries.values()
+
+        for entry in entries:
             assert entry.get_id() not in self._suggestions
             self._suggestions[entry.get_id()] = [
                 self._unifier.unify_entry(entry)
             ]
                         
+    def _read_bibtex(self):
+        if self._index is None:
+            return read_bibtex(self._fname, self._text)
+
+        parsed = self._index.update()
+        LOGGER.debug("Parsed {} changed parts of the input".format(parsed))
+        return _by_key(self._index.get_entries())
+
+    def _keeps_raw_entries(self):
+        # Watch mode compares the entry dicts to find the changed entries,
+        # shards write them out, and --changed-since compares them to an
+        # older revision. Otherwise, only the Entry objects are kept.
+        return self._index is not None or self._shard is not None or \
+            self._changed_since is not None
+
+    def _add_entry(self, bentry, entry):
+        key = entry.get_id()
+        self._entries[key] = entry
+        if self._keeps_raw_entries():
+            self._raw_entries[key] = bentry
+        if self._journal is not None:
+            self._entry_hashes[key] = _hash_bentry(bentry)
+
+    def _load_entries(self, raw_entries=None):
+        if raw_entries is None:
+            raw_entries = self._read_bibtex()
+        self._raw_entries = {}
+        self._entries = {}
+        for bentry in raw_entries.values():
+            self._add_entry(bentry, Entry(bentry, self._ui))
+
     def _parse(self):
-        with open(self._fname) as bibtex_file:
-            parser = bibtexparser.bparser.BibTexParser(
-                common_strings=True)
-            # TODO how much of my own magic ist still necessary here?
-#            parser.customization = bibtexparser.customization.\
-#                homogenize_latex_encoding
-            self._bibtex_data = parser.parse_file(bibtex_file)
-        entry_list = [Entry(bentry, self._ui)
-                      for bentry in self._bibtex_data.entries]
-        entry_keys = set((entry.get_id() for entry in entry_list))
-        if len(entry_keys) != len(entry_list):
-            LOGGER.error("ERROR! Duplicate keys detected!")
+        try:
+            self._load_entries()
+        except DuplicateKeyError as e:
+            LOGGER.error("ERROR! {}".format(e))
             sys.exit(-1)
 
-        self._entries = {entry.get_id(): entry for entry in entry_list}
+    async def _parse_parallel(self):
+        """Like _parse(), but parses chunks of the input and creates their
+        entries on a pool of worker processes."""
+        if self._text is not None:
+            text = self._text
+        else:
+            with open(self._fname) as bibtex_file:
+                text = bibtex_file.read()
+
+        # Small inputs are parsed by the thread pool instead
+        # The workers do not know the configuration
+        backend = self._cfg.get('parser_backend', None, 'bibtexparser')
+        # The entry dicts are only sent back if they are needed
+        keep_raw = self._keeps_raw_entries() or self._journal is not None
+        async with WorkerPool((backend, keep_raw), len(text),
+                              min_process_work=100000) as pool:
+            # More chunks than workers balance the load
+            jobs = split_for_parallel(text, 4 * pool.get_worker_count())
+            results = await pool.map(parse_entries, jobs)
+
+        self._raw_entries = {}
+        self._entries = {}
+        for (bentry, entry) in (result for chunk in results
+                                for result in chunk):
+            if entry.get_id() in self._entries:
+                LOGGER.error("ERROR! Duplicate keys detected!")
+                sys.exit(-1)
+            self._add_entry(bentry, entry)
+
+
+class MultiChecker(object):
+    """Checks multiple BibTeX files in one run, writing one report per file.
+
+    Entries describing the same work (see Entry.get_fingerprint) in
+    different files are only searched for a DOI once, and data is only
+    retrieved once per DOI, URL or ISBN. The retrieved suggestions are then
+    diffed against every copy of the entry.
+
+    Files are parsed in parallel processes. The checks run file by file,
+    since the global checkers keep their state on the class; they use the
+    worker processes themselves."""
 
+    def __init__(self, filenames, out_filenames, sources=None,
+                 doi_source=None):
+        self._ui = UI()
+        self._cfg = Config()
+
+        # Results are cached by the identifiers each source's query depends
+        # on. Copies of a work share their (suggested) DOIs, so the DOI based
+        # sources query them once. Queries by URL or ISBN are only shared if
+        # the copies agree on the URL or ISBN.
+        if sources is None:
+            sources = [SourceClass(self._ui) for SourceClass in SOURCES]
+        self._sources = [CachedSource(source) for source in sources]
+        if doi_source is None:
+            doi_source = CrossrefSource(self._ui)
+
+        self._checkers = [Checker(filename, out_filename,
+                                  sources=self._sources,
+                                  doi_source=doi_source)
+                          for (filename, out_filename)
+                          in zip(filenames, out_filenames)]
+
+    async def run(self):
+        LOGGER.info("Parsing BibTeX")
+        await self._parse()
+
+        LOGGER.info("Applying unification rules")
+        for c in self._checkers:
+            c._unify()
+
+        LOGGER.info("Retrieving missing DOIs")
+        await self._find_dois()
+
+        LOGGER.info("Retrieving metadata")
+        await asyncio.gather(*(c._retrieve() for c in self._checkers))
+
+        for c in self._checkers:
+            LOGGER.info("Checking {}".format(c._fname))
+            c._diff()
+            await c._check_consistency()
+            c._filter_diffs()
+            c._filter_problems()
+            c._output()
+
+        LOGGER.info("Done.")
+
+    async def close(self):
+        for source in self._sources:
+            await source.close()
+
+    async def _parse(self):
+        loop = asyncio.get_event_loop()
+        with concurrent.futures.ProcessPoolExecutor() as pool:
+            tasks = [loop.run_in_executor(pool, read_bibtex, c._fname)
+                     for c in self._checkers]
+            try:
+                results = await asyncio.gather(*tasks)
+            except DuplicateKeyError as e:
+                LOGGER.error("ERROR! {}".format(e))
+                sys.exit(-1)
 
-if __name__ == '__main__':
-    loop = asyncio.get_event_loop()
-    # TODO this is a very large number of threads. Maybe check instead how many
-    # are currently sleeping, and scale up only if too many are sleeping?
-    loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(1000))
-    c = Checker(sys.argv[1], sys.argv[2])
-    loop.run_until_complete(c.run())
+        for (c, raw_entries) in zip(self._checkers, results):
+            c._load_entries(raw_entries)
+
+    async def _find_dois(self):
+        groups = {}
+        unique = []
+        for c in self._checkers:
+            for entry in c._entries.values():
+                if entry.get_doi() is not None:
+                    continue
+                fingerprint = entry.get_fingerprint()
+                if fingerprint is None:
+                    unique.append((c, entry))
+                else:
+                    groups.setdefault(fingerprint, []).append((c, entry))
+
+        searched = unique + [group[0] for group in groups.values()]
+        by_checker = {}
+        for (c, entry) in searched:
+            by_checker.setdefault(c, []).append(entry)
+
+        await asyncio.gather(*(c._find_dois(entries)
+                               for (c, entries) in by_checker.items()))
+
+        for group in groups.values():
+            (_, searched_entry) = group[0]
+            for (_, entry) in group[1:]:
+                for doi in searched_entry.get_suggested_dois():
+                    entry.add_suggested_doi(doi)
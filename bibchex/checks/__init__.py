@@ -3,6 +3,7 @@ from .authors import *
 from .title import *
 from .publication import *
 from .isbn import *
+from .duplicates import *
 
 CCHECKERS = [LastNameInitialChecker, AllcapsNameChecker,
              FirstNameInitialChecker, MiddleNameInitialChecker,
@@ -15,4 +16,5 @@ CCHECKERS = [LastNameInitialChecker, AllcapsNameChecker,
              JournalMutualAbbrevChecker, PublisherMutualAbbrevChecker,
              JournalSimilarityChecker, PublisherSimilarityChecker,
              HasTitleChecker, TitleCapitalizationChecker,
-             BooktitleFormatChecker, JournalFormatChecker]
+             BooktitleFormatChecker, JournalFormatChecker,
+             DuplicateEntryChecker]
@@ -55,6 +55,8 @@ class DOIURLChecker(object):
 
 class DeadURLChecker(object):
     NAME = "dead_url"
+    # Needs to access the network
+    NETWORK = True
 
     def __init__(self):
         self._cfg = Config()
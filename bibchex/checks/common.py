@@ -1,4 +1,3 @@
-import os
 import asyncio
 import re
 import logging
@@ -6,14 +5,69 @@ import logging
 from fuzzywuzzy import fuzz
 
 from bibchex.config import Config
-from bibchex.strutil import AbbrevFinder
-from bibchex.util import chunked_pairs
+from bibchex.strutil import AbbrevFinder, PartialRatioCandidates
+from bibchex.parallel import WorkerPool
 
 LOGGER = logging.getLogger(__name__)
 
 
+class DistinctValueCache(object):
+    """Caches the results of a check that only depends on some values of an
+    entry and its effective configuration. Since the same values (e.g.,
+    journal names or authors) occur in many entries, the check is evaluated
+    once per distinct key and the result is shared by all entries."""
+
+    SIZE = 100000
+
+    def __init__(self):
+        self._results = {}
+
+    def get(self, key, compute):
+        """Returns the (list) result of compute() for *key*."""
+        result = self._results.get(key)
+        if result is None:
+            result = tuple(compute())
+            if len(self._results) >= DistinctValueCache.SIZE:
+                self._results.clear()
+            self._results[key] = result
+
+        return list(result)
+
+
+class GenericPersonChecker(object):
+    """Base class for checks on the individual authors and editors of
+    entries. Subclasses implement check_person(name, first, last, config),
+    which returns the list of problems of one person ("Author" or "Editor"
+    as *name*). It is evaluated once per distinct person and configuration
+    (see person_config())."""
+
+    CACHE = DistinctValueCache()
+
+    def __init__(self):
+        self._cfg = Config()
+
+    def person_config(self, entry):
+        """Returns the (hashable) configuration check_person() depends on."""
+        return None
+
+    async def check(self, entry):
+        authors = await self.check_one("authors", "Author", entry)
+        editors = await self.check_one("editors", "Editor", entry)
+        return authors + editors
+
+    async def check_one(self, field, name, entry):
+        config = self.person_config(entry)
+        problems = []
+        for (first, last) in getattr(entry, field):
+            problems.extend(GenericPersonChecker.CACHE.get(
+                (type(self).NAME, name, first, last, config),
+                lambda: self.check_person(name, first, last, config)))
+        return problems
+
+
 class GenericStringFormatChecker(object):
     PROVIDE_FIELDS = ['year', 'date']
+    CACHE = DistinctValueCache()
 
     def __init__(self):
         self._cfg = Config()
@@ -22,7 +76,6 @@ class GenericStringFormatChecker(object):
         self._cls = type(self)
 
     async def check(self, entry):
-        problems = []
         formats = self._cfg.get(self._cls.FORMAT_FIELD, entry)
         field_data = entry.data.get(self._field)
 
@@ -33,12 +86,18 @@ class GenericStringFormatChecker(object):
                       for field in
                       GenericStringFormatChecker.PROVIDE_FIELDS}
 
-        # special 'short year'
-        entry_data['short_year'] = entry_data['year'][-2:]
-
         if not isinstance(formats, list):
             formats = [formats]
 
+        key = (self._name, field_data, tuple(formats),
+               tuple(entry_data.values()))
+        return GenericStringFormatChecker.CACHE.get(
+            key, lambda: self._check_format(field_data, formats, entry_data))
+
+    def _check_format(self, field_data, formats, entry_data):
+        # special 'short year'
+        entry_data['short_year'] = entry_data['year'][-2:]
+
         for form in formats:
             re_str = form.format(**entry_data)
             m = re.match(re_str, field_data)
@@ -51,6 +110,8 @@ class GenericStringFormatChecker(object):
 
 
 class GenericFuzzySimilarityChecker(object):
+    # Maps checker names to dicts mapping entry IDs to the (name,
+    # normalized name) tuples seen in the entry
     SEEN_NAMES = {}
     NUMBER_RE = re.compile(r'\d+\S*')
 
@@ -60,70 +121,76 @@ class GenericFuzzySimilarityChecker(object):
         self._cls = type(self)
 
         if self._name not in GenericFuzzySimilarityChecker.SEEN_NAMES:
-            GenericFuzzySimilarityChecker.SEEN_NAMES[self._name] = set()
+            GenericFuzzySimilarityChecker.SEEN_NAMES[self._name] = {}
 
     def _normalize_name(self, name):
         name = GenericFuzzySimilarityChecker.NUMBER_RE.sub('', name)
         return name.strip()
 
     async def check(self, entry):
+        names = []
         for field in self._cls.FIELDS:
             val = entry.data.get(field)
             if not val:
                 continue
-            GenericFuzzySimilarityChecker.SEEN_NAMES[self._name]\
-                                         .add((val, self._normalize_name(val)))
+            names.append((val, self._normalize_name(val)))
+        GenericFuzzySimilarityChecker.SEEN_NAMES[self._name][
+            entry.get_id()] = tuple(names)
 
         return []
 
     @ classmethod
     async def reset(cls):
-        GenericFuzzySimilarityChecker.SEEN_NAMES[cls.NAME] = set()
+        GenericFuzzySimilarityChecker.SEEN_NAMES[cls.NAME] = {}
+
+    @ classmethod
+    async def forget(cls, entry_ids):
+        seen = GenericFuzzySimilarityChecker.SEEN_NAMES.get(cls.NAME, {})
+        for entry_id in entry_ids:
+            seen.pop(entry_id, None)
+
+    @ classmethod
+    async def export_state(cls):
+        return sorted(GenericFuzzySimilarityChecker.SEEN_NAMES
+                      .get(cls.NAME, {}).items())
+
+    @ classmethod
+    async def import_state(cls, state):
+        GenericFuzzySimilarityChecker.SEEN_NAMES.setdefault(cls.NAME, {})\
+            .update(((entry_id, tuple((tuple(names) for names in seen)))
+                     for (entry_id, seen) in state))
 
     @ classmethod
     async def complete(cls, ui):
-        cfg = Config()
-
-        def compute(seen_names, chunk_count, chunk_number):
-            problems = []
-            # nn1/nn2 are the normalized forms of the names
-            for ((n1, nn1), (n2, nn2)) in chunked_pairs(
-                    list(seen_names), chunk_count, chunk_number):
-                if (nn1 == nn2):
-                    continue
-
-                if fuzz.partial_ratio(nn1, nn2) > 90:  # TODO make configurable
-                    problems.append((name,
-                                     "{} names '{}' and '{}' seem very similar."
-                                     .format(cls.MSG_NAME, n1, n2),
-                                     ""))
-            return problems
+        threshold = 90  # TODO make configurable
 
         name = cls.NAME
-        item_count = len(GenericFuzzySimilarityChecker.SEEN_NAMES[name])
+        seen_names = sorted(set(
+            (names for seen in GenericFuzzySimilarityChecker.SEEN_NAMES
+             .get(name, {}).values() for names in seen)))
         LOGGER.info((f"Fuzzy-checking pairwise similarity "
-                     f"of {cls.MSG_NAME}s. Testing "
-                     f"{item_count*(item_count - 1) / 2 - item_count} pairs. "
-                     "This might take a while."))
-
-        collected_problems = []
-        chunk_count = min(len(os.sched_getaffinity(0)) * 10,
-                          len(GenericFuzzySimilarityChecker.SEEN_NAMES[name]))
-        tasks = []
-        for i in range(0, chunk_count):
-            tasks.append(
-                asyncio.get_event_loop().run_in_executor(
-                    cfg.get_executor(),
-                    compute, GenericFuzzySimilarityChecker.SEEN_NAMES[name],
-                    chunk_count, i))
+                     f"of {len(seen_names)} {cls.MSG_NAME}s."))
 
-        collected_results = await asyncio.gather(*tasks)
+        async with WorkerPool((seen_names, threshold), len(seen_names),
+                              min_process_work=1000,
+                              prepare=_prepare_similarity) as pool:
+            chunk_count = min(pool.get_worker_count() * 10, len(seen_names))
+            # Interleave the rows to balance the chunks
+            collected_results = await pool.map(
+                _find_similar_names,
+                [(range(i, len(seen_names), chunk_count), name, cls.MSG_NAME)
+                 for i in range(0, chunk_count)])
 
-        # Flatten lists
-        return [item for sublist in collected_results for item in sublist]
+        # Pairs of names of equal length may be found twice. Report them in
+        # the order in which all pairs used to be tested.
+        problems = dict((item for sublist in collected_results
+                         for item in sublist))
+        return [problems[pair] for pair in sorted(problems.keys())]
 
 
 class GenericAbbrevChecker(object):
+    # Maps checker names to dicts mapping entry IDs to the names seen in
+    # the entry
     SEEN_NAMES = {}
 
     def __init__(self):
@@ -132,30 +199,97 @@ class GenericAbbrevChecker(object):
         self._cls = type(self)
 
         if self._name not in GenericAbbrevChecker.SEEN_NAMES:
-            GenericAbbrevChecker.SEEN_NAMES[self._name] = set()
+            GenericAbbrevChecker.SEEN_NAMES[self._name] = {}
 
     async def check(self, entry):
-        for field in self._cls.FIELDS:
-            val = entry.data.get(field)
-            if not val:
-                continue
-            GenericAbbrevChecker.SEEN_NAMES[self._name].add(val)
+        GenericAbbrevChecker.SEEN_NAMES[self._name][entry.get_id()] = tuple(
+            (entry.data.get(field) for field in self._cls.FIELDS
+             if entry.data.get(field)))
 
         return []
 
     @ classmethod
     async def reset(cls):
-        GenericAbbrevChecker.SEEN_NAMES[cls.NAME] = set()
+        GenericAbbrevChecker.SEEN_NAMES[cls.NAME] = {}
+
+    @ classmethod
+    async def forget(cls, entry_ids):
+        seen = GenericAbbrevChecker.SEEN_NAMES.get(cls.NAME, {})
+        for entry_id in entry_ids:
+            seen.pop(entry_id, None)
+
+    @ classmethod
+    async def export_state(cls):
+        return sorted(GenericAbbrevChecker.SEEN_NAMES.get(cls.NAME, {})
+                      .items())
+
+    @ classmethod
+    async def import_state(cls, state):
+        GenericAbbrevChecker.SEEN_NAMES.setdefault(cls.NAME, {})\
+            .update(((entry_id, tuple(seen)) for (entry_id, seen) in state))
 
     @ classmethod
     async def complete(cls, ui):
         name = cls.NAME
         problems = []
 
-        af = AbbrevFinder(GenericAbbrevChecker.SEEN_NAMES[name])
-        for (s1, s2) in af.get():
+        # Keep our iteration order, workers hash strings differently
+        seen_names = sorted(set(
+            (val for seen in GenericAbbrevChecker.SEEN_NAMES.get(name, {})
+             .values() for val in seen)))
+        # With the index, a few thousand names are searched faster than the
+        # worker processes are started
+        async with WorkerPool(seen_names, len(seen_names),
+                              min_process_work=5000,
+                              prepare=_prepare_abbrevs) as pool:
+            chunk_count = min(pool.get_worker_count() * 10, len(seen_names))
+            # Interleave the rows to balance the chunks
+            collected_results = await pool.map(
+                _find_abbrevs,
+                [range(i, len(seen_names), chunk_count)
+                 for i in range(0, chunk_count)])
+
+        # Report the pairs in the order of the names
+        pairs = sorted((item for sublist in collected_results
+                        for item in sublist), key=lambda item: item[0])
+        for (_, (s1, s2)) in pairs:
             problems.append((name,
                              "{} '{}' could be an abbreviation of '{}'."
                              .format(cls.MSG_NAME, s1, s2),
                              ""))
         return problems
+
+
+def _prepare_similarity(data):
+    (seen_names, threshold) = data
+    # Only pairs that can possibly be similar enough are compared
+    candidates = PartialRatioCandidates([nn for (_, nn) in seen_names],
+                                        threshold)
+    return (seen_names, threshold, candidates)
+
+
+def _find_similar_names(data, args):
+    (seen_names, threshold, candidates) = data
+    (rows, name, msg_name) = args
+    problems = []
+    # nn1/nn2 are the normalized forms of the names
+    for (i, j) in candidates.get(rows):
+        ((n1, nn1), (n2, nn2)) = (seen_names[i], seen_names[j])
+        if (nn1 == nn2):
+            continue
+
+        if fuzz.partial_ratio(nn1, nn2) > threshold:
+            problems.append(((i, j),
+                             (name,
+                              "{} names '{}' and '{}' seem very similar."
+                              .format(msg_name, n1, n2),
+                              "")))
+    return problems
+
+
+def _prepare_abbrevs(seen_names):
+    return AbbrevFinder(seen_names)
+
+
+def _find_abbrevs(finder, rows):
+    return [(i, pair) for i in rows for pair in finder.get((i,))]
@@ -0,0 +1,182 @@
+from array import array
+import asyncio
+import hashlib
+import itertools
+import random
+import re
+
+from fuzzywuzzy import fuzz
+
+from bibchex.config import Config
+from bibchex.parallel import WorkerPool
+from bibchex.util import unlatexify
+
+# Use fixed masks, so that the result does not change between runs
+_MASK_RNG = random.Random(0)
+
+
+class DuplicateEntryChecker(object):
+    """Finds entries that describe the same publication under different keys.
+
+    Every entry is described by the set of its shingles, which are the word
+    bigrams of its normalized title plus one shingle for the last names of
+    its authors. (One shingle per author would make prolific authors
+    dominate the signatures.) For every entry, a MinHash signature
+    approximating the Jaccard similarity of these sets is computed. Entries
+    are only compared if their signatures agree in at least one band
+    (locality-sensitive hashing). The candidates are found once, and then
+    confirmed by fuzzy matching of their titles and authors, in chunks on
+    the worker pool.
+
+    Entries that agree in a band form a bucket. Buckets with more than
+    ``duplicate_max_bucket_size`` entries are skipped, since all pairs of
+    their entries would be compared. Such buckets come from many entries
+    with the same short title and no authors."""
+
+    NAME = 'duplicate_entries'
+
+    SEEN_ENTRIES = []
+
+    NUM_HASHES = 32
+    BAND_SIZE = 2
+    MASKS = [_MASK_RNG.getrandbits(64) for _ in range(0, NUM_HASHES)]
+
+    NORMALIZE_RE = re.compile(r'[^\w\s]')
+
+    def __init__(self):
+        self._cfg = Config()
+
+    async def check(self, entry):
+        title = entry.data.get('title')
+        if not title:
+            return []
+
+        DuplicateEntryChecker.SEEN_ENTRIES.append(
+            (entry.get_id(), title, DuplicateEntryChecker._normalize(title),
+             [DuplicateEntryChecker._normalize(last)
+              for (_, last) in entry.authors]))
+
+        return []
+
+    @staticmethod
+    def _normalize(s):
+        s = DuplicateEntryChecker.NORMALIZE_RE.sub(' ', unlatexify(s))
+        return " ".join(s.lower().split())
+
+    @staticmethod
+    def _shingles(title, last_names):
+        words = title.split(" ")
+        shingles = set((" ".join(words[i:i + 2])
+                        for i in range(0, max(len(words) - 1, 1))))
+        if last_names:
+            shingles.add("authors:" + " ".join(sorted(last_names)))
+        return shingles
+
+    @staticmethod
+    def _signature(shingles):
+        hashes = [int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'),
+                                                 digest_size=8).digest(),
+                                 'little')
+                  for shingle in shingles]
+        return [min(map(mask.__xor__, hashes))
+                for mask in DuplicateEntryChecker.MASKS]
+
+    @ classmethod
+    async def reset(cls):
+        DuplicateEntryChecker.SEEN_ENTRIES = []
+
+    @ classmethod
+    async def forget(cls, entry_ids):
+        DuplicateEntryChecker.SEEN_ENTRIES = [
+            seen for seen in DuplicateEntryChecker.SEEN_ENTRIES
+            if seen[0] not in entry_ids]
+
+    @ classmethod
+    async def export_state(cls):
+        return DuplicateEntryChecker.SEEN_ENTRIES
+
+    @ classmethod
+    async def import_state(cls, state):
+        DuplicateEntryChecker.SEEN_ENTRIES.extend(
+            (tuple(seen) for seen in state))
+
+    @staticmethod
+    def _candidates(seen, max_bucket_size):
+        """Returns the sorted pairs (i, j) of indices into *seen* whose
+        signatures agree in some band."""
+        num_hashes = DuplicateEntryChecker.NUM_HASHES
+        signatures = array('Q')
+        for (_, _, title, last_names) in seen:
+            signatures.extend(DuplicateEntryChecker._signature(
+                DuplicateEntryChecker._shingles(title, last_names)))
+
+        # To save memory, the bands are processed one after the other,
+        # grouping the entries by sorting them by the hash of the band.
+        candidates = set()
+        band_size = DuplicateEntryChecker.BAND_SIZE
+        for start in range(0, num_hashes, band_size):
+            keys = [hash(tuple(signatures[offset:offset + band_size]))
+                    for offset in range(start, len(signatures), num_hashes)]
+            order = sorted(range(0, len(keys)), key=keys.__getitem__)
+
+            group_start = 0
+            for k in range(1, len(order) + 1):
+                if k < len(order) and \
+                   keys[order[k]] == keys[order[group_start]]:
+                    continue
+                if 1 < k - group_start <= max_bucket_size:
+                    group = sorted(order[group_start:k])
+                    candidates.update(itertools.combinations(group, 2))
+                group_start = k
+
+        return sorted(candidates)
+
+    @ classmethod
+    async def complete(cls, ui):
+        cfg = Config()
+        threshold = cfg.get('duplicate_threshold', None, 90)
+        max_bucket_size = cfg.get('duplicate_max_bucket_size', None, 100)
+        # Independent of the order in which the entries were checked
+        seen = sorted(DuplicateEntryChecker.SEEN_ENTRIES)
+        candidates = await asyncio.get_event_loop().run_in_executor(
+            cfg.get_executor(), DuplicateEntryChecker._candidates, seen,
+            max_bucket_size)
+
+        # Fuzzy matching takes a few microseconds per candidate, so only
+        # many candidates pay off starting the worker processes
+        async with WorkerPool((seen, threshold), len(candidates),
+                              min_process_work=100000) as pool:
+            chunk_count = pool.get_worker_count() * 10
+            collected_results = await pool.map(
+                _find_duplicates,
+                [candidates[k::chunk_count] for k in range(0, chunk_count)])
+
+        problems = sorted((item for sublist in collected_results
+                           for item in sublist))
+        return [problem for (_, problem) in problems]
+
+
+def _find_duplicates(data, candidates):
+    (seen, threshold) = data
+    problems = []
+    for (i, j) in candidates:
+        (id1, raw_title1, title1, last_names1) = seen[i]
+        (id2, raw_title2, title2, last_names2) = seen[j]
+        if id1 == id2:
+            continue
+
+        if fuzz.ratio(title1, title2) < threshold:
+            continue
+        if last_names1 and last_names2 and \
+           fuzz.token_sort_ratio(" ".join(last_names1),
+                                 " ".join(last_names2)) < threshold:
+            continue
+
+        problems.append(((i, j),
+                         (DuplicateEntryChecker.NAME,
+                          "Entries '{}' and '{}' seem to be duplicates."
+                          .format(id1, id2),
+                          "Their titles are '{}' and '{}'."
+                          .format(raw_title1, raw_title2))))
+
+    return problems
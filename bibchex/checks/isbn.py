@@ -5,6 +5,7 @@ from isbnlib import is_isbn10, is_isbn13, to_isbn10, to_isbn13, \
 
 class ValidISBNChecker(object):
     NAME = "isbn_valid"
+    PROBLEM_TYPES = ("invalid_isbn",)
 
     def __init__(self):
         self._cfg = Config()
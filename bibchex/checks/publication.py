@@ -1,29 +1,35 @@
 from bibchex.config import Config
 from bibchex.util import parse_datetime, contains_abbreviation
 from bibchex.checks.common import GenericFuzzySimilarityChecker,\
-    GenericAbbrevChecker, GenericStringFormatChecker
+    GenericAbbrevChecker, GenericStringFormatChecker, DistinctValueCache
 
 
 class JournalAbbrevChecker(object):
     NAME = 'journal_abbrev'
     FIELDS = ['booktitle', 'journal']
+    CACHE = DistinctValueCache()
 
     def __init__(self):
         self._cfg = Config()
 
     async def check(self, entry):
         problems = []
-        acceptable = set(self._cfg.get("acceptable_abbreviations", entry, []))
+        acceptable = tuple(self._cfg.get("acceptable_abbreviations", entry,
+                                         []))
         for field in JournalAbbrevChecker.FIELDS:
             val = entry.data.get(field, '')
-            if contains_abbreviation(val, acceptable=acceptable):
-                problems.append(
-                    (type(self).NAME,
-                     "Publication title '{}' seems to contain an abbreviation"
-                     .format(val), ""))
+            problems.extend(JournalAbbrevChecker.CACHE.get(
+                (val, acceptable), lambda: self._check_value(val, acceptable)))
 
         return problems
 
+    def _check_value(self, val, acceptable):
+        if contains_abbreviation(val, acceptable=set(acceptable)):
+            return [(type(self).NAME,
+                     "Publication title '{}' seems to contain an abbreviation"
+                     .format(val), "")]
+        return []
+
 
 class BooktitleFormatChecker(GenericStringFormatChecker):
     NAME = 'booktitle_format'
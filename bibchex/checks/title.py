@@ -26,7 +26,7 @@ class TitleCapitalizationChecker(object):
         self._cfg = Config()
 
     async def check(self, entry):
-        title = entry.raw_data.get('title', "")
+        title = entry.get_raw('title', "")
 
         tokens = tokenize_braces(title)
         unbraced_part = "".join(
@@ -3,6 +3,8 @@ import re
 import pkgutil
 import concurrent.futures
 import os
+from types import MappingProxyType
+import weakref
 
 
 class ConfigurationError(Exception):
@@ -16,6 +18,8 @@ class ConfigImpl(object):
         self._data = data
         self._sub_configs = []
         self._executor = None
+        self._views = {}
+        self._entry_views = weakref.WeakKeyDictionary()
 
         self._parse()
         self._init_executor(thread_count)
@@ -27,6 +31,7 @@ class ConfigImpl(object):
             else:
                 thread_count = len(os.sched_getaffinity(0))
 
+        self._thread_count = thread_count
         self._executor = concurrent.futures.ThreadPoolExecutor(thread_count)
 
     def _parse(self):
@@ -36,20 +41,66 @@ class ConfigImpl(object):
             self._sub_configs.append(
                 (select_field, re.compile(select_re), ConfigImpl(data)))
 
+        self._selector_fields = sorted(set(
+            [select_field for (select_field, _, _) in self._sub_configs] +
+            [field for (_, _, sub_cfg) in self._sub_configs
+             for field in sub_cfg._selector_fields]))
+
     def get_executor(self):
         return self._executor
 
+    def get_thread_count(self):
+        return self._thread_count
+
     def get(self, key, entry=None, default=None):
         if entry:
-            for (sel_field, sel_re, sub_cfg) in self._sub_configs:
-                if sel_field in entry.data and \
-                   sel_re.match(entry.data[sel_field]):
-                    subval = sub_cfg.get(key, entry=entry)
-                    if subval:
-                        return subval
+            return self.resolve(entry).get(key, default)
 
         return self._data.get(key, default)
 
+    def resolve(self, entry):
+        """Returns the effective configuration for *entry*, i.e., the
+        configuration with all matching sub-configs applied, as a read-only
+        mapping. The result is cached for the entry as long as none of the
+        fields that sub-configs select on change, and shared among all
+        entries that match the same sub-configs."""
+        selected = tuple((entry.data.get(field)
+                          for field in self._selector_fields))
+        cached = self._entry_views.get(entry)
+        if cached is not None and cached[0] == selected:
+            return cached[1]
+
+        signature = self._match(entry)
+        view = self._views.get(signature)
+        if view is None:
+            view = MappingProxyType(self._compile(signature))
+            self._views[signature] = view
+
+        self._entry_views[entry] = (selected, view)
+        return view
+
+    def _match(self, entry):
+        """Returns the (nested) tuple of the sub-configs matching *entry*."""
+        return tuple(((i, sub_cfg._match(entry))
+                      for (i, (sel_field, sel_re, sub_cfg))
+                      in enumerate(self._sub_configs)
+                      if sel_field in entry.data and
+                      sel_re.match(entry.data[sel_field])))
+
+    def _compile(self, signature):
+        resolved = {}
+        # Values of sub-configs only override if they are truthy. The first
+        # matching sub-config wins.
+        for (i, sub_signature) in reversed(signature):
+            sub_resolved = self._sub_configs[i][2]._compile(sub_signature)
+            resolved.update(((key, value) for (key, value)
+                             in sub_resolved.items() if value))
+        for (key, value) in self._data.items():
+            if key not in resolved:
+                resolved[key] = value
+
+        return resolved
+
 
 class Config(object):
     """Interface to access the JSON configuration"""
@@ -1,4 +1,7 @@
 import re
+import sys
+
+from isbnlib import canonical, to_isbn13
 
 from bibchex.util import unlatexify
 from bibchex.strutil import merge_lines, crush_spaces, split_at_multiple
@@ -11,6 +14,7 @@ FIELDS = ('ID', 'ENTRYTYPE', 'journal', 'comments', 'pages',
           'edition', 'organization')
 UNLATEXIFY_FIELDS = ('title', 'abstract', 'journal', 'booktitle', 'url', 'doi')
 BOOL_OPTIONS = ("nodoi",)
+FINGERPRINT_RE = re.compile(r'[\W_]+')
 
 
 def parse_bool(s):
@@ -18,6 +22,8 @@ def parse_bool(s):
 
 
 class Difference(object):
+    __slots__ = ('entry_id', 'source', 'field', 'suggestion')
+
     def __init__(self, entry_id, source, field, suggestion):
         self.entry_id = entry_id
         self.source = source
@@ -26,6 +32,8 @@ class Difference(object):
 
 
 class Problem(object):
+    __slots__ = ('entry_id', 'problem_type', 'source', 'message', 'details')
+
     def __init__(self, entry_id, source, problem_type, message, details):
         self.entry_id = entry_id
         self.problem_type = problem_type
@@ -37,32 +45,41 @@ class Problem(object):
 class Entry(object):
     DOI_RE = re.compile(r'https?://(dx\.)?doi.org/(?P<doi>.*)')
 
+    # The config caches the resolved config per entry in a weak dictionary
+    __slots__ = ('_id', 'data', 'raw_data', 'options', 'authors', 'editors',
+                 '_ignore_diffs', '_ignore_problems', '_deduced_doi',
+                 '_suggested_dois', '_ui', '__weakref__')
+
+    # Shared by all entries that do not ignore any problems
+    NO_IGNORED_PROBLEMS = frozenset()
+
     def __init__(self, bibtex_entry, ui):
-        self._bentry = bibtex_entry
+        # The bibtexparser entry is only needed while parsing and is not
+        # kept, to save memory.
         self._id = bibtex_entry['ID']
+        self._ui = ui
 
         self.data = {}
+        # The data of unlatexified fields before unlatexifying, only for
+        # fields where it differs. Use get_raw() to access it.
         self.raw_data = {}
         self.options = {}
-        self.authors = []
-        self.editors = []
 
-        self._ignore_diffs = {}
-        self._ignore_problems = set()
+        # None if the entry does not ignore any differences
+        self._ignore_diffs = None
+        self._ignore_problems = Entry.NO_IGNORED_PROBLEMS
 
         self._deduced_doi = None
         self._suggested_dois = []
 
-        self._parse()
-        self.authors = self._parse_people('author')
-        self.editors = self._parse_people('editor')
-        self._parse_options()
+        self._parse(bibtex_entry)
+        self.authors = self._parse_people(bibtex_entry, 'author')
+        self.editors = self._parse_people(bibtex_entry, 'editor')
+        self._parse_options(bibtex_entry)
         self._doi_from_url()
 
-        self._parse_ignore_diffs()
-        self._parse_ignore_problems()
-
-        self._ui = ui
+        self._parse_ignore_diffs(bibtex_entry)
+        self._parse_ignore_problems(bibtex_entry)
 
     def get_id(self):
         return self._id
@@ -84,6 +101,29 @@ class Entry(object):
 
         return None
 
+    def get_fingerprint(self):
+        """Returns a string that identifies the work this entry describes,
+        derived from the DOI, the ISBN or title and year (in this order).
+        Returns None if neither is available."""
+        doi = self.get_doi()
+        if doi:
+            return "doi:{}".format(doi.strip().lower())
+
+        isbn = canonical(self.data.get('isbn', ''))
+        if isbn:
+            return "isbn:{}".format(to_isbn13(isbn) or isbn)
+
+        title = FINGERPRINT_RE.sub('', self.data.get('title', '').lower())
+        if title:
+            return "title:{}:{}".format(title, self.data.get('year', ''))
+
+        return None
+
+    def get_raw(self, field, default=None):
+        """Returns the value of *field* as it is written in the BibTeX
+        file, i.e., before unlatexifying it."""
+        return self.raw_data.get(field, self.data.get(field, default))
+
     def get_suggested_dois(self):
         return self._suggested_dois
 
@@ -100,8 +140,8 @@ class Entry(object):
 
         self._deduced_doi = m.group('doi')
 
-    def _parse_options(self):
-        for k, v in self._bentry.items():
+    def _parse_options(self, bentry):
+        for k, v in bentry.items():
             if k[:len("bibchex-")] == "bibchex-":
                 if k in ("bibchex-ignore-diffs", "bibchex-ignore-problems"):
                     pass  # Handled separately
@@ -111,11 +151,12 @@ class Entry(object):
                 else:
                     self.options[option] = v
 
-    def _parse_ignore_diffs(self):
-        if 'bibchex-ignore-diffs' not in self._bentry:
+    def _parse_ignore_diffs(self, bentry):
+        if 'bibchex-ignore-diffs' not in bentry:
             return
 
-        ignores = self._bentry['bibchex-ignore-diffs'].split(';')
+        self._ignore_diffs = {}
+        ignores = bentry['bibchex-ignore-diffs'].split(';')
         for ignore in ignores:
             tokens = ignore.split('.')
             source = tokens[0].lower()
@@ -128,30 +169,47 @@ class Entry(object):
             else:
                 self._ignore_diffs[source].add("*")
 
-    def _parse_ignore_problems(self):
-        if 'bibchex-ignore-problems' not in self._bentry:
+    def _parse_ignore_problems(self, bentry):
+        if 'bibchex-ignore-problems' not in bentry:
             return
 
         self._ignore_problems = set(
             (ignore.lower() for ignore in
-             self._bentry['bibchex-ignore-problems'].split(';')))
+             bentry['bibchex-ignore-problems'].split(';')))
 
     def should_ignore_diff(self, source, field):
+        if self._ignore_diffs is None:
+            return False
         ignores = self._ignore_diffs.get(source.lower(), set())
         return field.lower().replace(" ", "") in ignores or "*" in ignores
 
+    def should_ignore_source(self, source):
+        """Returns whether all differences to the data from *source* are
+        ignored, in which case the source need not be queried at all."""
+        if self._ignore_diffs is None:
+            return False
+        return "*" in self._ignore_diffs.get(source.lower(), set())
+
     def should_ignore_problem(self, problem_type):
         return problem_type.lower() in self._ignore_problems
 
-    def _parse_people(self, fieldname):
+    def should_ignore_checker(self, checker_class):
+        """Returns whether all problems the given checker can raise are
+        ignored, in which case the checker need not be run."""
+        problem_types = getattr(checker_class, 'PROBLEM_TYPES',
+                                (checker_class.NAME,))
+        return all((self.should_ignore_problem(problem_type)
+                    for problem_type in problem_types))
+
+    def _parse_people(self, bentry, fieldname):
         # First, split the authors' names by 'and', which may not be
         # enclosed in braces
         # TODO check brace-enclosing
 
-        if fieldname not in self._bentry:
+        if fieldname not in bentry:
             return []
 
-        authors_raw = crush_spaces(merge_lines(self._bentry[fieldname]))
+        authors_raw = crush_spaces(merge_lines(bentry[fieldname]))
         authors_split = split_at_multiple(authors_raw, [' and ', ' AND '])
         result = []
 
@@ -192,23 +250,31 @@ class Entry(object):
                 continue
 
             result.append(
-                (unlatexify(first_name), unlatexify(last_name)))
+                (sys.intern(unlatexify(first_name)),
+                 sys.intern(unlatexify(last_name))))
         return result
 
-    def _parse(self):
-        for k, v in self._bentry.items():
+    def _parse(self, bentry):
+        # Values such as journal names repeat across many entries. Interning
+        # them stores every distinct value only once.
+        for k, v in bentry.items():
             if k in FIELDS:
-                if k.lower() in UNLATEXIFY_FIELDS:
-                    self.data[k.lower()] = unlatexify(merge_lines(v))
-                    self.raw_data[k.lower()] = merge_lines(v)
+                field = sys.intern(k.lower())
+                value = sys.intern(merge_lines(v))
+                if field in UNLATEXIFY_FIELDS:
+                    self.data[field] = sys.intern(unlatexify(value))
+                    if self.data[field] != value:
+                        self.raw_data[field] = value
                 else:
-                    self.data[k.lower()] = merge_lines(v)
+                    self.data[field] = value
 
 
 class Suggestion(object):
     KIND_PLAIN = 1
     KIND_RE = 2
 
+    __slots__ = ('_entry', 'data', 'source', 'authors', 'editors')
+
     def __init__(self, source, entry):
         self._entry = entry
         self.data = {}
@@ -219,6 +285,28 @@ class Suggestion(object):
     def get_entry(self):
         return self._entry
 
+    def copy_for(self, entry):
+        """Returns a copy of this suggestion that belongs to *entry*."""
+        s = Suggestion(self.source, entry)
+        s.data = {k: list(vs) for (k, vs) in self.data.items()}
+        s.authors = list(self.authors)
+        s.editors = list(self.editors)
+        return s
+
+    def to_dict(self):
+        return {'source': self.source,
+                'data': self.data,
+                'authors': self.authors,
+                'editors': self.editors}
+
+    @classmethod
+    def from_dict(cls, d, entry):
+        s = cls(d['source'], entry)
+        s.data = {k: [tuple(v) for v in vs] for (k, vs) in d['data'].items()}
+        s.authors = [tuple(person) for person in d['authors']]
+        s.editors = [tuple(person) for person in d['editors']]
+        return s
+
     def add_field(self, k, vs, kind=KIND_PLAIN):
         if k not in self.data:
             self.data[k] = []
@@ -33,13 +33,79 @@ class Differ(object):
         'issn': {'list': True, 'ignore_order': True}
     }
 
+    # Normalized values and compiled patterns, shared among all Differs
+    # since the same values are suggested for many entries
+    MEMO_SIZE = 100000
+    NORMALIZED = {}
+    PATTERNS = {}
+
     def __init__(self, entry):
         self._entry = entry
         self._cfg = Config()
+        self._normalized_fields = {}
+
+    @staticmethod
+    def _normalize(field, value, latex):
+        """Normalizes *value* of *field* for comparison. If *latex* is set,
+        LaTeX commands are removed from the value first."""
+        field_props = Differ.FIELD_PROPERTIES.get(field, {})
+        case = field_props.get('case', True)
+        first_letter_case = field_props.get('first_letter_case', True)
+
+        key = (value, latex, case, first_letter_case)
+        normalized = Differ.NORMALIZED.get(key)
+        if normalized is not None:
+            return normalized
+
+        normalized = value
+        if latex:
+            normalized = unlatexify(normalized)
+        normalized = crush_spaces(unify_hyphens(normalized))
+        if not case:
+            normalized = normalized.lower()
+        if not first_letter_case:
+            normalized = lower_case_first_letters(normalized)
+
+        if len(Differ.NORMALIZED) >= Differ.MEMO_SIZE:
+            Differ.NORMALIZED.clear()
+        Differ.NORMALIZED[key] = normalized
+        return normalized
+
+    @staticmethod
+    def _match_pattern(pattern, s):
+        compiled = Differ.PATTERNS.get(pattern)
+        if compiled is None:
+            compiled = re.compile(pattern)
+            if len(Differ.PATTERNS) >= Differ.MEMO_SIZE:
+                Differ.PATTERNS.clear()
+            Differ.PATTERNS[pattern] = compiled
+        return compiled.match(s)
+
+    def _normalized_field(self, field):
+        """Returns the normalized value of *field* of the entry."""
+        normalized = self._normalized_fields.get(field)
+        if normalized is None:
+            normalized = Differ._normalize(field, self._entry.data[field],
+                                           True)
+            self._normalized_fields[field] = normalized
+        return normalized
+
+    def compared_fields(self):
+        """Returns the set of fields of suggestions that may be compared
+        against the entry of this Differ, i.e., the fields of the entry and
+        the wanted fields. Only these fields of a suggestion need to be
+        unified."""
+        wanted = set(self._cfg.get('wanted', self._entry, []))
+        forbidden = set(self._cfg.get('forbidden', self._entry, []))
+        return set(self._entry.data.keys()) | (wanted - forbidden)
 
     def diff(self, suggestion):
         """Compute and return a list of differences between the
-        entity of this Differ and the list of suggestions passed."""
+        entity of this Differ and the list of suggestions passed.
+        Fields for which differences are ignored are not compared."""
+        if self._entry.should_ignore_source(suggestion.source):
+            return []
+
         return self._diff_general(suggestion) + \
             self._diff_people('authors', suggestion) + \
             self._diff_people('editors', suggestion)
@@ -60,6 +126,10 @@ class Differ(object):
             return []
 
         for i in range(0, max(len(sugg_field), len(entry_field))):
+            if self._entry.should_ignore_diff(
+                    suggestion.source, '{} {}'.format(singular, i + 1)):
+                continue
+
             if i >= len(sugg_field):
                 diffs.append(
                     Difference(self._entry.get_id(),
@@ -126,38 +196,19 @@ class Differ(object):
         # Find fields where we have data in the entry, which is different from
         # the data in the suggestion
         for field in self._entry.data.keys():
+            if self._entry.should_ignore_diff(suggestion.source, field):
+                continue
+
             if field in suggestion.data:
                 suggestion_data = suggestion.data[field]
 
-                entry_data = unlatexify(self._entry.data[field])
-
-                # Cast everything to string
-                suggestion_data = [(str(d), kind) for (d, kind)
-                                   in suggestion_data]
-
-                # Unify hyphens
-                entry_data = unify_hyphens(entry_data)
-                suggestion_data = [(unify_hyphens(d), kind)
-                                   for (d, kind) in suggestion_data]
-
-                # Crush spaces
-                entry_data = crush_spaces(entry_data)
-                suggestion_data = [(crush_spaces(d), kind)
+                entry_data = self._normalized_field(field)
+                suggestion_data = [(Differ._normalize(field, str(d), False),
+                                    kind)
                                    for (d, kind) in suggestion_data]
 
                 field_props = Differ.FIELD_PROPERTIES.get(field, {})
 
-                if not field_props.get('case', True):
-                    entry_data = entry_data.lower()
-                    suggestion_data = [(d.lower(), kind)
-                                       for (d, kind) in suggestion_data]
-
-                if not field_props.get('first_letter_case', True):
-                    entry_data = lower_case_first_letters(entry_data)
-                    suggestion_data = [
-                        (lower_case_first_letters(d), kind)
-                        for (d, kind) in suggestion_data]
-
                 if 'diff_func' in field_props:
                     # Diff func must handle plain / re on itself!
                     if field_props['diff_func'](entry_data, suggestion_data):
@@ -170,7 +221,7 @@ class Differ(object):
                     hit = False
                     for (d, kind) in suggestion_data:
                         if kind == Suggestion.KIND_RE:
-                            if re.match(d, entry_data):
+                            if Differ._match_pattern(d, entry_data):
                                 hit = True
                         else:
                             # Plain
@@ -213,7 +264,9 @@ class Differ(object):
         forbidden = set(self._cfg.get('forbidden', self._entry, []))
         wanted = wanted - forbidden
         for field in wanted:
-            if field not in self._entry.data and field in suggestion.data:
+            if field not in self._entry.data and field in suggestion.data \
+               and not self._entry.should_ignore_diff(suggestion.source,
+                                                      field):
                 diffs.append(Difference(self._entry.get_id(),
                                         suggestion.source, field,
                                         [d for (d, kind)
@@ -0,0 +1,120 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Journal(object):
+    """An append-only journal of finished work, used to resume interrupted
+    runs. Every record stores the result of one stage (e.g., the DOI search
+    or the query of one source) for one entry, together with a hash of the
+    entry's data. Records for entries that changed in the meantime are
+    ignored on resume.
+
+    Records are written by a background thread, so recording never blocks
+    the event loop. The file is fsync'ed after every *batch_size* records
+    or every *sync_interval* seconds, whichever comes first."""
+
+    def __init__(self, filename, resume=False, batch_size=100,
+                 sync_interval=1.0):
+        self._fname = filename
+        self._batch_size = batch_size
+        self._sync_interval = sync_interval
+
+        self._records = {}
+        if resume:
+            self._load()
+
+        self._queue = queue.Queue()
+        self._file = open(filename, 'a' if resume else 'w')
+        self._thread = threading.Thread(target=self._write_loop,
+                                        daemon=True)
+        self._thread.start()
+
+    def _load(self):
+        if not os.path.isfile(self._fname):
+            LOGGER.warning("Journal {} does not exist, starting from scratch"
+                           .format(self._fname))
+            return
+
+        # Size of the journal up to the last complete record
+        size = 0
+        complete_size = 0
+        with open(self._fname, 'rb') as journal_file:
+            for line in journal_file:
+                size += len(line)
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # The last line may be incomplete if we were killed
+                    continue
+                if not line.endswith(b'\n'):
+                    continue
+                complete_size = size
+                self._records[(record['stage'], record['name'],
+                               record['entry'])] = (record['hash'],
+                                                    record['data'])
+
+        # New records are appended, so cut off an incomplete last line
+        if complete_size < size:
+            LOGGER.warning("Discarding an incomplete record at the end of "
+                           "journal {}".format(self._fname))
+            os.truncate(self._fname, complete_size)
+
+        LOGGER.info("Read {} records from journal {}".format(
+            len(self._records), self._fname))
+
+    def get(self, stage, name, entry_id, entry_hash):
+        """Returns the recorded data for the given stage and entry, or None
+        if nothing (or something for a different version of the entry) has
+        been recorded."""
+        record = self._records.get((stage, name, entry_id))
+        if record is None or record[0] != entry_hash:
+            return None
+        return record[1]
+
+    def record(self, stage, name, entry_id, entry_hash, data):
+        # Serialize right away, the data may be modified afterwards
+        line = json.dumps({'stage': stage, 'name': name, 'entry': entry_id,
+                           'hash': entry_hash, 'data': data})
+        self._queue.put(line)
+        # Later lookups see the data as it is read on resume
+        self._records[(stage, name, entry_id)] = (entry_hash,
+                                                  json.loads(line)['data'])
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _write_loop(self):
+        unsynced = 0
+        last_sync = time.monotonic()
+        while True:
+            try:
+                record = self._queue.get(timeout=self._sync_interval)
+            except queue.Empty:
+                record = False
+
+            if record is None:
+                self._sync()
+                return
+
+            if record:
+                self._file.write(record + "\n")
+                unsynced += 1
+
+            if unsynced > 0 and \
+               (unsynced >= self._batch_size or
+                    time.monotonic() - last_sync >= self._sync_interval):
+                self._sync()
+                unsynced = 0
+                last_sync = time.monotonic()
@@ -0,0 +1,484 @@
+import asyncio
+import bisect
+import json
+import logging
+import re
+import sys
+import time
+
+from bibchex.checks import CCHECKERS
+from bibchex.config import Config
+from bibchex.data import Entry
+from bibchex.differ import Differ
+from bibchex.parsing import split_entries, is_string_definition, parse_chunk
+from bibchex.parsing import ENTRY_START_RE
+from bibchex.sources import SOURCES, CachedSource, CrossrefSource
+from bibchex.ui import UI
+from bibchex.unify import Unifier
+
+LOGGER = logging.getLogger(__name__)
+
+SEVERITY_WARNING = 2
+SEVERITY_INFORMATION = 3
+
+SYNC_FULL = 1
+
+ERROR_PARSE = -32700
+ERROR_INVALID_REQUEST = -32600
+ERROR_METHOD_NOT_FOUND = -32601
+ERROR_INTERNAL = -32603
+
+
+class DocumentEntry(object):
+    """An entry of an open document, together with its check results."""
+
+    def __init__(self, chunk, entry):
+        self.chunk = chunk
+        self.entry = entry
+        self.offset = 0
+
+        self.problems = []
+        self.network_problems = []
+        self.unifier_diffs = []
+        self.source_diffs = []
+
+        # The pending retrieval from the (network-backed) data sources
+        self.task = None
+
+
+class BibDocument(object):
+    """The parsed model of a BibTeX document opened in the editor."""
+
+    def __init__(self, uri):
+        self.uri = uri
+        self.text = ""
+        self.entries = {}
+        # (offset, key) of entries whose key was already used before
+        self.duplicates = []
+
+        self._strings = ""
+        self._line_starts = [0]
+
+    def update(self, text, ui):
+        """Updates the document to *text*. Only entries whose text changed
+        are parsed again. Returns the lists of new or changed entries and of
+        entries that were removed or replaced."""
+        chunks = split_entries(text)
+        strings = "".join((chunk for (_, chunk) in chunks
+                           if is_string_definition(chunk)))
+        # If the @string definitions changed, every entry might have changed
+        if strings != self._strings:
+            old_by_chunk = {}
+        else:
+            old_by_chunk = {de.chunk: de for de in self.entries.values()}
+
+        entries = {}
+        changed = []
+        duplicates = []
+        pending = list(reversed(chunks))
+        while pending:
+            (offset, chunk) = pending.pop()
+            if is_string_definition(chunk):
+                continue
+
+            de = old_by_chunk.pop(chunk, None)
+            is_new = de is None
+            if is_new:
+                bentries = parse_chunk(chunk, strings)
+                if len(bentries) != 1:
+                    # Comments, preambles or entries that are being typed.
+                    # The latter may lack closing braces and then contain
+                    # all following entries, which are split off again.
+                    pending.extend(reversed(_split_at_entry_starts(
+                        chunk, offset)))
+                    continue
+                de = DocumentEntry(chunk, Entry(bentries[0], ui))
+
+            # Only the first entry with a key is checked
+            if de.entry.get_id() in entries:
+                duplicates.append((offset, de.entry.get_id()))
+                continue
+
+            if is_new:
+                changed.append(de)
+            de.offset = offset
+            entries[de.entry.get_id()] = de
+
+        removed = [de for de in self.entries.values()
+                   if entries.get(de.entry.get_id()) is not de]
+
+        self.text = text
+        self.entries = entries
+        self.duplicates = duplicates
+        self._strings = strings
+        self._line_starts = [0] + [m.end() for m
+                                   in re.finditer('\n', text)]
+
+        return (changed, removed)
+
+    def get_line(self, offset):
+        return bisect.bisect_right(self._line_starts, offset) - 1
+
+    def get_range(self, de, field=None):
+        offset = de.offset
+        if field:
+            m = re.search(r'^\s*{}\s*='.format(re.escape(field)), de.chunk,
+                          re.MULTILINE | re.IGNORECASE)
+            if m:
+                offset += m.end() - len(m.group(0).lstrip())
+
+        return self.get_line_range(offset)
+
+    def get_line_range(self, offset):
+        line = self.get_line(offset)
+        line_start = self._line_starts[line]
+        if line + 1 < len(self._line_starts):
+            line_end = self._line_starts[line + 1] - 1
+        else:
+            line_end = len(self.text)
+
+        return {'start': {'line': line, 'character': offset - line_start},
+                'end': {'line': line, 'character': line_end - line_start}}
+
+
+class LanguageServer(object):
+    """A language server (speaking the Language Server Protocol via stdin
+    and stdout) that checks BibTeX documents while they are being edited.
+
+    Whenever a document changes, only the entries that changed are checked.
+    Local checks and differences to already retrieved data are published
+    immediately. Retrieval from the data sources is started in the
+    background, and the diagnostics are updated once it completes."""
+
+    def __init__(self):
+        self._ui = UI()
+        self._cfg = Config()
+        self._unifier = Unifier()
+
+        cache_size = self._cfg.get('server_cache_size', None, 10000)
+        self._sources = [CachedSource(SourceClass(self._ui), cache_size)
+                         for SourceClass in SOURCES]
+        self._doi_source = CrossrefSource(self._ui)
+
+        self._documents = {}
+        self._reader = None
+        self._output = None
+        self._exit = False
+
+        self._handlers = {
+            'initialize': self._initialize,
+            'shutdown': self._shutdown,
+            'exit': self._exit_notification,
+            'textDocument/didOpen': self._did_open,
+            'textDocument/didChange': self._did_change,
+            'textDocument/didClose': self._did_close,
+        }
+
+    async def serve(self, reader=None, output=None):
+        """Serves requests until the client sends 'exit'. By default, the
+        protocol is spoken on stdin / stdout."""
+        if reader is None:
+            loop = asyncio.get_event_loop()
+            reader = asyncio.StreamReader()
+            await loop.connect_read_pipe(
+                lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        if output is None:
+            output = sys.stdout.buffer
+
+        self._reader = reader
+        self._output = output
+
+        while not self._exit:
+            message = await self._read_message()
+            if message is None:
+                break
+            self._dispatch(message)
+
+        for document in self._documents.values():
+            self._cancel(document.entries.values())
+        for source in self._sources:
+            await source.close()
+
+    async def _read_message(self):
+        """Returns the next message, or None once the input ends. Messages
+        that cannot be read are answered with an error and skipped."""
+        while True:
+            headers = await self._read_headers()
+            if headers is None:
+                return None
+
+            try:
+                length = int(headers['content-length'])
+            except (KeyError, ValueError):
+                self._send({'id': None,
+                            'error': {'code': ERROR_INVALID_REQUEST,
+                                      'message': "Missing or invalid "
+                                                 "Content-Length header"}})
+                continue
+
+            body = await self._reader.readexactly(length)
+            try:
+                return json.loads(body.decode('utf-8'))
+            except ValueError as e:
+                self._send({'id': None,
+                            'error': {'code': ERROR_PARSE,
+                                      'message': f"Invalid message: {e}"}})
+
+    async def _read_headers(self):
+        headers = {}
+        while True:
+            line = await self._reader.readline()
+            if not line:
+                return None
+            line = line.decode('ascii', 'replace').strip()
+            if not line:
+                return headers
+            if ':' not in line:
+                LOGGER.warning(f"Ignoring malformed header {line}")
+                continue
+            (name, value) = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+
+    def _send(self, message):
+        message['jsonrpc'] = '2.0'
+        body = json.dumps(message).encode('utf-8')
+        self._output.write("Content-Length: {}\r\n\r\n"
+                           .format(len(body)).encode('ascii'))
+        self._output.write(body)
+        self._output.flush()
+
+    def _dispatch(self, message):
+        method = message.get('method')
+        handler = self._handlers.get(method)
+
+        if 'id' not in message:
+            # Notification. Unknown ones are ignored.
+            if handler:
+                try:
+                    handler(message.get('params', {}))
+                except Exception:
+                    LOGGER.exception(f"Handling {method} failed")
+            return
+
+        if not handler:
+            self._send({'id': message['id'],
+                        'error': {'code': ERROR_METHOD_NOT_FOUND,
+                                  'message': f"Unknown method {method}"}})
+            return
+
+        try:
+            result = handler(message.get('params', {}))
+        except Exception as e:
+            LOGGER.exception(f"Handling {method} failed")
+            self._send({'id': message['id'],
+                        'error': {'code': ERROR_INTERNAL,
+                                  'message': f"{method} failed: {e}"}})
+            return
+
+        self._send({'id': message['id'], 'result': result})
+
+    def _initialize(self, params):
+        return {'capabilities': {'textDocumentSync': SYNC_FULL},
+                'serverInfo': {'name': 'bibchex'}}
+
+    def _shutdown(self, params):
+        return None
+
+    def _exit_notification(self, params):
+        self._exit = True
+
+    def _did_open(self, params):
+        doc = params['textDocument']
+        self._documents[doc['uri']] = BibDocument(doc['uri'])
+        self._update(self._documents[doc['uri']], doc['text'])
+
+    def _did_change(self, params):
+        document = self._documents.get(params['textDocument']['uri'])
+        if document is None or not params['contentChanges']:
+            return
+        self._update(document, params['contentChanges'][-1]['text'])
+
+    def _did_close(self, params):
+        uri = params['textDocument']['uri']
+        document = self._documents.pop(uri, None)
+        if document:
+            self._cancel(document.entries.values())
+        self._send({'method': 'textDocument/publishDiagnostics',
+                    'params': {'uri': uri, 'diagnostics': []}})
+
+    def _cancel(self, document_entries):
+        for de in document_entries:
+            if de.task:
+                de.task.cancel()
+                de.task = None
+
+    def _update(self, document, text):
+        start = time.monotonic()
+
+        (changed, removed) = document.update(text, self._ui)
+        self._cancel(removed)
+
+        for de in changed:
+            self._check_local(de)
+            de.task = asyncio.ensure_future(self._retrieve(document, de))
+
+        self._publish(document)
+        LOGGER.debug("Checked {} changed entries in {:.1f} ms".format(
+            len(changed), (time.monotonic() - start) * 1000))
+
+    def _check_local(self, de):
+        entry = de.entry
+
+        de.problems = []
+        for CChecker in CCHECKERS:
+            if hasattr(CChecker, 'complete') or \
+               getattr(CChecker, 'NETWORK', False):
+                continue
+            if not self._cfg.get("check_{}".format(CChecker.NAME),
+                                 entry, True) or \
+               entry.should_ignore_checker(CChecker):
+                continue
+
+            # Local checkers never actually suspend
+            problems = _run_sync(CChecker().check(entry))
+            de.problems.extend(((CChecker.NAME, problem)
+                                for problem in problems))
+
+        differ = Differ(entry)
+        de.unifier_diffs = differ.diff(self._unifier.unify_entry(entry))
+
+        # Data that has already been retrieved for other entries (or for
+        # earlier versions of this entry) can be diffed right away.
+        de.source_diffs = []
+        for source in self._sources:
+            raw_result = source.get_cached(entry)
+            if raw_result is not None:
+                de.source_diffs.extend(self._diff_result(differ, raw_result))
+
+    async def _retrieve(self, document, de):
+        entry = de.entry
+        try:
+            if entry.get_doi() is None and \
+               not entry.options.get('nodoi', False):
+                (doi, _) = await self._doi_source.get_doi(entry)
+                if doi:
+                    entry.add_suggested_doi(doi)
+
+            results = await asyncio.gather(
+                *(source.query(entry) for source in self._sources
+                  if self._should_query(source, entry)))
+
+            differ = Differ(entry)
+            source_diffs = []
+            for raw_result in results:
+                source_diffs.extend(self._diff_result(differ, raw_result))
+
+            network_problems = []
+            for CChecker in CCHECKERS:
+                if not getattr(CChecker, 'NETWORK', False):
+                    continue
+                if not self._cfg.get("check_{}".format(CChecker.NAME),
+                                     entry, True) or \
+                   entry.should_ignore_checker(CChecker):
+                    continue
+                problems = await CChecker().check(entry)
+                network_problems.extend(((CChecker.NAME, problem)
+                                         for problem in problems))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            LOGGER.error("Retrieval for {} failed: {}".format(
+                entry.get_id(), e))
+            return
+
+        de.source_diffs = source_diffs
+        de.network_problems = network_problems
+        de.task = None
+
+        if self._documents.get(document.uri) is document:
+            self._publish(document)
+
+    def _should_query(self, source, entry):
+        if not source.applies_to(entry) or \
+           not self._cfg.get("query_{}".format(source.NAME), entry, True):
+            return False
+        # Everything this source would find is ignored anyway
+        return not all((entry.should_ignore_source(name)
+                        for name in source.SUGGESTION_SOURCES))
+
+    def _diff_result(self, differ, raw_result):
+        if not isinstance(raw_result, list):
+            raw_result = [raw_result]
+
+        diffs = []
+        for (result, _) in raw_result:
+            if result:
+                self._unifier.unify_suggestion(result,
+                                               differ.compared_fields())
+                diffs.extend(differ.diff(result))
+        return diffs
+
+    def _publish(self, document):
+        diagnostics = []
+        for (offset, key) in document.duplicates:
+            diagnostics.append({
+                'range': document.get_line_range(offset),
+                'severity': SEVERITY_WARNING,
+                'source': 'bibchex',
+                'code': 'duplicate_key',
+                'message': "Duplicate key {}. Only the first entry with "
+                           "this key is checked.".format(key)})
+
+        for de in document.entries.values():
+            entry = de.entry
+            for (checker_name, (problem_type, message, details)) in \
+                    de.problems + de.network_problems:
+                if entry.should_ignore_problem(problem_type):
+                    continue
+                if details:
+                    message = "{} {}".format(message, details)
+                diagnostics.append({'range': document.get_range(de),
+                                    'severity': SEVERITY_WARNING,
+                                    'source': 'bibchex',
+                                    'code': checker_name,
+                                    'message': message})
+
+            for diff in de.unifier_diffs + de.source_diffs:
+                if entry.should_ignore_diff(diff.source, diff.field):
+                    continue
+                suggestion = diff.suggestion
+                if isinstance(suggestion, list):
+                    suggestion = " / ".join(suggestion)
+                diagnostics.append({
+                    'range': document.get_range(de, diff.field),
+                    'severity': SEVERITY_INFORMATION,
+                    'source': 'bibchex',
+                    'code': diff.source,
+                    'message': "{}: {}".format(diff.field, suggestion)})
+
+        self._send({'method': 'textDocument/publishDiagnostics',
+                    'params': {'uri': document.uri,
+                               'diagnostics': diagnostics}})
+
+
+def _split_at_entry_starts(chunk, offset):
+    """Splits *chunk*, which starts at *offset*, at every line that starts
+    with an '@' after its first line. Returns a list of (offset, chunk)
+    tuples, or an empty list if there is nothing to split."""
+    starts = [m.start() for m in ENTRY_START_RE.finditer(chunk, 1)]
+    if not starts:
+        return []
+    ends = starts[1:] + [len(chunk)]
+    return [(offset + start, chunk[start:end])
+            for (start, end) in zip(starts, ends)]
+
+
+def _run_sync(coroutine):
+    """Runs a coroutine that never suspends to completion, without going
+    through the event loop."""
+    try:
+        coroutine.send(None)
+    except StopIteration as stop:
+        return stop.value
+    coroutine.close()
+    raise RuntimeError("Coroutine suspended unexpectedly")
@@ -1 +1,2 @@
 from .html import HTMLOutput
+from .json import JSONOutput
@@ -0,0 +1,57 @@
+import datetime
+import json
+
+from .common_output import CommonOutput
+
+
+class JSONOutput(CommonOutput):
+    def __init__(self, *args):
+        super().__init__(*args)
+
+        self._group()
+
+    def _generate_per_entry_structure(self, entry):
+        es = {'key': entry.get_id(),
+              'title': entry.data.get('title'),
+              'differences': [],
+              'problems': []}
+
+        for problem in self._grouped_problems.get(entry.get_id(), []):
+            es['problems'].append({
+                'problem_type': problem.problem_type,
+                'source': problem.source,
+                'message': problem.message,
+                'details': problem.details
+            })
+
+        for diff in self._grouped_diffs.get(entry.get_id(), []):
+            es['differences'].append({
+                'field': diff.field,
+                'source': diff.source,
+                'suggestion': diff.suggestion,
+                'old': entry.data.get(diff.field, "")
+            })
+
+        return es
+
+    def get_data(self):
+        entry_data = [self._generate_per_entry_structure(entry)
+                      for entry in self._entries]
+
+        global_data = [{'problem_type': problem.problem_type,
+                        'source': problem.source,
+                        'message': problem.message,
+                        'details': problem.details}
+                       for problem in self._global_problems]
+
+        return {
+            'total_entries': len(self._entries),
+            'entries': entry_data,
+            'global_problems': global_data,
+            'now': datetime.datetime.now().isoformat(),
+            'input_file': self._input_filename
+        }
+
+    def write(self, filename):
+        with open(filename, 'w') as outfile:
+            json.dump(self.get_data(), outfile, indent=2)
@@ -0,0 +1,129 @@
+import asyncio
+import concurrent.futures
+from contextlib import contextmanager
+import logging
+import multiprocessing
+import os
+
+from bibchex.config import Config
+
+LOGGER = logging.getLogger(__name__)
+
+# The shared data of the pool this worker process belongs to
+_WORKER_DATA = None
+
+
+def _init_worker(data, prepare):
+    global _WORKER_DATA
+    if prepare:
+        data = prepare(data)
+    _WORKER_DATA = data
+
+
+def _run_in_worker(func, arg):
+    return func(_WORKER_DATA, arg)
+
+
+class WorkerPool(object):
+    """Runs CPU-bound work of the global checks in parallel.
+
+    The read-only *data* (e.g., the set of names seen by a checker) is
+    shipped to every worker exactly once, when the worker is started.
+    Afterwards, only the (small) arguments of the individual jobs are sent.
+    If *prepare* is given, every worker replaces the data by prepare(data)
+    before running any job, e.g., to build an index. *prepare* and the
+    functions passed to map() are called as func(data, arg) and must be
+    module-level functions.
+
+    Unless the config option ``global_check_backend`` is set to ``thread``,
+    the jobs are run in separate processes, since most of the checks hold
+    the GIL. For small workloads (less than *min_process_work*), starting
+    the processes does not pay off, and the config's thread pool is used
+    instead.
+
+    The global checks run concurrently, each with its own pool. All open
+    pools together use at most ``processes`` worker processes. While pools
+    are opened within shared_by(), every pool gets an equal share of them.
+    A pool never gets more than the processes that are still free, and uses
+    the thread pool if there are none."""
+
+    # The number of worker processes of all open pools
+    _busy_workers = 0
+    # The number of pools that share the worker processes
+    _sharing_pools = 1
+
+    def __init__(self, data, work_size=None, min_process_work=10000,
+                 prepare=None):
+        self._cfg = Config()
+        self._data = data
+        self._prepare = prepare
+        self._pool = None
+        self._worker_count = self._cfg.get_thread_count()
+
+        backend = self._cfg.get('global_check_backend', None, 'process')
+        if backend == 'process' and \
+           (work_size is None or work_size >= min_process_work):
+            max_workers = int(self._cfg.get(
+                'processes', None, len(os.sched_getaffinity(0))))
+            free_workers = min(
+                max(max_workers // WorkerPool._sharing_pools, 1),
+                max_workers - WorkerPool._busy_workers)
+            if free_workers > 0:
+                self._worker_count = free_workers
+                WorkerPool._busy_workers += free_workers
+                self._pool = concurrent.futures.ProcessPoolExecutor(
+                    self._worker_count,
+                    # Do not fork the threads of the event loop
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker, initargs=(data, prepare))
+
+    @classmethod
+    @contextmanager
+    def shared_by(cls, pool_count):
+        """Splits the worker processes between the *pool_count* pools that
+        are opened concurrently within this context."""
+        previous = cls._sharing_pools
+        cls._sharing_pools = max(pool_count, 1)
+        try:
+            yield
+        finally:
+            cls._sharing_pools = previous
+
+    def get_worker_count(self):
+        return self._worker_count
+
+    async def map(self, func, args):
+        """Runs func(data, arg) for every arg in *args* and returns the list
+        of results, in the order of *args*."""
+        loop = asyncio.get_event_loop()
+        if self._pool:
+            tasks = [loop.run_in_executor(self._pool, _run_in_worker,
+                                          func, arg)
+                     for arg in args]
+        else:
+            if self._prepare:
+                # All threads share the prepared data
+                self._data = await loop.run_in_executor(
+                    self._cfg.get_executor(), self._prepare, self._data)
+                self._prepare = None
+            tasks = [loop.run_in_executor(self._cfg.get_executor(),
+                                          func, self._data, arg)
+                     for arg in args]
+
+        return await asyncio.gather(*tasks)
+
+    async def close(self):
+        """Shuts the worker processes down, without blocking the event
+        loop."""
+        if self._pool:
+            pool = self._pool
+            self._pool = None
+            WorkerPool._busy_workers -= self._worker_count
+            await asyncio.get_event_loop().run_in_executor(
+                self._cfg.get_executor(), pool.shutdown)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
@@ -0,0 +1,337 @@
+import hashlib
+import io
+import logging
+import mmap
+import os
+import re
+import threading
+
+import bibtexparser
+from bibtexparser.bibdatabase import BibDatabase, COMMON_STRINGS
+
+from bibchex.config import Config
+from bibchex.data import Entry
+from bibchex.tokenizer import tokenize, UnsupportedSyntax
+from bibchex.ui import SilentUI
+
+LOGGER = logging.getLogger(__name__)
+
+ENTRY_START_RE = re.compile(r'^[ \t]*@', re.MULTILINE)
+STRING_RE = re.compile(r'\s*@\s*string\s*[{(]', re.IGNORECASE)
+# The same on raw file contents, where a file may start with a byte order
+# mark
+ENTRY_START_BYTES_RE = re.compile(rb'^(?:\xef\xbb\xbf)?[ \t]*@',
+                                  re.MULTILINE)
+STRING_BYTES_RE = re.compile(rb'@\s*string\s*[{(]', re.IGNORECASE)
+# Braces, and escaped characters (e.g., '\{'), which do not count as braces
+BRACE_RE = re.compile(r'\\.|[{}]', re.DOTALL)
+BRACE_BYTES_RE = re.compile(rb'\\.|[{}]', re.DOTALL)
+# Entries delimited by parentheses instead of braces
+PAREN_ENTRY_RE = re.compile(r'[ \t]*@[ \t]*\w*[ \t]*\(')
+PAREN_ENTRY_BYTES_RE = re.compile(
+    rb'(?:\xef\xbb\xbf)?[ \t]*@[ \t]*\w*[ \t]*\(')
+
+# Building bibtexparser's grammar is expensive, so every thread keeps one
+# parser around
+_LOCAL = threading.local()
+
+
+def split_entries(text):
+    """Splits BibTeX data into chunks of one entry each, the same way
+    iter_chunks() does. Returns a list of (offset, chunk) tuples. Anything
+    before the first '@' is not part of any entry and is dropped."""
+    return [(start, text[start:end])
+            for (start, end, _, _) in _scan_segments(text)]
+
+
+def is_string_definition(chunk):
+    return STRING_RE.match(chunk) is not None
+
+
+def parse_bibtex(text, strings=None, backend=None):
+    """Parses the BibTeX data in *text* into bibtexparser's entry dicts.
+
+    *backend* selects the parser: 'bibtexparser', or 'native' for the
+    tokenizer in bibchex.tokenizer, which falls back to bibtexparser for
+    data it does not support. It defaults to the 'parser_backend' option.
+
+    If given, *strings* maps the names of @string macros to their values
+    and must contain the common strings (i.e., the month names). The
+    macros defined in *text* are added to it."""
+    if backend is None:
+        backend = Config().get('parser_backend', None, 'bibtexparser')
+
+    if backend == 'native':
+        try:
+            return tokenize(text, strings)
+        except UnsupportedSyntax as e:
+            LOGGER.debug("Falling back to bibtexparser: %s", e)
+
+    return _parse_with_bibtexparser(text, strings)
+
+
+def _parse_with_bibtexparser(text, strings):
+    parser = getattr(_LOCAL, 'parser', None)
+    if parser is None:
+        parser = bibtexparser.bparser.BibTexParser(common_strings=False)
+        parser.expect_multiple_parse = True
+        _LOCAL.parser = parser
+
+    # The parser only keeps its results in its database. It is released
+    # after parsing, such that the parser does not keep the entries alive.
+    parser.bib_database = BibDatabase()
+    parser.bib_database.strings.update(
+        COMMON_STRINGS if strings is None else strings)
+    database = parser.parse(text)
+    parser.bib_database = None
+    if strings is not None:
+        strings.update(database.strings)
+    return database.entries
+
+
+def parse_chunk(chunk, strings="", backend=None):
+    """Parses a chunk of BibTeX data into bibtexparser's entry dicts.
+    *strings* may contain @string definitions that the chunk uses."""
+    return parse_bibtex(strings + chunk, backend=backend)
+
+
+def _count_braces(text, depth, brace_re, parens):
+    """Returns the brace depth after *text*, starting at *depth*, and
+    whether the braces were balanced again within *text*, i.e., the entry
+    ended. Anything after the end of the entry is not counted. In entries
+    delimited by *parens*, the braces of values do not end the entry."""
+    for m in brace_re.finditer(text):
+        c = m.group(0)
+        if len(c) > 1:
+            continue
+        if c in ('{', b'{'):
+            depth += 1
+        elif depth > 0:
+            depth -= 1
+            if depth == 0 and not parens:
+                return (0, True)
+    return (depth, False)
+
+
+def iter_chunks(lines, batch_size=100):
+    """Groups the *lines* of BibTeX data into chunks of up to *batch_size*
+    entries each, as they are read. Chunks only end before a line that
+    starts with an '@' and only where all braces are balanced, so an '@'
+    at the start of a line within a field value does not split an entry.
+    Escaped braces and braces in comments between the entries are not
+    counted. Anything before the first '@' is dropped."""
+    chunk = []
+    entry_count = 0
+    depth = 0
+    # Whether the braces of the current entry are being counted. The text
+    # after the end of an entry is a comment.
+    in_entry = False
+    parens = False
+    for line in lines:
+        if ENTRY_START_RE.match(line):
+            if depth == 0:
+                if entry_count == batch_size:
+                    yield "".join(chunk)
+                    chunk = []
+                    entry_count = 0
+                entry_count += 1
+                in_entry = True
+                parens = PAREN_ENTRY_RE.match(line) is not None
+        elif not chunk:
+            continue
+
+        chunk.append(line)
+        if in_entry:
+            (depth, ended) = _count_braces(line, depth, BRACE_RE, parens)
+            in_entry = not ended
+
+    if chunk:
+        yield "".join(chunk)
+
+
+def iter_bibtex(lines, batch_size=100, backend=None):
+    """Parses the *lines* of BibTeX data incrementally and yields
+    bibtexparser's entry dicts in the order of the input, while it is still
+    being read. @string definitions apply to all following entries. See
+    parse_bibtex() for *backend*."""
+    strings = dict(COMMON_STRINGS)
+    for chunk in iter_chunks(lines, batch_size):
+        yield from parse_bibtex(chunk, strings, backend)
+
+
+def split_for_parallel(text, chunk_count):
+    """Splits BibTeX data into (up to) *chunk_count* chunks of entries that
+    can be parsed independently, in order. Returns a list of (strings,
+    chunk) tuples, where *strings* contains all @string definitions that
+    precede the chunk."""
+    entries = list(iter_chunks(io.StringIO(text), batch_size=1))
+    chunk_size = max(len(entries) // max(chunk_count, 1), 1)
+
+    jobs = []
+    strings = []
+    for start in range(0, len(entries), chunk_size):
+        chunk = entries[start:start + chunk_size]
+        jobs.append(("".join(strings), "".join(chunk)))
+        strings.extend((entry for entry in chunk
+                        if is_string_definition(entry)))
+
+    return jobs
+
+
+def parse_entries(options, job):
+    """Parses one (strings, chunk) job of split_for_parallel() and returns a
+    list of (entry dict, Entry) tuples. *options* is a (backend, keep_raw)
+    tuple of the parser backend (see parse_bibtex()) and whether the entry
+    dicts are returned. Otherwise, None is returned in their place, which
+    saves sending them back. Runs in a worker (see parallel.WorkerPool),
+    which does not know the configuration. Warnings about the entries are
+    not shown."""
+    (backend, keep_raw) = options
+    (strings, chunk) = job
+    ui = SilentUI()
+    return [(bentry if keep_raw else None, Entry(bentry, ui))
+            for bentry in parse_chunk(chunk, strings, backend)]
+
+
+class Segment:
+    """A part of a BibTeX file as indexed by SourceIndex. It spans the
+    bytes from *start* (inclusive) to *end* (exclusive) and the lines
+    *first_line* to *last_line* (inclusive, starting at 1). *bentries* are
+    the entry dicts parsed from it. *fingerprint* identifies its content
+    and all @string definitions before it."""
+
+    __slots__ = ('start', 'end', 'first_line', 'last_line', 'fingerprint',
+                 'bentries')
+
+    def __init__(self, start, end, first_line, last_line, fingerprint,
+                 bentries):
+        self.start = start
+        self.end = end
+        self.first_line = first_line
+        self.last_line = last_line
+        self.fingerprint = fingerprint
+        self.bentries = bentries
+
+
+def _scan_segments(data):
+    """Splits the BibTeX data *data* (raw bytes or text) the same way
+    iter_chunks() does with a batch size of one. Yields (start, end,
+    first_line, last_line) tuples, see Segment."""
+    if isinstance(data, str):
+        (entry_start_re, brace_re, paren_entry_re, newline) = \
+            (ENTRY_START_RE, BRACE_RE, PAREN_ENTRY_RE, '\n')
+    else:
+        (entry_start_re, brace_re, paren_entry_re, newline) = \
+            (ENTRY_START_BYTES_RE, BRACE_BYTES_RE, PAREN_ENTRY_BYTES_RE,
+             b'\n')
+
+    start = None
+    depth = 0
+    in_entry = False
+    parens = False
+    line = 1
+    last = 0
+    for m in entry_start_re.finditer(data):
+        pos = m.start()
+        piece = data[last:pos]
+        line += piece.count(newline)
+        last = pos
+        if start is None:
+            (start, first_line) = (pos, line)
+        else:
+            if in_entry:
+                (depth, ended) = _count_braces(piece, depth, brace_re,
+                                               parens)
+                in_entry = not ended
+            if depth != 0:
+                continue
+            yield (start, pos, first_line, line - 1)
+            (start, first_line) = (pos, line)
+
+        in_entry = True
+        parens = paren_entry_re.match(data, pos) is not None
+
+    if start is not None:
+        piece = data[last:]
+        last_line = line + piece.count(newline)
+        if piece.endswith(newline):
+            last_line -= 1
+        yield (start, len(data), first_line, last_line)
+
+
+def _decode(content):
+    # Like reading the file in text mode, with universal newlines
+    return content.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+
+
+class SourceIndex:
+    """An index of the entries in a BibTeX file. The file is split into
+    segments of entries (like iter_chunks() does), which are indexed with
+    their byte spans, line numbers and content hashes.
+
+    On every update(), the file is read via mmap and only the segments
+    whose content changed are parsed again. Segments that follow changed
+    @string definitions count as changed."""
+
+    def __init__(self, filename):
+        self._fname = filename
+        self._segments = []
+        self._by_key = {}
+
+    def update(self, backend=None):
+        """Re-reads the file. See parse_bibtex() for *backend*. Returns the
+        number of segments that were parsed."""
+        previous = {segment.fingerprint: segment
+                    for segment in self._segments}
+        segments = []
+        parsed = 0
+
+        with open(self._fname, 'rb') as bibtex_file:
+            if os.fstat(bibtex_file.fileno()).st_size == 0:
+                data = b''
+            else:
+                data = mmap.mmap(bibtex_file.fileno(), 0,
+                                 access=mmap.ACCESS_READ)
+            try:
+                strings = dict(COMMON_STRINGS)
+                context = hashlib.sha1()
+                for (start, end, first_line, last_line) \
+                        in _scan_segments(data):
+                    content = data[start:end]
+                    digest = hashlib.sha1(content).digest()
+                    fingerprint = (context.digest(), digest)
+                    defines_strings = STRING_BYTES_RE.search(content)
+
+                    old = previous.get(fingerprint)
+                    # @string definitions must be parsed to know the
+                    # macros for the following segments
+                    if old is None or defines_strings:
+                        bentries = parse_bibtex(_decode(content), strings,
+                                                backend)
+                        parsed += 1
+                    else:
+                        bentries = old.bentries
+
+                    if defines_strings:
+                        context.update(digest)
+                    segments.append(Segment(start, end, first_line,
+                                            last_line, fingerprint,
+                                            bentries))
+            finally:
+                if isinstance(data, mmap.mmap):
+                    data.close()
+
+        self._segments = segments
+        self._by_key = {bentry['ID']: segment for segment in segments
+                        for bentry in segment.bentries}
+        return parsed
+
+    def get_entries(self):
+        """Returns all entry dicts, in the order of the file."""
+        return [bentry for segment in self._segments
+                for bentry in segment.bentries]
+
+    def get_segment(self, key):
+        """Returns the Segment that contains the entry with key *key*, or
+        None."""
+        return self._by_key.get(key)
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+
+from aiohttp import web
+
+from bibchex.checker import Checker, DuplicateKeyError
+from bibchex.config import Config
+from bibchex.output import JSONOutput
+from bibchex.sources import SOURCES, CachedSource, CrossrefSource
+from bibchex.ui import UI
+
+LOGGER = logging.getLogger(__name__)
+
+
+class CheckServer(object):
+    """Runs the checker pipeline for BibTeX payloads posted to a local
+    HTTP/JSON API.
+
+    All requests share the same data sources, i.e., the same rate limiters,
+    connection pools and retrieval caches. Thus, data for a DOI that
+    multiple users have in their bibliographies is only retrieved once.
+
+    The API consists of a single endpoint, ``POST /check``, which expects
+    a JSON object with the BibTeX data in the key ``bibtex``, and returns
+    the same data that the JSON output would write."""
+
+    def __init__(self):
+        self._ui = UI()
+        self._cfg = Config()
+
+        cache_size = self._cfg.get('server_cache_size', None, 10000)
+        self._sources = [CachedSource(SourceClass(self._ui), cache_size)
+                         for SourceClass in SOURCES]
+        self._doi_source = CrossrefSource(self._ui)
+
+        # Global checkers keep their state on the class, so only one
+        # request at a time may run the consistency checks.
+        self._check_lock = asyncio.Lock()
+
+        self._app = web.Application()
+        self._app.add_routes([web.post('/check', self._handle_check)])
+        self._runner = None
+
+    async def start(self, host, port):
+        self._runner = web.AppRunner(self._app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        LOGGER.info(f"Listening on http://{host}:{port}/")
+
+    async def close(self):
+        if self._runner:
+            await self._runner.cleanup()
+        for source in self._sources:
+            await source.close()
+
+    async def check(self, text, name=None):
+        c = Checker(name, None, text=text, sources=self._sources,
+                    doi_source=self._doi_source)
+        await c.check(lock=self._check_lock)
+        return c.get_output(JSONOutput).get_data()
+
+    async def _handle_check(self, request):
+        try:
+            payload = await request.json()
+        except ValueError:
+            raise web.HTTPBadRequest(text="Request body must be JSON.")
+
+        if not isinstance(payload, dict) or \
+           not isinstance(payload.get('bibtex'), str):
+            raise web.HTTPBadRequest(
+                text="Request must contain the BibTeX data as 'bibtex'.")
+
+        try:
+            result = await self.check(payload['bibtex'], payload.get('name'))
+        except DuplicateKeyError as e:
+            raise web.HTTPBadRequest(text=str(e))
+
+        return web.json_response(result)
@@ -0,0 +1,109 @@
+import asyncio
+import hashlib
+import json
+import logging
+
+from bibchex.checks import CCHECKERS
+from bibchex.data import Entry, Difference, Problem
+from bibchex.output import HTMLOutput, JSONOutput
+from bibchex.ui import UI
+
+LOGGER = logging.getLogger(__name__)
+
+
+def shard_of(key, shard_count):
+    """Deterministically assigns the entry with the given key to one of
+    *shard_count* shards. In contrast to hash(), this is stable across
+    processes and machines."""
+    digest = hashlib.sha1(key.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % shard_count
+
+
+def parse_shard_spec(spec):
+    """Parses a shard specification of the form 'i/N' into (i, N)."""
+    try:
+        (index, count) = (int(s) for s in spec.split('/'))
+    except ValueError:
+        raise ValueError(f"Invalid shard specification '{spec}'")
+
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard specification '{spec}'")
+
+    return (index, count)
+
+
+class ShardMerger(object):
+    """Merges the results of multiple sharded runs (see Checker) into one
+    report. The global checks are run once, on the union of the names
+    collected by the individual shards."""
+
+    def __init__(self, filenames, out_filename):
+        self._fnames = filenames
+        self._out_filename = out_filename
+
+        self._ui = UI()
+
+    async def run(self):
+        shards = []
+        for fname in self._fnames:
+            with open(fname, 'r') as shard_file:
+                shards.append(json.load(shard_file))
+
+        self._verify(shards)
+
+        indexed_entries = []
+        diffs = []
+        problems = []
+        for shard in shards:
+            for (index, bentry) in shard['entries']:
+                indexed_entries.append((index, Entry(bentry, self._ui)))
+            diffs.extend((Difference(*diff) for diff in shard['diffs']))
+            problems.extend((Problem(*prob) for prob in shard['problems']))
+        # Restore the order of the input file
+        entries = [entry for (_, entry) in sorted(indexed_entries,
+                                                  key=lambda ie: ie[0])]
+
+        LOGGER.info("Running global consistency checks")
+        global_problems = await self._check_global(shards)
+
+        if self._out_filename.lower().endswith('.json'):
+            output_class = JSONOutput
+        else:
+            output_class = HTMLOutput
+
+        out = output_class(entries, diffs, problems, global_problems,
+                           shards[0]['input_file'])
+        out.write(self._out_filename)
+        LOGGER.info("Done.")
+
+    def _verify(self, shards):
+        count = shards[0]['shard'][1]
+        indices = sorted((shard['shard'][0] for shard in shards))
+        if any((shard['shard'][1] != count for shard in shards)):
+            raise ValueError("Shards stem from runs with different "
+                             "shard counts")
+        if indices != list(range(0, count)):
+            LOGGER.warning("Merging shards {} of {}. Some shards are "
+                           "missing or duplicated.".format(indices, count))
+
+    async def _check_global(self, shards):
+        global_checkers = [CChecker for CChecker in CCHECKERS
+                           if hasattr(CChecker, 'complete')]
+        for CChecker in global_checkers:
+            await CChecker.reset()
+            for shard in shards:
+                await CChecker.import_state(
+                    shard['global_state'].get(CChecker.NAME, []))
+
+        all_global_results = await asyncio.gather(
+            *(CChecker.complete(self._ui) for CChecker in global_checkers))
+
+        global_problems = []
+        for (CChecker, global_results) in zip(global_checkers,
+                                              all_global_results):
+            for (problem_type, message, details) in global_results:
+                global_problems.append(
+                    Problem(None, CChecker.NAME, problem_type,
+                            message, details))
+
+        return global_problems
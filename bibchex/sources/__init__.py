@@ -2,5 +2,6 @@ from .crossref import CrossrefSource
 from .meta import MetaSource
 from .isbn import ISBNSource
 from .datacite import DataCiteSource
+from .cache import CachedSource
 
 SOURCES = [DataCiteSource, CrossrefSource, MetaSource, ISBNSource]
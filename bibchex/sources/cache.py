@@ -0,0 +1,88 @@
+import asyncio
+from collections import OrderedDict
+import logging
+
+LOGGER = logging.getLogger(__name__)
+
+
+class CachedSource(object):
+    """Wraps a data source and caches its query results.
+
+    Results are cached by the source's ``cache_key(entry)``, i.e., by the
+    identifiers (DOI, URL, ISBN, …) that the query actually depends on.
+    Concurrent queries for the same key are only sent once. Every caller
+    receives its own copy of the retrieved suggestions, since suggestions
+    are unified in place afterwards. Failed retrievals are not cached."""
+
+    def __init__(self, source, max_size=10000):
+        self._source = source
+        self._max_size = max_size
+        self._cache = OrderedDict()
+
+    def __getattr__(self, name):
+        return getattr(self._source, name)
+
+    async def close(self):
+        if hasattr(self._source, 'close'):
+            await self._source.close()
+
+    def get_cached(self, entry):
+        """Returns the cached result for *entry* without querying the source,
+        or None if no (successful) result is cached."""
+        key = self._source.cache_key(entry)
+        future = self._cache.get(key) if key is not None else None
+        if future is None or not future.done() or future.cancelled() or \
+           future.exception() is not None:
+            return None
+
+        raw_result = future.result()
+        if CachedSource._has_problem(raw_result):
+            return None
+
+        return CachedSource._copy_result(raw_result, entry)
+
+    async def query(self, entry):
+        key = self._source.cache_key(entry)
+        if key is None:
+            return await self._source.query(entry)
+
+        future = self._cache.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._source.query(entry))
+            self._cache[key] = future
+            while len(self._cache) > self._max_size:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(key)
+
+        try:
+            raw_result = await asyncio.shield(future)
+        except Exception:
+            self._evict(key, future)
+            raise
+
+        if CachedSource._has_problem(raw_result):
+            self._evict(key, future)
+
+        return CachedSource._copy_result(raw_result, entry)
+
+    def _evict(self, key, future):
+        if self._cache.get(key) is future:
+            del self._cache[key]
+
+    @staticmethod
+    def _has_problem(raw_result):
+        if not isinstance(raw_result, list):
+            raw_result = [raw_result]
+
+        return any((retrieval_error for (_, retrieval_error) in raw_result))
+
+    @staticmethod
+    def _copy_result(raw_result, entry):
+        if isinstance(raw_result, list):
+            return [CachedSource._copy_result(r, entry) for r in raw_result]
+
+        (result, retrieval_error) = raw_result
+        if result:
+            result = result.copy_for(entry)
+        return (result, retrieval_error)
@@ -44,6 +44,9 @@ FIELD_MAPPING = {
 
 
 class CrossrefSource(object):
+    NAME = 'crossref'
+    COST = 1
+    SUGGESTION_SOURCES = ('crossref',)
     QUERY_FIELDS = ['doi']
     DOI_URL_RE = re.compile(r'https?://(dx\.)?doi\.org/.*')
 
@@ -160,6 +163,16 @@ class CrossrefSource(object):
 
         return (result, problem)
 
+    def applies_to(self, entry):
+        return entry.get_probable_doi() is not None
+
+    def cache_key(self, entry):
+        doi = entry.get_probable_doi()
+        if not doi:
+            return None
+        # The field mapping depends on the entry type
+        return (doi.lower(), entry.data.get('entrytype'))
+
     async def query(self, entry):
         loop = asyncio.get_event_loop()
         done = False
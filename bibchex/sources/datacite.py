@@ -20,10 +20,23 @@ def path_exists(d, path):
 
 
 class DataCiteSource(object):
+    NAME = 'datacite'
+    COST = 1
+    SUGGESTION_SOURCES = ('datacite',)
+
     def __init__(self, ui):
         self._ratelimit = SyncRateLimiter(100, 60)
         self._ui = ui
 
+    def applies_to(self, entry):
+        return entry.get_probable_doi() is not None
+
+    def cache_key(self, entry):
+        doi = entry.get_probable_doi()
+        if not doi:
+            return None
+        return doi.lower()
+
     async def query(self, entry):
         loop = asyncio.get_event_loop()
 
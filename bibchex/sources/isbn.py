@@ -11,8 +11,18 @@ from bibchex.asyncrate import SyncRateLimiter
 
 
 class ISBNSource(object):
+    NAME = 'isbn'
+    COST = 2
+    PROVIDERS = ('goob', 'openl')
+    SUGGESTION_SOURCES = tuple(('isbn_{}'.format(provider)
+                                for provider in PROVIDERS))
+    # Entry types that can have an ISBN of their own
+    ENTRY_TYPES = ('book', 'inbook', 'incollection', 'booklet',
+                   'proceedings', 'manual', 'collection', 'mvbook',
+                   'reference', 'thesis', 'phdthesis', 'mastersthesis')
+
     def __init__(self, ui):
-        self._providers = set(('goob', 'openl'))
+        self._providers = set(ISBNSource.PROVIDERS)
         self._ratelimit = SyncRateLimiter(100, 60)
         self._ui = ui
 
@@ -22,6 +32,13 @@ class ISBNSource(object):
 
         # TODO detect more providers
 
+    def applies_to(self, entry):
+        return bool(entry.data.get('isbn')) and \
+            entry.data.get('entrytype', '').lower() in ISBNSource.ENTRY_TYPES
+
+    def cache_key(self, entry):
+        return entry.data.get('isbn')
+
     async def query(self, entry):
         loop = asyncio.get_event_loop()
 
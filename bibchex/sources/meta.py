@@ -176,6 +176,10 @@ class MetadataHTMLParser(HTMLParser):
 
 
 class MetaSource(object):
+    NAME = 'meta'
+    # Scraping publisher pages is slow and often runs into captchas
+    COST = 10
+    SUGGESTION_SOURCES = ('meta',)
     DOI_RE = re.compile(r'https?://(dx\.)?doi.org/(?P<doi>.*)')
     HTTP_RE = re.compile(r'https?://.*', re.IGNORECASE)
     # This is sufficient to fool some of the less advanced bot-detection
@@ -197,6 +201,28 @@ class MetaSource(object):
         self._max_retries = 5
         self._retry_pause = 10  # Wait an additional 10 seconds before a retry
 
+        # Shared by all queries. Created lazily, since it must be created
+        # from within the running event loop.
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession()
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def applies_to(self, entry):
+        return bool(entry.data.get('url')) or \
+            entry.get_probable_doi() is not None
+
+    def cache_key(self, entry):
+        return self._sanitize_url(entry.data.get('url'),
+                                  entry.get_probable_doi())
+
     async def query(self, entry):
         problem = None
         result = None
@@ -271,69 +297,69 @@ class MetaSource(object):
         await self._ratelimit.get()
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url,
-                                       headers=MetaSource.HEADERS) as resp:
-                    status = resp.status
-                    if status == 403:
-                        try:
-                            html = await resp.text()
-                            if self._detect_captcha(html):
-                                self._ui.finish_subtask('MetaQuery')
-                                LOGGER.info(
-                                    (f"URL {url} requires a captcha to "
-                                     "be solved. Giving up."))
-                                raise RetrievalProblem(
-                                    (f"URL {url} requires a "
-                                     "captcha to be solved.")
-                                )
-                        except:
-                            pass
-
-                        if retry_number == self._max_retries:
+            session = self._get_session()
+            async with session.get(url,
+                                   headers=MetaSource.HEADERS) as resp:
+                status = resp.status
+                if status == 403:
+                    try:
+                        html = await resp.text()
+                        if self._detect_captcha(html):
                             self._ui.finish_subtask('MetaQuery')
+                            LOGGER.info(
+                                (f"URL {url} requires a captcha to "
+                                 "be solved. Giving up."))
                             raise RetrievalProblem(
-                                (f"URL {url} still results in 403 "
-                                 f"after {self._max_retries} retries."
-                                 " Giving up."))
-                        LOGGER.debug((f"Got a 403 while accessing {url}."
-                                      f" Backing off. "
-                                      f"Retry {retry_number+1}..."))
-                        await self._ratelimit.backoff()
-                        await asyncio.sleep(self._retry_pause)
-                        return await self._execute_query(entry, url,
-                                                         retry_number+1)
+                                (f"URL {url} requires a "
+                                 "captcha to be solved.")
+                            )
+                    except:
+                        pass
 
-                    if status != 200:
+                    if retry_number == self._max_retries:
                         self._ui.finish_subtask('MetaQuery')
                         raise RetrievalProblem(
-                            "Accessing URL {} returns status {}"
-                            .format(url, status))
+                            (f"URL {url} still results in 403 "
+                             f"after {self._max_retries} retries."
+                             " Giving up."))
+                    LOGGER.debug((f"Got a 403 while accessing {url}."
+                                  f" Backing off. "
+                                  f"Retry {retry_number+1}..."))
+                    await self._ratelimit.backoff()
+                    await asyncio.sleep(self._retry_pause)
+                    return await self._execute_query(entry, url,
+                                                     retry_number+1)
+
+                if status != 200:
+                    self._ui.finish_subtask('MetaQuery')
+                    raise RetrievalProblem(
+                        "Accessing URL {} returns status {}"
+                        .format(url, status))
 
-                    try:
-                        html = await resp.text()
-                    except UnicodeDecodeError:
-                        self._ui.finish_subtask('MetaQuery')
-                        raise RetrievalProblem(
-                            f"Content at URL {url} could not be interpreted")
+                try:
+                    html = await resp.text()
+                except UnicodeDecodeError:
+                    self._ui.finish_subtask('MetaQuery')
+                    raise RetrievalProblem(
+                        f"Content at URL {url} could not be interpreted")
 
-                    parser = MetadataHTMLParser(self._ui, str(resp.url))
-                    parser.feed(html)
+                parser = MetadataHTMLParser(self._ui, str(resp.url))
+                parser.feed(html)
 
-                    sugg = Suggestion("meta", entry)
+                sugg = Suggestion("meta", entry)
 
-                    for (k, v) in parser.get_metadata().items():
-                        if isinstance(v, list):
-                            sugg.add_field(k,
-                                           [remove_tags(vi) for vi in v])
-                        else:
-                            sugg.add_field(k, remove_tags(v))
+                for (k, v) in parser.get_metadata().items():
+                    if isinstance(v, list):
+                        sugg.add_field(k,
+                                       [remove_tags(vi) for vi in v])
+                    else:
+                        sugg.add_field(k, remove_tags(v))
 
-                    for (first, last) in parser.get_authors():
-                        sugg.add_author(first, last)
+                for (first, last) in parser.get_authors():
+                    sugg.add_author(first, last)
 
-                    self._ui.finish_subtask('MetaQuery')
-                    return sugg
+                self._ui.finish_subtask('MetaQuery')
+                return sugg
         except asyncio.TimeoutError:
             self._ui.finish_subtask('MetaQuery')
             LOGGER.error(f"Timeout trying to retrieve URL {url}")
@@ -349,53 +375,53 @@ class MetaSource(object):
         await self._doi_ratelimit.get()
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(api_url) as resp:
-                    status = resp.status
-                    if status == 403:
-                        if retry_number == self._max_retries:
-                            raise RetrievalProblem(
-                                (f"URL {api_url} still results in 403 "
-                                 f"after {self._max_retries} retries."
-                                 " Giving up."))
-                        LOGGER.debug(
-                            (f"Got a 403 while accessing {api_url}. "
-                             f" Backing off. Retry {retry_number+1}."))
-                        await self._doi_ratelimit.backoff()
-                        await asyncio.sleep(self._retry_pause)
-                        return await self._execute_doi_query(entry, url,
-                                                             retry_number+1)
-
-                    if status != 200:
-                        self._ui.finish_subtask('MetaQuery')
+            session = self._get_session()
+            async with session.get(api_url) as resp:
+                status = resp.status
+                if status == 403:
+                    if retry_number == self._max_retries:
                         raise RetrievalProblem(
-                            f"Accessing URL {api_url} returns status {status}")
-
-                    try:
-                        data = await resp.json()
-                    except UnicodeDecodeError:
-                        self._ui.finish_subtask('MetaQuery')
-                        raise RetrievalProblem(
-                            (f"Content at URL {api_url} could not "
-                             "be interpreted as JSON"))
-
-                    target_url = None
-                    for val in data.get('values', []):
-                        if val.get('type') == 'URL':
-                            if val['data']['format'] == 'string':
-                                target_url = val['data']['value']
-                            elif val['data']['format'] == 'base64':
-                                target_url = base64.b64decode(
-                                    val['data']['value'])
+                            (f"URL {api_url} still results in 403 "
+                             f"after {self._max_retries} retries."
+                             " Giving up."))
+                    LOGGER.debug(
+                        (f"Got a 403 while accessing {api_url}. "
+                         f" Backing off. Retry {retry_number+1}."))
+                    await self._doi_ratelimit.backoff()
+                    await asyncio.sleep(self._retry_pause)
+                    return await self._execute_doi_query(entry, url,
+                                                         retry_number+1)
 
-                    if target_url:
-                        return await self._execute_query(entry, target_url)
+                if status != 200:
+                    self._ui.finish_subtask('MetaQuery')
+                    raise RetrievalProblem(
+                        f"Accessing URL {api_url} returns status {status}")
 
+                try:
+                    data = await resp.json()
+                except UnicodeDecodeError:
                     self._ui.finish_subtask('MetaQuery')
-                    LOGGER.warn(
-                        (f"DOI-URL {api_url} did not resolve to a "
-                         "URL. Giving up."))
-                    return None
+                    raise RetrievalProblem(
+                        (f"Content at URL {api_url} could not "
+                         "be interpreted as JSON"))
+
+                target_url = None
+                for val in data.get('values', []):
+                    if val.get('type') == 'URL':
+                        if val['data']['format'] == 'string':
+                            target_url = val['data']['value']
+                        elif val['data']['format'] == 'base64':
+                            target_url = base64.b64decode(
+                                val['data']['value'])
+
+                if target_url:
+                    return await self._execute_query(entry, target_url)
+
+                self._ui.finish_subtask('MetaQuery')
+                LOGGER.warn(
+                    (f"DOI-URL {api_url} did not resolve to a "
+                     "URL. Giving up."))
+                return None
         except asyncio.TimeoutError:
             self._ui.finish_subtask('MetaQuery')
             LOGGER.error(f"Timeout trying to retrieve URL {api_url}")
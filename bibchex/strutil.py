@@ -1,4 +1,6 @@
+import math
 import re
+from collections import Counter
 
 
 def split_at_multiple(s, delims):
@@ -61,40 +63,224 @@ def is_allcaps(s):
 
 
 class AbbrevFinder(object):
-    def __init__(self, strings, ignorecase=True):
-        self._strings = strings
+    """Finds all pairs (s1, s2) of strings such that s2 contains the tokens
+    of s1 in order, i.e., s1 could be an abbreviation of s2.
+
+    In indexed mode (the default), only strings that contain every
+    character of the tokens of s1 at least as often as the tokens do are
+    considered. These are looked up in an inverted index from (character,
+    count) to the strings containing the character at least count times.
+    These candidates are verified by matching the tokens greedily, line by
+    line, which never backtracks. The result is the same as
+    searching for the tokens of s1, joined by '.*', in every other
+    string.
+
+    get() can be restricted to the pairs found for some of the strings (as
+    s1), to split the work."""
+
+    def __init__(self, strings, ignorecase=True, indexed=True):
+        self._strings = list(strings)
         self._res = []
-        self._pairs = []
         self._ignorecase = ignorecase
+        self._indexed = indexed
 
-        self._prepare_res()
-        self._find_pairs()
+        if indexed:
+            self._prepare_index()
+        else:
+            self._prepare_res()
+
+    def _tokenize(self, s):
+        tokens = split_at_multiple(s, " .,")
+        return [t for inner_s in tokens for t in split_camelcase(inner_s)]
+
+    def _compile(self, tokens):
+        if self._ignorecase:
+            return re.compile(".*".join((re.escape(t) for t in tokens)),
+                              re.IGNORECASE)
+        else:
+            return re.compile(".*".join((re.escape(t) for t in tokens)))
 
     def _prepare_res(self):
         for s in self._strings:
-            tokens = split_at_multiple(s, " .,")
-            tokens = [
-                t for inner_s in tokens for t in split_camelcase(inner_s)]
-            if self._ignorecase:
-                r = re.compile(".*".join((re.escape(t)
-                                          for t in tokens)), re.IGNORECASE)
-            else:
-                r = re.compile(".*".join((re.escape(t) for t in tokens)))
-            self._res.append((s, r))
+            self._res.append((s, self._compile(self._tokenize(s))))
 
-    def _find_pairs(self):
-        self._pairs = []
-        for (s1, regex) in self._res:
+    def _find_pairs(self, rows):
+        pairs = []
+        for i in rows:
+            (s1, regex) = self._res[i]
             for s2 in self._strings:
-                if ((s1.lower() == s2.lower()) and self._ignorecase) or \
-                   (s1 == s2):
+                if self._is_same(s1, s2):
                     continue
 
                 if regex.search(s2) is not None:
-                    self._pairs.append((s1, s2))
+                    pairs.append((s1, s2))
+        return pairs
+
+    def _is_same(self, s1, s2):
+        return ((s1.lower() == s2.lower()) and self._ignorecase) or \
+            (s1 == s2)
+
+    def _prepare_index(self):
+        # Map every character to a representative of the characters that
+        # the regular expression engine considers equal to it
+        self._fold_map = {}
+        if self._ignorecase:
+            representatives = []
+            for c in sorted(set("".join(self._strings))):
+                for r in representatives:
+                    if re.fullmatch(re.escape(r), c, re.IGNORECASE):
+                        self._fold_map[c] = r
+                        break
+                else:
+                    representatives.append(c)
+                    self._fold_map[c] = c
+
+        self._folded = [self._fold(s) for s in self._strings]
+        self._lower = [s.lower() for s in self._strings]
+        self._index = {}
+        for (i, folded) in enumerate(self._folded):
+            for (c, count) in Counter(folded).items():
+                for k in range(1, count + 1):
+                    self._index.setdefault((c, k), set()).add(i)
+
+    def _fold(self, s):
+        if not self._ignorecase:
+            return s
+        return "".join((self._fold_map[c] for c in s))
+
+    def _find_pairs_indexed(self, rows):
+        pairs = []
+        all_indices = set(range(0, len(self._strings)))
+        for i in rows:
+            s1 = self._strings[i]
+            tokens = [self._fold(t) for t in self._tokenize(s1)]
+            postings = sorted((self._index.get(key, set()) for key
+                               in Counter("".join(tokens)).items()), key=len)
+            if postings:
+                candidates = postings[0].intersection(*postings[1:])
+            else:
+                candidates = all_indices
+
+            if any(('\n' in t for t in tokens)):
+                # The line-wise matching below does not apply
+                regex = self._compile(self._tokenize(s1))
+                matches = lambda j: regex.search(self._strings[j]) is not None
+            else:
+                matches = lambda j: self._match_tokens(tokens, self._folded[j])
+
+            for j in sorted(candidates):
+                if (self._ignorecase and self._lower[i] == self._lower[j]) \
+                   or s1 == self._strings[j]:
+                    continue
+
+                if matches(j):
+                    pairs.append((s1, self._strings[j]))
+        return pairs
+
+    def _match_tokens(self, tokens, s):
+        # '.*' does not match newlines, so all tokens must be in one line
+        for line in s.split('\n'):
+            pos = 0
+            for t in tokens:
+                pos = line.find(t, pos)
+                if pos < 0:
+                    break
+                pos += len(t)
+            else:
+                return True
+
+        return False
+
+    def get(self, rows=None):
+        if rows is None:
+            rows = range(0, len(self._strings))
+        if self._indexed:
+            return self._find_pairs_indexed(rows)
+        return self._find_pairs(rows)
+
+
+class PartialRatioCandidates(object):
+    """Finds all pairs of strings that might have a fuzzy partial ratio (as
+    computed by fuzz.partial_ratio) above *threshold*, without comparing all
+    pairs. Returns the pairs as index pairs (i, j) with i < j, in the order
+    of itertools.combinations. The result is a superset of the pairs above
+    the threshold, and must still be verified.
+
+    A partial ratio above the threshold implies a ratio of at least
+    r = (threshold + 0.5) / 100 between the shorter string (of length a) and
+    a substring of the longer one. That ratio is 2M / (a + b), where M is
+    the number of characters in matching blocks and b <= a is the length of
+    the substring. Thus, the matching blocks leave at most
+    E = floor(2 (1 - r) a) characters unmatched on either side, and each of
+    those destroys at most Q of the a - Q + 1 q-grams of the shorter string.
+    All other q-grams of the shorter string occur in the longer one. Since
+    at least one of any Q * E + 1 q-grams must survive, it suffices to look
+    up the Q * E + 1 rarest q-grams of every string in an inverted index.
+
+    get() can be restricted to the pairs found for some of the strings (as
+    the shorter string of the pair), to split the work. Pairs of strings of
+    equal length may then be found for both of them."""
+
+    Q = 2
+
+    def __init__(self, strings, threshold):
+        self._strings = list(strings)
+        self._min_ratio = (threshold + 0.5) / 100
+
+        self._build_index()
+
+    def _qgrams(self, s):
+        q = PartialRatioCandidates.Q
+        return [s[i:i + q] for i in range(0, len(s) - q + 1)]
+
+    def _build_index(self):
+        self._grams = [self._qgrams(s) for s in self._strings]
+        self._gram_sets = [set(grams) for grams in self._grams]
+        self._index = {}
+        for (i, grams) in enumerate(self._gram_sets):
+            for gram in grams:
+                self._index.setdefault(gram, []).append(i)
+
+    def _max_lost_grams(self, length):
+        max_edits = math.floor(2 * (1 - self._min_ratio) * length)
+        return PartialRatioCandidates.Q * max_edits
+
+    def _find_pairs(self, rows):
+        pairs = set()
+        for i in rows:
+            s = self._strings[i]
+            if len(s) == 0:
+                # Empty strings always have a ratio of 0
+                continue
+
+            grams = self._grams[i]
+            max_lost = self._max_lost_grams(len(s))
+            if len(grams) <= max_lost:
+                # Too short to rule anything out
+                candidates = range(0, len(self._strings))
+            else:
+                rarest = sorted(grams,
+                                key=lambda g: len(self._index[g]))
+                candidates = set((j for gram in rarest[:max_lost + 1]
+                                  for j in self._index[gram]))
+
+            for j in candidates:
+                t = self._strings[j]
+                # Only strings for which s is the shorter one
+                if j == i or len(t) < len(s) or len(t) == 0:
+                    continue
+
+                survivors = sum((1 for gram in grams
+                                 if gram in self._gram_sets[j]))
+                if survivors >= len(grams) - max_lost:
+                    pairs.add((min(i, j), max(i, j)))
+
+        return sorted(pairs)
 
-    def get(self):
-        return self._pairs
+    def get(self, rows=None):
+        if rows is None:
+            rows = range(0, len(self._strings))
+        return self._find_pairs(rows)
 
 
 def flexistrip(s):
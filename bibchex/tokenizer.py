@@ -0,0 +1,334 @@
+import re
+
+from bibtexparser.bibdatabase import COMMON_STRINGS, STANDARD_TYPES
+
+# Whitespace as skipped between tokens by bibtexparser
+WS_RE = re.compile(r'[ \t\n\r]*')
+# The end of a comment: the next '@' at the start of a line
+NEXT_DECLARATION_RE = re.compile(r'\n[ \t\n\r]*@')
+DECLARATION_RE = re.compile(r'@([A-Za-z]*)')
+FIELD_NAME_RE = re.compile(r'[A-Za-z0-9_\-().+]+')
+STRING_NAME_RE = re.compile(r'[A-Za-z0-9_\-:]+')
+INTEGER_RE = re.compile(r'[0-9]+')
+BRACES_RE = re.compile(r'[{}]')
+QUOTED_RE = re.compile(r'[{}"]')
+# A field with a single, unnested braced value (the common case), followed
+# by ',' or '}'
+SIMPLE_FIELD_RE = re.compile(
+    r'[ \t\n\r]*([A-Za-z0-9_\-().+]+)[ \t\n\r]*=[ \t\n\r]*'
+    r'(?:\{([^{}]*)\}|"([^"{}]*)"|([0-9]+))'
+    r'(?=[ \t\n\r]*[,}])')
+
+# The characters str.splitlines() splits at
+LINE_BREAK_RE = re.compile('[\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]')
+
+# Characters that must not follow keywords like '@string'
+KEYWORD_CHARS = frozenset('0123456789_$')
+
+BOM = '\ufeff'
+
+
+class UnsupportedSyntax(Exception):
+    """Exception thrown by the tokenizer for input it cannot handle the same
+    way bibtexparser does. The input must then be parsed by bibtexparser."""
+
+
+class _Malformed(Exception):
+    """Raised for malformed entries, which bibtexparser treats as
+    comments."""
+
+
+def _strip_after_new_lines(s):
+    lines = s.splitlines()
+    if len(lines) > 1:
+        lines = [lines[0]] + [line.lstrip() for line in lines[1:]]
+    return '\n'.join(lines)
+
+
+def _clean(value):
+    if not value or value == '{}':
+        return ''
+    return value
+
+
+class Tokenizer:
+    """A single-pass, regular expression driven BibTeX tokenizer. It
+    produces the same entry dicts as bibtexparser's BibTexParser (with
+    default settings), including the expansion of @string macros.
+
+    Like bibtexparser (through pyparsing), the tokenizer expands tabs to
+    spaces before parsing, to tab stops every 8 columns. Offsets in error
+    messages refer to the expanded text.
+
+    Entries delimited by parentheses, whitespace after an '@' and undefined
+    macros are not supported and raise an UnsupportedSyntax exception.
+
+    *strings* maps the (lower case) names of @string macros to their
+    values. It defaults to bibtexparser's common strings (i.e., the month
+    names). Macros defined in the parsed data are added to it."""
+
+    def __init__(self, text, strings=None):
+        if text.startswith(BOM):
+            text = text[1:]
+        if '\t' in text:
+            text = text.expandtabs()
+        self._text = text
+        self._pos = 0
+        if strings is None:
+            strings = dict(COMMON_STRINGS)
+        self._strings = strings
+
+    def _unsupported(self, msg):
+        raise UnsupportedSyntax("{} at offset {}".format(msg, self._pos))
+
+    def _skip_ws(self):
+        self._pos = WS_RE.match(self._text, self._pos).end()
+
+    def _skip_comment(self):
+        m = NEXT_DECLARATION_RE.search(self._text, self._pos)
+        self._pos = m.end() - 1 if m else len(self._text)
+
+    def _peek(self):
+        self._skip_ws()
+        return self._text[self._pos:self._pos + 1]
+
+    def _open(self):
+        c = self._peek()
+        if c == '(':
+            self._unsupported("Parentheses as delimiters")
+        if c != '{':
+            raise _Malformed()
+        self._pos += 1
+
+    def parse(self):
+        """Returns the list of entry dicts."""
+        text = self._text
+        entries = []
+        while True:
+            self._skip_ws()
+            if self._pos >= len(text):
+                return entries
+
+            if text[self._pos] != '@':
+                self._skip_comment()
+                continue
+
+            start = self._pos
+            m = DECLARATION_RE.match(text, start)
+            kind = m.group(1).lower()
+            following = text[m.end():m.end() + 1]
+            if not kind and following.isspace():
+                self._unsupported("Whitespace after '@'")
+            self._pos = m.end()
+
+            if not kind or following in KEYWORD_CHARS:
+                self._skip_comment()
+            elif kind == 'comment':
+                self._skip_ws()
+                self._skip_comment()
+            elif kind == 'preamble':
+                self._parse_preamble()
+            elif kind == 'string':
+                self._parse_string()
+            else:
+                try:
+                    entry = self._parse_entry(kind)
+                except _Malformed:
+                    # bibtexparser skips the whole entry as a comment
+                    self._pos = start
+                    self._skip_comment()
+                    continue
+                if entry is not None:
+                    entries.append(entry)
+
+    def _parse_preamble(self):
+        try:
+            self._open()
+            if INTEGER_RE.match(self._text, self._pos):
+                self._pos = INTEGER_RE.match(self._text, self._pos).end()
+            else:
+                self._parse_expression()
+            if self._peek() != '}':
+                raise _Malformed()
+        except _Malformed:
+            self._unsupported("Malformed @preamble")
+        self._pos += 1
+
+    def _parse_string(self):
+        try:
+            self._open()
+            self._skip_ws()
+            m = STRING_NAME_RE.match(self._text, self._pos)
+            if not m:
+                raise _Malformed()
+            self._pos = m.end()
+            if self._peek() != '=':
+                raise _Malformed()
+            self._pos += 1
+            parts = self._parse_expression()
+            if self._peek() != '}':
+                raise _Malformed()
+        except _Malformed:
+            self._unsupported("Malformed @string")
+        self._pos += 1
+
+        if len(parts) == 1 and not parts[0][0]:
+            value = _clean(parts[0][1])
+        else:
+            value = self._expand(parts)
+        self._strings[m.group(0).lower()] = value
+
+    def _parse_entry(self, entry_type):
+        text = self._text
+        self._open()
+
+        comma = text.find(',', self._pos)
+        if comma < 0:
+            raise _Malformed()
+        key = text[self._pos:comma].strip()
+        if not key or any((c.isspace() for c in key)):
+            raise _Malformed()
+        self._pos = comma + 1
+
+        pairs = []
+        while True:
+            m = SIMPLE_FIELD_RE.match(text, self._pos)
+            if m:
+                self._pos = m.end()
+                value = m.group(2)
+                if value is None:
+                    value = m.group(3)
+                    if value is None:
+                        value = m.group(4)
+                if LINE_BREAK_RE.search(value):
+                    value = _strip_after_new_lines(value)
+                pairs.append((m.group(1), value))
+            else:
+                pairs.append(self._parse_field())
+
+            c = self._peek()
+            if c == ',':
+                self._pos += 1
+                if self._peek() == '}':
+                    self._pos += 1
+                    break
+            elif c == '}':
+                self._pos += 1
+                break
+            else:
+                raise _Malformed()
+
+        if entry_type not in STANDARD_TYPES:
+            return None
+
+        # Like bibtexparser: of repeated fields, the first one wins
+        fields = {k: v for (k, v) in reversed(pairs)}
+        entry = {}
+        for (name, value) in fields.items():
+            if isinstance(value, list):
+                entry[name.lower()] = self._expand(value)
+            else:
+                entry[name.lower()] = _clean(value)
+        entry['ENTRYTYPE'] = entry_type
+        entry['ID'] = key
+        return entry
+
+    def _parse_field(self):
+        """Parses a field with a value that is not a single unnested
+        value. Returns a (name, value) tuple, where value is either a
+        string or a list of (is_macro, string) parts."""
+        self._skip_ws()
+        m = FIELD_NAME_RE.match(self._text, self._pos)
+        if not m:
+            raise _Malformed()
+        self._pos = m.end()
+        if self._peek() != '=':
+            raise _Malformed()
+        self._pos += 1
+        self._skip_ws()
+
+        m_int = INTEGER_RE.match(self._text, self._pos)
+        if m_int:
+            self._pos = m_int.end()
+            return (m.group(0), m_int.group(0))
+
+        parts = [(is_macro, value if is_macro
+                  else _strip_after_new_lines(value))
+                 for (is_macro, value) in self._parse_expression()]
+        if len(parts) == 1 and not parts[0][0]:
+            return (m.group(0), parts[0][1])
+        return (m.group(0), parts)
+
+    def _parse_expression(self):
+        """Parses a '#'-separated list of braced values, quoted values and
+        macro names. Returns a list of (is_macro, string) tuples."""
+        parts = []
+        while True:
+            c = self._peek()
+            if c == '{':
+                parts.append((False, self._parse_braced()))
+            elif c == '"':
+                parts.append((False, self._parse_quoted()))
+            else:
+                m = STRING_NAME_RE.match(self._text, self._pos)
+                if not m:
+                    raise _Malformed()
+                self._pos = m.end()
+                parts.append((True, m.group(0).lower()))
+
+            if self._peek() != '#':
+                return parts
+            self._pos += 1
+
+    def _parse_braced(self):
+        """Parses a value in (balanced) braces, starting at the opening
+        brace, and returns its contents."""
+        start = self._pos
+        depth = 0
+        for m in BRACES_RE.finditer(self._text, start):
+            if m.group(0) == '{':
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    self._pos = m.end()
+                    return self._text[start + 1:self._pos - 1]
+        raise _Malformed()
+
+    def _parse_quoted(self):
+        """Parses a value in quotes, starting at the opening quote, and
+        returns its contents. Quotes within braces do not end the value."""
+        start = self._pos
+        depth = 0
+        for m in QUOTED_RE.finditer(self._text, start + 1):
+            c = m.group(0)
+            if c == '{':
+                depth += 1
+            elif c == '}':
+                depth -= 1
+                if depth < 0:
+                    raise _Malformed()
+            elif depth == 0:
+                self._pos = m.end()
+                return self._text[start + 1:self._pos - 1]
+        raise _Malformed()
+
+    def _expand(self, parts):
+        try:
+            return ''.join((self._strings[value] if is_macro else value
+                            for (is_macro, value) in parts))
+        except KeyError as e:
+            self._unsupported("Undefined macro {}".format(e))
+
+
+def tokenize(text, strings=None):
+    """Parses the BibTeX data in *text* and returns a list of entry dicts,
+    like bibtexparser does. See Tokenizer for *strings*. Raises an
+    UnsupportedSyntax exception if the data must be parsed by bibtexparser
+    instead, in which case *strings* is left unchanged."""
+    working_strings = dict(COMMON_STRINGS) if strings is None \
+        else dict(strings)
+    entries = Tokenizer(text, working_strings).parse()
+    if strings is not None:
+        strings.update(working_strings)
+    return entries
@@ -66,9 +66,128 @@ class UnificationRule:
         return rule
 
 
+def _prefix_group_names(pattern, prefix):
+    """Prefixes the names of all named groups (and references to them) in
+    the regular expression *pattern*. Returns None if the pattern refers to
+    groups by number, which would change once it is embedded in another
+    expression."""
+    out = []
+    i = 0
+    in_class = False
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\':
+            if pattern[i + 1:i + 2] in tuple('123456789'):
+                return None
+            out.append(pattern[i:i + 2])
+            i += 2
+            continue
+
+        if in_class:
+            if c == ']':
+                in_class = False
+        elif c == '[':
+            in_class = True
+            # A ']' directly at the start of a class is a literal
+            if pattern[i + 1:i + 2] == '^':
+                out.append('[^')
+                i += 2
+            else:
+                out.append('[')
+                i += 1
+            if pattern[i:i + 1] == ']':
+                out.append(']')
+                i += 1
+            continue
+        elif pattern.startswith('(?P<', i) or pattern.startswith('(?P=', i):
+            out.append(pattern[i:i + 4] + prefix)
+            i += 4
+            continue
+        elif pattern.startswith('(?(', i):
+            if pattern[i + 3:i + 4].isdigit():
+                return None
+            out.append('(?(' + prefix)
+            i += 3
+            continue
+
+        out.append(c)
+        i += 1
+
+    return "".join(out)
+
+
+class RuleSet:
+    """The sorted, compiled unification rules for one field.
+
+    With *combined* set, the patterns of all rules are also compiled into a
+    single expression consisting of one optional lookahead per rule. Matching
+    it against a value yields all rules whose pattern matches the value in
+    a single pass, instead of trying every pattern in turn. Rules that
+    cannot be embedded (e.g., because they refer to groups by number) are
+    tried separately.
+
+    The results of applying the rules are memoized per distinct value, since
+    the same values (e.g., venues) occur in many entries and suggestions."""
+
+    MEMO_SIZE = 10000
+
+    def __init__(self, rules, combined=False):
+        self.rules = sorted(rules, key=lambda rule: rule.priority)
+        self._combined = None
+        self._separate = []
+        self._memo = {}
+
+        if combined:
+            self._compile_combined()
+
+    def _compile_combined(self):
+        parts = []
+        for (i, rule) in enumerate(self.rules):
+            pattern = _prefix_group_names(rule.pattern.pattern, f"_r{i}_")
+            part = f"(?:(?=(?P<_rule{i}>{pattern}))|)"
+            try:
+                if pattern is None or \
+                   re.compile(part).groups != rule.pattern.groups + 1:
+                    raise re.error("Rule cannot be embedded")
+            except re.error:
+                self._separate.append(i)
+                continue
+            parts.append((i, part))
+
+        try:
+            self._combined = re.compile("".join((part for (_, part)
+                                                 in parts)))
+            self._embedded = [i for (i, _) in parts]
+        except re.error:
+            self._combined = None
+            self._separate = []
+
+    def matching(self, value):
+        """Returns the set of indices of the rules whose pattern matches
+        *value*, or None if not known."""
+        if self._combined is None:
+            return None
+
+        m = self._combined.match(value)
+        matching = set((i for i in self._embedded
+                        if m.start(f"_rule{i}") != -1))
+        matching.update((i for i in self._separate
+                         if self.rules[i].pattern.match(value)))
+        return matching
+
+    def get_memoized(self, value, kind):
+        return self._memo.get((value, kind))
+
+    def memoize(self, value, kind, result):
+        if len(self._memo) >= RuleSet.MEMO_SIZE:
+            self._memo.clear()
+        self._memo[(value, kind)] = result
+
+
 class Unifier:
     def __init__(self):
         self._cfg = Config()
+        self._rule_sets = {}
 
     def _apply_rule(self, rule, data):
         m = rule.pattern.match(data)
@@ -76,86 +195,94 @@ class Unifier:
             return rule.output.format(**m.groupdict())
         return None
 
-    # TODO cache this somehow?
     def _get_rules_for(self, field, entry):
         raw_rules = self._cfg.get(f"unify_{field}", entry, [])
-        rules = [UnificationRule.parse(raw_rule) for raw_rule in raw_rules]
-        rules.sort(key=lambda rule: rule.priority)
+        if not raw_rules:
+            return RuleSet([])
+
+        combined = self._cfg.get('unify_combined_dispatch', entry, False)
+        # The rules only depend on the effective (sub-)config, which always
+        # returns the same list for them
+        key = (field, id(raw_rules), combined)
+        cached = self._rule_sets.get(key)
+        if cached is None or cached[0] is not raw_rules:
+            rule_set = RuleSet(
+                [UnificationRule.parse(raw_rule) for raw_rule in raw_rules],
+                combined=combined)
+            cached = (raw_rules, rule_set)
+            self._rule_sets[key] = cached
+
+        return cached[1]
+
+    def _apply_rules(self, rule_set, value, kind):
+        """Applies the rules of *rule_set* to *value* of kind *kind*. Returns
+        the new value, its kind and whether any rule was applied."""
+        result = rule_set.get_memoized(value, kind)
+        if result is None:
+            result = self._apply_rules_uncached(rule_set, value, kind)
+            rule_set.memoize(value, kind, result)
+        return result
+
+    def _apply_rules_uncached(self, rule_set, value, kind):
+        modified = False
+        matching = rule_set.matching(value)
+
+        finalized = False
+        for (i, rule) in enumerate(rule_set.rules):
+            repeat_done = False
+            while not repeat_done:
+                if (kind == Suggestion.KIND_RE
+                        and not rule.apply_to_re):
+                    break  # out of repeat-loop
+
+                repeat_done |= not rule.repeat
+
+                if matching is not None and i not in matching:
+                    res = None
+                else:
+                    res = self._apply_rule(rule, value)
+                if res:
+                    modified = True
+                    value = res
+                    kind = rule.kind
+                    matching = rule_set.matching(value)
+                    if rule.final:
+                        finalized = True
+                        break  # out of repeat-loop
+                else:
+                    repeat_done = True
+            if finalized:
+                break  # out of rule-loop
 
-        return rules
+        return (value, kind, modified)
 
     def unify_entry(self, entry):
         '''Returns change suggestions to unify the fields in the entry.'''
         suggestion = Suggestion('unifier', entry)
         for field in entry.data.keys():
-            rules = self._get_rules_for(field, entry)
-            modified = False
-
-            current_value = entry.data[field]
-            current_kind = Suggestion.KIND_PLAIN
-
-            finalized = False
-            for rule in rules:
-                repeat_done = False
-                while not repeat_done:
-                    if (current_kind == Suggestion.KIND_RE
-                            and not rule.apply_to_re):
-                        break  # out of repeat-loop
-
-                    repeat_done |= not rule.repeat
-
-                    res = self._apply_rule(rule, current_value)
-                    if res:
-                        modified = True
-                        current_value = res
-                        current_kind = rule.kind
-                        if rule.final:
-                            finalized = True
-                            break  # out of repeat-loop
-                    else:
-                        repeat_done = True
-                if finalized:
-                    break  # out of rule-loop
+            rule_set = self._get_rules_for(field, entry)
+            if not rule_set.rules:
+                continue
 
+            (value, kind, modified) = self._apply_rules(
+                rule_set, entry.data[field], Suggestion.KIND_PLAIN)
             if modified:
-                suggestion.add_field(field, current_value, kind=current_kind)
+                suggestion.add_field(field, value, kind=kind)
 
         return suggestion
 
-    def unify_suggestion(self, suggestion):
+    def unify_suggestion(self, suggestion, fields=None):
         '''Changes the suggestion from a data source to conform to
-           the unified form.'''
+           the unified form. If *fields* is given, only these fields are
+           unified (see Differ.compared_fields).'''
         for (field, suggestions) in suggestion.data.items():
-            rules = self._get_rules_for(field, suggestion.get_entry())
-            modified = []
-
-            for (d, kind) in suggestions:
-                current_value = d
-                current_kind = kind
-
-                finalized = False
-                for rule in rules:
-                    repeat_done = False
-                    while not repeat_done:
-                        if (current_kind == Suggestion.KIND_RE
-                                and not rule.apply_to_re):
-                            break  # out of repeat-loop
-
-                        repeat_done |= not rule.repeat
-
-                        res = self._apply_rule(rule, current_value)
-                        if res:
-                            current_value = res
-                            current_kind = rule.kind
-                            if rule.final:
-                                finalized = True
-                                break  # out of repeat-loop
-                        else:
-                            repeat_done = True
-
-                    if finalized:
-                        break  # out of rule-loop
-
-                modified.append((current_value, current_kind))
-
-                suggestion.data[field] = modified
+            if fields is not None and field not in fields:
+                continue
+
+            rule_set = self._get_rules_for(field, suggestion.get_entry())
+            if not rule_set.rules:
+                continue
+
+            suggestion.data[field] = [
+                self._apply_rules(rule_set, d, kind)[:2]
+                for (d, kind) in suggestions]
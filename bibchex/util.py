@@ -1,5 +1,5 @@
-import math
-import itertools
+from functools import lru_cache
+import re
 from datetime import datetime
 
 from dateutil.parser import parse as datetime_parser
@@ -124,33 +124,70 @@ def count_preceding_backslashes(s, pos):
 
 
 def unbrace(s):
-    index = 0
-    while index >= 0:
-        index = s.find('{', index)
-        if index < 0:
-            break
-
-        nback = count_preceding_backslashes(s, index)
-        if nback % 2 == 0:
-            # Found one. Remove it.
-            s = s[:index] + s[index+1:]
-
-    index = 0
-    while index >= 0:
-        index = s.find('}', index)
-        if index < 0:
-            break
-
-        nback = count_preceding_backslashes(s, index)
-        if nback % 2 == 0:
-            # Found one. Remove it.
-            s = s[:index] + s[index+1:]
-
-    return s
-
-
+    """Removes all braces from *s* that are not escaped by a backslash."""
+    out = []
+    backslashes = 0
+    for c in s:
+        if c in '{}' and backslashes % 2 == 0:
+            # Removed braces do not end a run of backslashes
+            continue
+        if c == '\\':
+            backslashes += 1
+        else:
+            backslashes = 0
+        out.append(c)
+
+    return "".join(out)
+
+
+def _build_latex_token_re():
+    # Every (live) TeX sequence from LATEX_ACCENTS, allowing for braces
+    # between its characters, which unbrace() would have removed. A
+    # backslash followed by a brace escapes the brace instead.
+    alternatives = [r'\\[{}]']
+    for tex in sorted(ACCENT_LOOKUP.keys(), key=len, reverse=True):
+        if '{' in tex or '}' in tex or '$' in tex or tex in ('``', "''"):
+            # These can never match after unbrace(), or must be handled by
+            # the sequential translation.
+            continue
+        parts = [re.escape(tex[0])]
+        for (prev, c) in zip(tex, tex[1:]):
+            if prev != '\\':
+                parts.append('[{}]*')
+            parts.append(re.escape(c))
+        alternatives.append("".join(parts))
+    alternatives.append('[{}]')
+    # The lookahead quickly skips all positions that cannot start a token
+    return re.compile(r"(?=[\\`',{}])(?:" + '|'.join(alternatives) + ')')
+
+
+LATEX_TOKEN_RE = _build_latex_token_re()
+LATEX_TOKENS = dict(ACCENT_LOOKUP, **{'{': '', '}': '',
+                                      '\\{': '{', '\\}': '}'})
+UNBRACE_TABLE = str.maketrans('', '', '{}')
+
+
+def _replace_latex_token(m):
+    token = m.group(0)
+    plain = LATEX_TOKENS.get(token)
+    if plain is None:
+        plain = ACCENT_LOOKUP[token.translate(UNBRACE_TABLE)]
+    return plain
+
+
+@lru_cache(maxsize=65536)
 def unlatexify(s):
-    return translate_accents(unbrace(s))
+    """Removes braces from *s* and translates the TeX sequences for accents
+    and special characters. Equivalent to translate_accents(unbrace(s)),
+    but done in a single scan of the string. Only strings containing escaped
+    backslashes or math mode, where translate_accents() may translate the
+    results of earlier translations, are translated sequentially."""
+    if '\\' not in s and '`' not in s and "'" not in s and ',' not in s:
+        return s.translate(UNBRACE_TABLE)
+    if '\\\\' in s or '$' in s:
+        return translate_accents(unbrace(s))
+
+    return LATEX_TOKEN_RE.sub(_replace_latex_token, s)
 
 
 def unify_hyphens(s):
@@ -207,17 +244,6 @@ def contains_abbreviation(s, acceptable=set()):
                  w not in acceptable) for w in words))
 
 
-def chunked_pairs(items, chunk_count, chunk_number):
-    # TODO this is very inefficient. Compute indices and create a generator!
-    combinations = list(itertools.combinations(items, 2))
-    chunk_size = max(int(math.floor(len(combinations) / chunk_count)), 1)
-
-    if chunk_number < chunk_count-1:
-        return combinations[chunk_size * chunk_number:chunk_size * (chunk_number + 1)]
-    else:
-        return combinations[chunk_size * chunk_number:]
-
-
 def sorted_pairs(iterable):
     s = sorted(iterable)
     return ((s[i], s[j]) for i in range(0, len(s)) for j in range(i+1, len(s)))
@@ -0,0 +1,33 @@
+import os
+import subprocess
+
+
+class VCSError(Exception):
+    """Exception thrown if a file could not be retrieved from version
+    control."""
+
+
+def _git(args, cwd):
+    try:
+        result = subprocess.run(['git'] + args, cwd=cwd,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE,
+                                universal_newlines=True, check=True)
+    except OSError as e:
+        raise VCSError("Could not run git: {}".format(e))
+    except subprocess.CalledProcessError as e:
+        raise VCSError("git {} failed: {}".format(" ".join(args),
+                                                  e.stderr.strip()))
+    return result.stdout
+
+
+def git_show(filename, rev):
+    """Returns the content of *filename* at the git revision *rev*, or None
+    if the file did not exist at that revision."""
+    directory = os.path.dirname(os.path.abspath(filename))
+    name = os.path.basename(filename)
+
+    if not _git(['ls-tree', '--name-only', rev, '--', name], directory):
+        return None
+
+    return _git(['show', '{}:./{}'.format(rev, name)], directory)
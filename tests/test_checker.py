@@ -0,0 +1,390 @@
+import json
+import subprocess
+
+from testutils import FakeDoiSource, FakeSource, make_entry, set_config
+
+from bibchex.checker import Checker, MultiChecker, changed_keys
+from bibchex.data import Suggestion
+from bibchex.output import JSONOutput
+from bibchex.shard import ShardMerger
+from bibchex.sources import (CrossrefSource, DataCiteSource, ISBNSource,
+                             MetaSource)
+from bibchex.parsing import SourceIndex
+from bibchex.ui import UI
+from bibchex.vcs import git_show
+
+BIBTEX = """@article{original,
+ title={Linear Work Generation of {R-MAT} Graphs},
+ author={Lukas Barth and Dorothea Wagner},
+ journal={Network Science}
+}
+
+@article{other,
+ title={Shifting Consumption to Improve Load Balancing},
+ author={Lukas Barth and Dorothea Wagner}
+}
+
+@article{third,
+ title={Something Else Entirely},
+ author={Jane Doe}
+}
+"""
+
+
+def make_checker(path, out_path='/dev/null', **kwargs):
+    UI.select_silent()
+    c = Checker(path, out_path, sources=[],
+                doi_source=FakeDoiSource(failing=('other',)), **kwargs)
+    c._output = lambda: None
+    return c
+
+
+def run_fresh(path, main_loop):
+    c = make_checker(path)
+    main_loop.run_until_complete(c.run())
+    return c
+
+
+async def start_watching(c):
+    # What watch() does before it waits for changes
+    c._index = SourceIndex(c._fname)
+    await c.run()
+    c._warm_global_checks = True
+
+
+def results(c):
+    return (sorted((p.entry_id, p.source, p.message) for p in c._problems),
+            sorted((p.source, p.message) for p in c._global_problems),
+            sorted(c._entries.keys()),
+            sorted(c._retrieval_errors.items()))
+
+
+class TestWatch:
+    def test_changed_entry(self, tmpdir, event_loop):
+        set_config({'check_duplicate_entries': True,
+                    'check_journal_similarity': True,
+                    'check_has_title': True})
+        bibfile = tmpdir.join('watched.bib')
+        bibfile.write(BIBTEX)
+
+        c = make_checker(str(bibfile))
+        event_loop.run_until_complete(start_watching(c))
+        assert not c._global_problems
+
+        # The third entry becomes a duplicate of the first one
+        bibfile.write(BIBTEX.replace(
+            "title={Something Else Entirely},\n author={Jane Doe}",
+            "title={Linear Work Generation of R-MAT Graphs},\n"
+            " author={Lukas Barth and Dorothea Wagner},\n"
+            " journal={Network Sciences}"))
+        event_loop.run_until_complete(c._recheck())
+
+        assert results(c) == results(run_fresh(str(bibfile), event_loop))
+        messages = [p.message for p in c._global_problems]
+        assert "Entries 'original' and 'third' seem to be duplicates." \
+            in messages
+        assert any(("'Network Science'" in message for message in messages))
+
+    def test_removed_entry(self, tmpdir, event_loop):
+        set_config({'check_duplicate_entries': True,
+                    'check_has_title': True})
+        bibfile = tmpdir.join('watched.bib')
+        bibfile.write(BIBTEX + "@article{copy,\n title={Linear Work "
+                      "Generation of {R-MAT} Graphs},\n author={Lukas "
+                      "Barth and Dorothea Wagner}\n}\n")
+
+        c = make_checker(str(bibfile))
+        event_loop.run_until_complete(start_watching(c))
+        assert c._global_problems
+        assert 'other' in c._retrieval_errors
+
+        bibfile.write(BIBTEX.replace(
+            "@article{other,\n title={Shifting Consumption to Improve "
+            "Load Balancing},\n author={Lukas Barth and Dorothea Wagner}\n}",
+            ""))
+        event_loop.run_until_complete(c._recheck())
+
+        assert results(c) == results(run_fresh(str(bibfile), event_loop))
+        assert not c._global_problems
+        assert 'other' not in c._retrieval_errors
+
+    def test_raw_entries(self, tmpdir, event_loop):
+        set_config({})
+        bibfile = tmpdir.join('watched.bib')
+        bibfile.write(BIBTEX)
+
+        # Only watch mode needs the entry dicts after parsing
+        assert run_fresh(str(bibfile), event_loop)._raw_entries == {}
+        c = make_checker(str(bibfile))
+        event_loop.run_until_complete(start_watching(c))
+        assert sorted(c._raw_entries.keys()) == sorted(c._entries.keys())
+
+    def test_parse_error(self, tmpdir, event_loop):
+        set_config({'check_has_title': True})
+        bibfile = tmpdir.join('watched.bib')
+        bibfile.write(BIBTEX)
+
+        c = make_checker(str(bibfile))
+        event_loop.run_until_complete(start_watching(c))
+        before = results(c)
+
+        # Saved in the middle of an edit, with an undefined macro
+        bibfile.write(BIBTEX + "@article{new, title = undefinedmacro}\n")
+        event_loop.run_until_complete(c._recheck())
+        assert results(c) == before
+
+
+def retrieve(sources, main_loop,
+             bibtex="@article{entry,\n title={A Title}\n}"):
+    UI.select_silent()
+    c = Checker(None, None, text=bibtex, sources=sources,
+                doi_source=FakeDoiSource())
+    c._load_entries()
+    c._unify()
+    main_loop.run_until_complete(c._retrieve())
+    return c
+
+
+class TestRetrieval:
+    def test_cost_order(self, event_loop):
+        set_config({'stop_when_covered': False,
+                    'source_costs': {'expensive': 0}})
+        log = []
+        sources = [FakeSource(name, key_field=None, cost=cost, log=log)
+                   for (name, cost)
+                   in (('slow', 3), ('cheap', 1), ('medium', 2),
+                       ('expensive', 10))]
+        retrieve(sources, event_loop)
+        assert log == ['expensive', 'cheap', 'medium', 'slow']
+
+    def test_stop_when_covered(self, event_loop):
+        set_config({'wanted': ['title', 'year']})
+        log = []
+        # The year is missing from the entry, so the title alone does not
+        # cover it
+        sources = [FakeSource(name, fields, key_field=None, cost=cost, log=log)
+                   for (name, cost, fields)
+                   in (('first', 1, {'title': "A  title"}),
+                       ('second', 2, {'year': 2020}),
+                       ('third', 3, {}))]
+        retrieve(sources, event_loop)
+        assert log == ['first', 'second']
+
+        set_config({'wanted': ['title', 'year'], 'stop_when_covered': False})
+        log.clear()
+        retrieve(sources, event_loop)
+        assert log == ['first', 'second', 'third']
+
+    def test_stop_with_default_config(self, event_loop):
+        set_config({}, keep_sub=True)
+        bibtex = ("@article{entry,\n title={A Title},\n author={Jane Doe},\n"
+                  " year={2020},\n volume={3}\n}")
+        fields = {'title': "A Title", 'year': "2020", 'volume': "3"}
+        log = []
+        first = FakeSource('first', fields, key_field=None, cost=1, log=log,
+                           authors=[("Jane", "Doe")])
+        first_with_journal = FakeSource(
+            'first', dict(fields, journal="Some Journal"), key_field=None,
+            cost=1, log=log, authors=[("Jane", "Doe")])
+        second = FakeSource('second', key_field=None, cost=2, log=log)
+
+        # The journal is required for articles, but missing so far
+        retrieve([first, second], event_loop, bibtex)
+        assert log == ['first', 'second']
+
+        # Wanted fields that do not apply to the entry (e.g., the ISBN) do
+        # not need to be covered
+        log.clear()
+        retrieve([first_with_journal, second], event_loop, bibtex)
+        assert log == ['first']
+
+    def test_is_covered(self, event_loop):
+        set_config({'wanted': ['title', 'author'],
+                    'sources_required_agreement': 2})
+        c = retrieve([], event_loop)
+        [entry] = c._entries.values()
+        assert not c._is_covered(entry)
+
+        def add(name, fields, authors=()):
+            s = Suggestion(name, entry)
+            for (k, v) in fields.items():
+                s.add_field(k, v)
+            for author in authors:
+                s.add_author(*author)
+            c._add_retrieval_result(entry, (s, None))
+
+        add('first', {'title': "A Title"}, [('Jane', 'Doe')])
+        assert not c._is_covered(entry)
+        add('second', {'title': "a  title"})
+        # The entry has no authors, but they are wanted
+        assert not c._is_covered(entry)
+        add('third', {}, [('Jane', 'Doe')])
+        assert c._is_covered(entry)
+
+        set_config({'wanted': ['title', 'author'], 'forbidden': ['author'],
+                    'sources_required_agreement': 3})
+        assert not c._is_covered(entry)
+        add('fourth', {'title': "A Title"})
+        assert c._is_covered(entry)
+
+    def test_applies_to(self):
+        set_config({})
+        UI.select_silent()
+        ui = UI()
+        article = make_entry({'title': "A Title"})
+        with_doi = make_entry({'doi': '10.1000/1'})
+        with_url = make_entry({'url': 'https://example.com'})
+        book = make_entry({'isbn': '9780262033848'}, entrytype='book')
+        article_isbn = make_entry({'isbn': '9780262033848'})
+        found_doi = make_entry({})
+        found_doi.add_suggested_doi('10.1000/2')
+
+        expected = {
+            CrossrefSource: [with_doi, found_doi],
+            DataCiteSource: [with_doi, found_doi],
+            MetaSource: [with_doi, with_url, found_doi],
+            ISBNSource: [book],
+        }
+        for (SourceClass, applicable) in expected.items():
+            source = SourceClass(ui)
+            for entry in (article, with_doi, with_url, book, article_isbn,
+                          found_doi):
+                assert source.applies_to(entry) == (entry in applicable), \
+                    (SourceClass.NAME, entry.data)
+
+
+def git(repo, *args):
+    subprocess.run(['git', '-c', 'user.name=Test',
+                    '-c', 'user.email=test@example.com'] + list(args),
+                   cwd=str(repo), check=True, stdout=subprocess.PIPE,
+                   stderr=subprocess.PIPE)
+
+
+def changed_since(path, rev):
+    c = make_checker(path, changed_since=rev)
+    c._parse()
+    return [entry.get_id() for entry in c._get_changed_entries(rev)]
+
+
+class TestChangedSince:
+    def test_changed_keys(self):
+        old = {'a': {'ID': 'a', 'title': 'A'}, 'b': {'ID': 'b', 'title': 'B'}}
+        new = {'a': {'ID': 'a', 'title': 'A'}, 'b': {'ID': 'b', 'title': 'C'},
+               'c': {'ID': 'c', 'title': 'C'}}
+        assert changed_keys(old, new) == {'b', 'c'}
+        assert changed_keys(new, old) == {'b'}
+
+    def test_git_revision(self, tmpdir):
+        set_config({})
+        git(tmpdir, 'init', '-q')
+        bibfile = tmpdir.join('refs.bib')
+        bibfile.write(BIBTEX)
+        git(tmpdir, 'add', 'refs.bib')
+        git(tmpdir, 'commit', '-q', '-m', 'Add references')
+
+        bibfile.write(BIBTEX.replace("Jane Doe", "John Doe") +
+                      "@article{new,\n title={New}\n}\n")
+        assert changed_since(str(bibfile), 'HEAD') == ['third', 'new']
+
+        # The order of the entries does not matter
+        bibfile.write(BIBTEX.split("@article{third")[0].replace(
+            "@article{original", "@article{third,\n title={Something Else "
+            "Entirely},\n author={Jane Doe}\n}\n\n@article{original"))
+        assert changed_since(str(bibfile), 'HEAD') == []
+
+    def test_new_file(self, tmpdir):
+        set_config({})
+        git(tmpdir, 'init', '-q')
+        tmpdir.join('other.bib').write(BIBTEX)
+        git(tmpdir, 'add', 'other.bib')
+        git(tmpdir, 'commit', '-q', '-m', 'Add other references')
+
+        bibfile = tmpdir.join('refs.bib')
+        bibfile.write(BIBTEX)
+        assert git_show(str(bibfile), 'HEAD') is None
+        assert changed_since(str(bibfile), 'HEAD') == \
+            ['original', 'other', 'third']
+
+
+def comparable(report):
+    """The report data, without the time and the order of problems and
+    differences within an entry."""
+    for entry in report['entries']:
+        for k in ('problems', 'differences'):
+            entry[k] = sorted(entry[k], key=repr)
+    report['global_problems'] = sorted(report['global_problems'], key=repr)
+    del report['now']
+    return report
+
+
+class TestShards:
+    def test_merge(self, tmpdir, event_loop):
+        set_config({'check_duplicate_entries': True,
+                    'check_journal_similarity': True,
+                    'check_has_title': True,
+                    'check_author_names_firstinitial': True})
+        bibfile = tmpdir.join('refs.bib')
+        # Duplicates and similar journal names across the shards
+        bibfile.write(BIBTEX + """
+@article{copy,
+ title={Linear Work Generation of {R-MAT} Graphs},
+ author={L. Barth and Dorothea Wagner}
+}
+
+@article{sciences,
+ author={Jane Doe},
+ journal={Network Sciences}
+}
+""")
+
+        shard_files = []
+        for i in range(2):
+            shard_file = str(tmpdir.join('shard{}.json'.format(i)))
+            c = make_checker(str(bibfile), shard_file, shard=(i, 2))
+            event_loop.run_until_complete(c.run())
+            assert c._entries
+            shard_files.append(shard_file)
+
+        merged_file = str(tmpdir.join('merged.json'))
+        event_loop.run_until_complete(
+            ShardMerger(shard_files, merged_file).run())
+        with open(merged_file) as f:
+            merged = json.load(f)
+
+        c = run_fresh(str(bibfile), event_loop)
+        unsharded = c.get_output(JSONOutput).get_data()
+        assert unsharded['global_problems']
+        assert comparable(merged) == comparable(unsharded)
+
+
+class TestMultiChecker:
+    def test_shared_retrieval(self, tmpdir, event_loop):
+        set_config({})
+        UI.select_silent()
+        first = tmpdir.join('first.bib')
+        first.write("@article{a,\n title={Some Title},\n year={2018},\n"
+                    " url={https://example.com/a}\n}\n")
+        second = tmpdir.join('second.bib')
+        second.write("@article{b,\n title={Some Title},\n year={2018},\n"
+                     " url={https://example.com/b}\n}\n")
+
+        sources = [FakeSource('bydoi', key_field='doi'),
+                   FakeSource('byurl', key_field='url')]
+
+        mc = MultiChecker([str(first), str(second)],
+                          [str(tmpdir.join('first.html')),
+                           str(tmpdir.join('second.html'))],
+                          sources=sources,
+                          doi_source=FakeDoiSource('10.1/shared'))
+        for c in mc._checkers:
+            c._output = lambda: None
+        event_loop.run_until_complete(mc.run())
+
+        # Both copies got the DOI found for the first one
+        assert len(sources[0].queries) == 1
+        # ... but their URLs differ
+        assert sorted(sources[1].queries) == ['a', 'b']
+        for c in mc._checkers:
+            [entry] = c._entries.values()
+            assert [s.source for s in c._suggestions[entry.get_id()]
+                    if s.source != 'unifier'] == ['bydoi', 'byurl']
@@ -1,7 +1,12 @@
-from testutils import set_config, run_to_checks
+from testutils import set_config, run_to_checks, parse_to_entries
 from aioresponses import aioresponses
 import pytest
 
+from bibchex.checks.authors import InitialDottedChecker
+from bibchex.checks import duplicates
+from bibchex.checks.common import DistinctValueCache
+from bibchex.parallel import WorkerPool
+
 
 @pytest.fixture
 def mhttp():
@@ -418,6 +423,31 @@ class TestAuthorChecks:
         assert ('hasAbbrevFirst', 'author_initial_dotted') not in problem_set
         assert ('hasFullName', 'author_initial_dotted') not in problem_set
 
+    def test_person_cache(self, datadir, event_loop):
+        f = datadir['problem_authors.bib']
+
+        results = {}
+        for want_dotted in (True, False, True):
+            set_config({'author_initial_want_dotted': want_dotted})
+            entries = parse_to_entries(f)
+            checker = InitialDottedChecker()
+            problems = []
+            for entry in entries.values():
+                cached = event_loop.run_until_complete(checker.check(entry))
+                uncached = [problem
+                            for (field, name) in (('authors', 'Author'),
+                                                  ('editors', 'Editor'))
+                            for (first, last) in getattr(entry, field)
+                            for problem in checker.check_person(
+                                name, first, last, want_dotted)]
+                assert cached == uncached
+                problems.extend(cached)
+            results.setdefault(want_dotted, []).append(problems)
+
+        # The configurations do not share cached results
+        assert results[True][0] == results[True][1]
+        assert results[True][0] != results[False][0]
+
     def test_allcaps_names(self, datadir, event_loop):
         f = datadir['problem_authors.bib']
 
@@ -477,3 +507,83 @@ class TestAuthorChecks:
 
         assert ('hasAbbrevLast', 'author_names_lastinitial') in problem_set
         assert ('hasDottedLast', 'author_names_lastinitial') in problem_set
+
+
+class TestDistinctValueCache:
+    def test_get(self):
+        cache = DistinctValueCache()
+        calls = []
+
+        def compute(value):
+            calls.append(value)
+            return [value]
+
+        assert cache.get(('a', 1), lambda: compute('a')) == ['a']
+        result = cache.get(('a', 1), lambda: compute('b'))
+        assert result == ['a']
+        assert cache.get(('a', 2), lambda: compute('c')) == ['c']
+        assert calls == ['a', 'c']
+
+        # Every caller gets its own list
+        result.append('x')
+        assert cache.get(('a', 1), lambda: compute('d')) == ['a']
+
+
+class TestDuplicateChecks:
+    def test_duplicate_entries(self, datadir, event_loop):
+        f = datadir['problem_duplicates.bib']
+
+        set_config({'check_duplicate_entries': True})
+
+        (problems, global_problems) = run_to_checks(f, event_loop)
+        problem_set = set((problem.source, problem.message)
+                          for problem in global_problems)
+
+        assert problem_set == set((
+            ('duplicate_entries',
+             "Entries '{}' and '{}' seem to be duplicates.".format(id1, id2))
+            for (id1, id2) in [('duplicate', 'original'),
+                               ('duplicate', 'typo'),
+                               ('original', 'typo')]))
+
+    def test_max_bucket_size(self, datadir, event_loop):
+        f = datadir['problem_duplicates_buckets.bib']
+
+        # The five entries called 'Introduction' are not compared
+        set_config({'check_duplicate_entries': True,
+                    'duplicate_max_bucket_size': 4})
+
+        (_, global_problems) = run_to_checks(f, event_loop)
+        assert [problem.message for problem in global_problems] == \
+            ["Entries 'duplicate' and 'original' seem to be duplicates."]
+
+        set_config({'check_duplicate_entries': True})
+        (_, global_problems) = run_to_checks(f, event_loop)
+        assert len(global_problems) == 11
+
+    def test_worker_processes(self, datadir, event_loop, monkeypatch):
+        f = datadir['problem_duplicates.bib']
+        set_config({'check_duplicate_entries': True})
+        (_, expected) = run_to_checks(f, event_loop)
+
+        class ProcessPool(WorkerPool):
+            def __init__(self, data, work_size=None, min_process_work=None,
+                         prepare=None):
+                super().__init__(data, work_size, 0, prepare)
+
+        calls = []
+        candidates = duplicates.DuplicateEntryChecker._candidates
+
+        def counted_candidates(seen, max_bucket_size):
+            calls.append(len(seen))
+            return candidates(seen, max_bucket_size)
+
+        monkeypatch.setattr(duplicates, 'WorkerPool', ProcessPool)
+        monkeypatch.setattr(duplicates.DuplicateEntryChecker, '_candidates',
+                            staticmethod(counted_candidates))
+        set_config({'check_duplicate_entries': True, 'processes': 2})
+        (_, global_problems) = run_to_checks(f, event_loop)
+        assert [(p.source, p.message) for p in global_problems] == \
+            [(p.source, p.message) for p in expected]
+        # The candidates are only found once, not in every worker
+        assert len(calls) == 1
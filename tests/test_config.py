@@ -0,0 +1,59 @@
+from testutils import make_entry
+from bibchex.config import ConfigImpl
+
+
+class TestConfig:
+    CONFIG = {
+        "required": ["author", "title"],
+        "wanted": ["title"],
+        "check_doi": True,
+        "sub": [
+            {
+                "select_field": "entrytype",
+                "select_re": "article",
+                "required": ["author", "title", "journal"],
+                "check_doi": False,
+                "sub": [
+                    {
+                        "select_field": "journal",
+                        "select_re": "Foo",
+                        "wanted": ["journal"]
+                    }
+                ]
+            },
+            {
+                "select_field": "entrytype",
+                "select_re": "art",
+                "required": ["title"],
+                "wanted": ["author"]
+            }
+        ]
+    }
+
+    def test_sub_configs(self):
+        cfg = ConfigImpl(TestConfig.CONFIG, thread_count=1)
+
+        article = make_entry({'journal': 'Foo Journal'})
+        assert cfg.get('required', article) == ["author", "title", "journal"]
+        assert cfg.get('wanted', article) == ["journal"]
+        # Falsy values do not override
+        assert cfg.get('check_doi', article) is True
+        assert cfg.get('missing', article, 42) == 42
+
+        other_article = make_entry({'journal': 'Bar Journal'})
+        assert cfg.get('wanted', other_article) == ["author"]
+
+        book = make_entry({}, entrytype='book')
+        assert cfg.get('required', book) == ["author", "title"]
+        assert cfg.get('wanted', book) == ["title"]
+
+    def test_cache_invalidation(self):
+        cfg = ConfigImpl(TestConfig.CONFIG, thread_count=1)
+
+        entry = make_entry({'journal': 'Bar Journal'})
+        assert cfg.get('wanted', entry) == ["author"]
+        assert cfg.resolve(entry) is cfg.resolve(
+            make_entry({'journal': 'Baz Journal'}))
+
+        entry.data['journal'] = 'Foo Journal'
+        assert cfg.get('wanted', entry) == ["journal"]
@@ -39,3 +39,37 @@ class TestDiffer:
         d = Differ(e)
         result = d.diff(s)
         assert result == []
+
+    def test_ignored_fields(self, datadir):
+        e = make_entry({'title': 'This is some title.',
+                        'journal': 'Some Journal',
+                        'author': 'John Doe',
+                        'bibchex-ignore-diffs': 'test.title;other.*'})
+
+        s = Suggestion('test', e)
+        s.add_field('title', 'Another title.')
+        s.add_field('journal', 'Another Journal')
+        s.add_author('John', 'Smith')
+
+        d = Differ(e)
+        result = d.diff(s)
+        assert sorted(diff.field for diff in result) == ['Author 1',
+                                                         'journal']
+
+        s = Suggestion('other', e)
+        s.add_field('title', 'Another title.')
+        assert d.diff(s) == []
+
+    def test_normalization_per_field(self, datadir):
+        e = make_entry({'doi': '10.1000/ABC',
+                        'publisher': '10.1000/ABC'})
+
+        s = Suggestion('test', e)
+        s.add_field('doi', '10.1000/abc')
+        s.add_field('publisher', '10.1000/abc')
+
+        # The same value is normalized differently for different fields
+        d = Differ(e)
+        result = d.diff(s)
+        assert [diff.field for diff in result] == ['publisher']
+        assert [diff.field for diff in d.diff(s)] == ['publisher']
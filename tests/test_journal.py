@@ -0,0 +1,170 @@
+from testutils import FakeDoiSource, FakeSource, set_config
+
+from bibchex.checker import Checker
+from bibchex.journal import Journal
+from bibchex.parsing import SourceIndex
+from bibchex.ui import UI
+
+
+class TestJournal:
+    def test_resume(self, tmpdir):
+        path = str(tmpdir.join('test.journal'))
+
+        j = Journal(path)
+        j.record('doi', '', 'entry1', 'hash1', {'doi': '10.1000/1'})
+        j.record('check', 'doi', 'entry1', 'hash1', {'problems': []})
+        j.close()
+
+        j = Journal(path, resume=True)
+        assert j.get('doi', '', 'entry1', 'hash1') == {'doi': '10.1000/1'}
+        assert j.get('check', 'doi', 'entry1', 'hash1') == {'problems': []}
+        # Entry changed in the meantime
+        assert j.get('doi', '', 'entry1', 'hash2') is None
+        assert j.get('doi', '', 'entry2', 'hash1') is None
+        j.close()
+
+    def test_incomplete_record(self, tmpdir):
+        path = str(tmpdir.join('test.journal'))
+
+        j = Journal(path)
+        j.record('doi', '', 'entry1', 'hash1', {'doi': None})
+        j.close()
+
+        with open(path, 'a') as journal_file:
+            journal_file.write('{"stage": "doi", "na')
+
+        j = Journal(path, resume=True)
+        assert j.get('doi', '', 'entry1', 'hash1') == {'doi': None}
+        # Records are not appended to the incomplete one
+        j.record('doi', '', 'entry2', 'hash2', {'doi': '10.1000/2'})
+        j.close()
+
+        with open(path, 'r') as journal_file:
+            assert len(journal_file.readlines()) == 2
+        j = Journal(path, resume=True)
+        assert j.get('doi', '', 'entry1', 'hash1') == {'doi': None}
+        assert j.get('doi', '', 'entry2', 'hash2') == {'doi': '10.1000/2'}
+        j.close()
+
+    def test_own_records(self, tmpdir):
+        j = Journal(str(tmpdir.join('test.journal')))
+        problems = [('problem', "Message", None)]
+        j.record('check', 'doi', 'entry1', 'hash1', {'problems': problems})
+        problems.clear()
+        assert j.get('check', 'doi', 'entry1', 'hash1') == \
+            {'problems': [['problem', "Message", None]]}
+        j.close()
+
+    def test_no_resume_truncates(self, tmpdir):
+        path = str(tmpdir.join('test.journal'))
+
+        j = Journal(path)
+        j.record('doi', '', 'entry1', 'hash1', {'doi': None})
+        j.close()
+
+        Journal(path).close()
+        j = Journal(path, resume=True)
+        assert j.get('doi', '', 'entry1', 'hash1') is None
+        j.close()
+
+
+BIBTEX = """@article{first,
+ title={Linear Work Generation of RMAT Graphs},
+ doi={10.1017/nws.2018.7}
+}
+
+@article{second,
+ title={Shifting Consumption to Improve Load Balancing}
+}
+"""
+
+
+def run_journaled(bibfile, journal_path, resume, main_loop):
+    UI.select_silent()
+    source = FakeSource(
+        'counting', {'title': "Linear Work Generation of R-MAT Graphs"})
+    doi_source = FakeDoiSource('10.1000/found')
+    journal = Journal(journal_path, resume=resume)
+    c = Checker(bibfile, '/dev/null', sources=[source], doi_source=doi_source,
+                journal=journal)
+    c._output = lambda: None
+    main_loop.run_until_complete(c.run())
+    journal.close()
+    # Only the hashes of the entry dicts are kept
+    assert c._raw_entries == {}
+    assert sorted(c._entry_hashes.keys()) == ['first', 'second']
+
+    results = (sorted((d.entry_id, d.source, d.field, str(d.suggestion))
+                      for d in c._diffs),
+               sorted((p.entry_id, p.source, p.message)
+                      for p in c._problems))
+    return (results, source.queries + doi_source.queries)
+
+
+class TestCheckerResume:
+    def test_resume(self, tmpdir, event_loop):
+        set_config({'check_has_title': True, 'check_doi': True})
+        bibfile = tmpdir.join('refs.bib')
+        bibfile.write(BIBTEX)
+        journal_path = str(tmpdir.join('refs.journal'))
+
+        (results, queries) = run_journaled(str(bibfile), journal_path, False,
+                                           event_loop)
+        assert sorted(queries) == ['first', 'second', 'second']
+        assert results[0]
+
+        # Nothing is retrieved again
+        assert run_journaled(str(bibfile), journal_path, True,
+                             event_loop) == (results, [])
+
+        # Interrupted while recording the retrieval for 'second'
+        with open(journal_path, 'r') as journal_file:
+            lines = journal_file.readlines()
+        assert '"retrieve", "name": "counting", "entry": "second"' in lines[2]
+        with open(journal_path, 'w') as journal_file:
+            journal_file.writelines(lines[:2])
+            journal_file.write(lines[2][:40])
+        assert run_journaled(str(bibfile), journal_path, True,
+                             event_loop) == (results, ['second'])
+
+        # Only the changed entry is retrieved again
+        bibfile.write(BIBTEX.replace("Load Balancing", "Load Balance"))
+        (_, queries) = run_journaled(str(bibfile), journal_path, True,
+                                     event_loop)
+        assert sorted(queries) == ['second', 'second']
+
+    def test_watch(self, tmpdir, event_loop):
+        set_config({'check_has_title': True})
+        UI.select_silent()
+        bibfile = tmpdir.join('refs.bib')
+        bibfile.write(BIBTEX)
+        source = FakeSource(
+            'counting', {'title': "Linear Work Generation of R-MAT Graphs"})
+        journal = Journal(str(tmpdir.join('refs.journal')))
+        c = Checker(str(bibfile), '/dev/null', sources=[source],
+                    doi_source=FakeDoiSource('10.1000/found'),
+                    journal=journal)
+        c._output = lambda: None
+
+        async def start_watching():
+            # What watch() does before it waits for changes
+            c._index = SourceIndex(c._fname)
+            await c.run()
+            c._warm_global_checks = True
+
+        def problems():
+            return sorted((p.entry_id, p.source) for p in c._problems)
+
+        event_loop.run_until_complete(start_watching())
+        assert problems() == []
+        assert sorted(source.queries) == ['first', 'second']
+
+        # The edited entry is checked again, not answered from the journal
+        source.queries.clear()
+        bibfile.write(BIBTEX.replace(
+            "title={Shifting Consumption to Improve Load Balancing}",
+            "year={2020}"))
+        event_loop.run_until_complete(c._recheck())
+        assert problems() == [('second', 'has_title')]
+        assert source.queries == ['second']
+        journal.close()
@@ -0,0 +1,147 @@
+import asyncio
+import io
+import json
+
+from testutils import FakeDoiSource, FakeSource, set_config
+
+from bibchex.lsp import LanguageServer
+from bibchex.sources import CachedSource
+from bibchex.ui import UI
+
+BIBTEX = """@article{barth2018,
+ title={Linear Work Generation of R-MAT Graphs}
+}
+
+@article{barth2018,
+ title={Shifting Consumption to Improve Load Balancing}
+}
+
+@article{other,
+ author={Jane Doe}
+}
+"""
+
+URI = 'file:///test.bib'
+
+
+def make_server():
+    UI.select_silent()
+    server = LanguageServer()
+    server._sources = []
+    server._doi_source = FakeDoiSource()
+    server._output = io.BytesIO()
+    return server
+
+
+def sent_messages(server):
+    messages = []
+    data = server._output.getvalue()
+    while data:
+        (header, data) = data.split(b'\r\n\r\n', 1)
+        length = int(header.split(b':')[1])
+        messages.append(json.loads(data[:length].decode('utf-8')))
+        data = data[length:]
+    return messages
+
+
+def open_document(server, text):
+    server._dispatch({'method': 'textDocument/didOpen',
+                      'params': {'textDocument': {'uri': URI,
+                                                  'text': text}}})
+
+
+class TestLanguageServer:
+    def test_duplicate_keys(self, event_loop):
+        set_config({'check_has_title': True})
+        server = make_server()
+
+        async def run():
+            open_document(server, BIBTEX)
+
+        event_loop.run_until_complete(run())
+        document = server._documents[URI]
+        assert sorted(document.entries.keys()) == ['barth2018', 'other']
+        # The first entry with the key is the one that is checked
+        assert document.entries['barth2018'].entry.data['title'] == \
+            "Linear Work Generation of R-MAT Graphs"
+        assert [key for (_, key) in document.duplicates] == ['barth2018']
+
+        # Published right away, and again once retrieval completes
+        publish = sent_messages(server)[-1]
+        diagnostics = publish['params']['diagnostics']
+        duplicates = [d for d in diagnostics if d['code'] == 'duplicate_key']
+        assert len(duplicates) == 1
+        assert duplicates[0]['range']['start']['line'] == 4
+        assert any((d['code'] == 'has_title' for d in diagnostics))
+
+    def test_handler_errors(self, event_loop):
+        set_config({})
+        server = make_server()
+
+        def fail(params):
+            raise ValueError("Broken")
+
+        server._handlers['initialize'] = fail
+        server._handlers['textDocument/didOpen'] = fail
+
+        server._dispatch({'id': 1, 'method': 'initialize', 'params': {}})
+        server._dispatch({'method': 'textDocument/didOpen', 'params': {}})
+        server._dispatch({'id': 2, 'method': 'shutdown'})
+
+        (error, result) = sent_messages(server)
+        assert error['id'] == 1
+        assert error['error']['code'] == -32603
+        assert "Broken" in error['error']['message']
+        assert result == {'jsonrpc': '2.0', 'id': 2, 'result': None}
+
+    def test_entry_boundaries(self, event_loop):
+        set_config({'check_has_title': True})
+        server = make_server()
+        text = ("@article{first,\n title={A title\n"
+                "@starting with an at sign}\n}\n\n"
+                "@article{typing,\n title={Unfinished\n\n" + BIBTEX)
+
+        async def run():
+            open_document(server, text)
+
+        event_loop.run_until_complete(run())
+        document = server._documents[URI]
+        # The title does not start an entry, and the entry that is being
+        # typed does not hide the following ones
+        assert sorted(document.entries.keys()) == \
+            ['barth2018', 'first', 'other']
+        assert "@starting" in document.entries['first'].entry.data['title']
+        assert document.get_line(document.entries['barth2018'].offset) == 8
+
+    def test_applicable_sources(self, event_loop):
+        set_config({'query_skipped': False})
+        server = make_server()
+        sources = [FakeSource('bydoi', key_field='doi'),
+                   FakeSource('byurl', key_field='url'),
+                   FakeSource('skipped', key_field=None)]
+        server._sources = [CachedSource(source) for source in sources]
+
+        async def run():
+            open_document(server, "@article{a,\n doi={10.1000/1}\n}\n")
+            await asyncio.gather(*(de.task for de
+                                   in server._documents[URI].entries.values()))
+
+        event_loop.run_until_complete(run())
+        assert [source.queries for source in sources] == \
+            [['a'], [], []]
+
+    def test_invalid_messages(self, event_loop):
+        server = make_server()
+        output = server._output
+        reader = asyncio.StreamReader()
+        body = b'{"jsonrpc": "2.0", "id": 1, "method": "shutdown"}'
+        reader.feed_data(b"Content-Type: foo\r\n\r\n")
+        reader.feed_data(b"Content-Length: 3\r\n\r\n{x}")
+        reader.feed_data(b"Content-Length: %d\r\n\r\n%s" % (len(body), body))
+        reader.feed_eof()
+
+        event_loop.run_until_complete(server.serve(reader, output))
+        (missing_length, invalid_json, result) = sent_messages(server)
+        assert missing_length['error']['code'] == -32600
+        assert invalid_json['error']['code'] == -32700
+        assert result == {'jsonrpc': '2.0', 'id': 1, 'result': None}
@@ -0,0 +1,100 @@
+import asyncio
+import os
+
+from testutils import set_config
+
+from bibchex.checks.common import GenericAbbrevChecker
+from bibchex.parallel import WorkerPool
+from bibchex.strutil import AbbrevFinder
+
+
+def _prepare(data):
+    return [x * 10 for x in data]
+
+
+def _job(data, arg):
+    return (os.getpid(), data[arg])
+
+
+class AbbrevChecker(GenericAbbrevChecker):
+    NAME = 'test_abbrevs'
+    MSG_NAME = 'Name'
+    FIELDS = ['journal']
+
+
+JOURNALS = ["Journal of Algorithms", "J. Algorithms", "J. Alg.",
+            "Theoretical Computer Science", "Theor. Comput. Sci.", "TCS"]
+
+
+class TestWorkerPool:
+    def test_processes(self, event_loop):
+        set_config({'processes': 2})
+
+        async def run():
+            async with WorkerPool([1, 2, 3], work_size=10,
+                                  min_process_work=5,
+                                  prepare=_prepare) as pool:
+                assert pool.get_worker_count() == 2
+                assert WorkerPool._busy_workers == 2
+                return await pool.map(_job, [2, 0, 1, 2])
+
+        results = event_loop.run_until_complete(run())
+        assert [value for (_, value) in results] == [30, 10, 20, 30]
+        assert os.getpid() not in set((pid for (pid, _) in results))
+        assert WorkerPool._busy_workers == 0
+
+    def test_threads(self, event_loop):
+        set_config({'processes': 2})
+
+        async def run(**kwargs):
+            async with WorkerPool([1, 2, 3], prepare=_prepare,
+                                  **kwargs) as pool:
+                return await pool.map(_job, [2, 0])
+
+        # Not enough work to start processes
+        results = event_loop.run_until_complete(
+            run(work_size=10, min_process_work=100))
+        assert results == [(os.getpid(), 30), (os.getpid(), 10)]
+
+        set_config({'processes': 2, 'global_check_backend': 'thread'})
+        results = event_loop.run_until_complete(run())
+        assert results == [(os.getpid(), 30), (os.getpid(), 10)]
+
+    def test_shared_worker_limit(self, event_loop):
+        set_config({'processes': 4})
+
+        async def run():
+            async with WorkerPool([1], prepare=_prepare) as first:
+                async with WorkerPool([2], prepare=_prepare) as second:
+                    async with WorkerPool([3], prepare=_prepare) as third:
+                        counts = [pool.get_worker_count()
+                                  for pool in (first, second, third)]
+                        results = await asyncio.gather(
+                            *(pool.map(_job, [0])
+                              for pool in (first, second, third)))
+                        return (counts, results)
+
+        with WorkerPool.shared_by(2):
+            (counts, results) = event_loop.run_until_complete(run())
+        # The first two pools split the processes, the third uses threads
+        assert counts[:2] == [2, 2]
+        assert [value for [(_, value)] in results] == [10, 20, 30]
+        assert results[2][0][0] == os.getpid()
+        assert WorkerPool._busy_workers == 0
+        assert WorkerPool._sharing_pools == 1
+
+    def test_abbrev_checker(self, event_loop):
+        set_config({'processes': 2})
+        AbbrevChecker.SEEN_NAMES[AbbrevChecker.NAME] = {
+            'entry{}'.format(i): (journal,)
+            for (i, journal) in enumerate(JOURNALS)}
+
+        problems = event_loop.run_until_complete(
+            AbbrevChecker.complete(None))
+
+        pairs = AbbrevFinder(sorted(JOURNALS)).get()
+        assert pairs
+        assert problems == [
+            ('test_abbrevs',
+             "Name '{}' could be an abbreviation of '{}'.".format(s1, s2), "")
+            for (s1, s2) in pairs]
@@ -1,5 +1,15 @@
 import pytest_datadir_ng
 from testutils import make_entry, parse_to_entries
+import io
+
+import pytest
+
+from bibchex import parsing
+from bibchex.parsing import split_entries, is_string_definition, parse_chunk
+from bibchex.parsing import iter_bibtex, split_for_parallel, parse_entries
+from bibchex.parsing import parse_bibtex, SourceIndex, iter_chunks
+from bibchex.tokenizer import tokenize, UnsupportedSyntax
+from bibchex.checker import read_bibtex, stream_bibtex, DuplicateKeyError
 
 
 class TestParsing:
@@ -42,3 +52,211 @@ class TestParsing:
         assert entries['middleNames'].authors == [('Lukas F J', 'Barth')]
         assert entries['middleNamesReverse'].authors == [('Lukas F J', 'Barth')]
 
+
+    def test_interning(self, tmp_path):
+        path = tmp_path / 'interned.bib'
+        path.write_text(
+            "@article{a,\n author={Jane Doe},\n journal={Network Science}\n}"
+            "\n@article{b,\n author={Jane Doe},\n journal={Network Science}"
+            "\n}\n")
+        entries = parse_to_entries(str(path))
+        (a, b) = (entries['a'], entries['b'])
+        # Equal values are shared by all entries
+        assert a.data['journal'] is b.data['journal']
+        assert a.authors[0][0] is b.authors[0][0]
+        assert a.authors[0][1] is b.authors[0][1]
+
+    def test_split_entries(self):
+        text = ('% Some comment\n'
+                '@string{foo = "Foo Journal"}\n'
+                '@article{first,\n  title={First},\n  journal=foo\n}\n'
+                '  @book{second, title={Second}}\n')
+        chunks = split_entries(text)
+
+        assert [text[offset:offset + len(chunk)] for (offset, chunk)
+                in chunks] == [chunk for (_, chunk) in chunks]
+        assert len(chunks) == 3
+        assert is_string_definition(chunks[0][1])
+        assert not is_string_definition(chunks[1][1])
+
+        bentries = parse_chunk(chunks[1][1], strings=chunks[0][1])
+        assert len(bentries) == 1
+        assert bentries[0]['ID'] == 'first'
+        assert bentries[0]['journal'] == 'Foo Journal'
+
+    def test_fingerprint(self):
+        by_doi = make_entry({'doi': '10.1000/ABC ', 'title': 'Foo'})
+        by_isbn = make_entry({'isbn': '978-3-16-148410-0'})
+        by_title = make_entry({'title': 'Some {T}itle -- here',
+                               'year': '2020'})
+        same_title = make_entry({'title': 'some title here', 'year': '2020'})
+
+        assert by_doi.get_fingerprint() == 'doi:10.1000/abc'
+        assert by_isbn.get_fingerprint() == 'isbn:9783161484100'
+        assert by_title.get_fingerprint() == same_title.get_fingerprint()
+        assert make_entry({}).get_fingerprint() is None
+
+    def test_raw_data(self):
+        e = make_entry({'title': r'{M}{\"u}ller', 'journal': 'Plain Journal'})
+
+        assert e.data['title'] == 'Müller'
+        assert e.get_raw('title') == r'{M}{\"u}ller'
+        # Raw values are only stored if they differ
+        assert 'journal' not in e.raw_data
+        assert e.get_raw('journal') == 'Plain Journal'
+        assert e.get_raw('booktitle', '') == ''
+        assert not hasattr(e, '__dict__')
+
+    def test_streaming(self):
+        text = """
+@string{tcs = "Theoretical Computer Science"}
+@article{first,
+  title = {First},
+  journal = tcs,
+  note = {A note with a line
+@starting with an at sign}
+}
+@article{second, title = {Second}, journal = tcs # " Letters"}
+@article{third, title = {Third}}
+"""
+        for batch_size in (1, 2, 100):
+            bentries = list(iter_bibtex(io.StringIO(text), batch_size))
+            assert [b['ID'] for b in bentries] == ['first', 'second', 'third']
+            assert bentries[1]['journal'] == \
+                'Theoretical Computer Science Letters'
+
+        assert list(stream_bibtex(None, text)) == \
+            list(read_bibtex(None, text).values())
+
+        with pytest.raises(DuplicateKeyError):
+            list(stream_bibtex(None, text + "@article{first, title={X}}\n"))
+
+    def test_stray_braces(self, tmp_path):
+        text = ("@article{first,\n  title = {An escaped \\{ brace}\n}\n"
+                "% A comment with a stray { brace\n"
+                "@article{second,\n  title = {Second}\n}\n"
+                "@article(third,\n  title = {Third},\n"
+                "  note = {A note\n@starting with an at sign}\n)\n"
+                "@article{fourth, title = {Fourth}}\n")
+        chunks = list(iter_chunks(io.StringIO(text), 1))
+        assert [chunk.split(',')[0] for chunk in chunks] == [
+            "@article{first", "@article{second", "@article(third",
+            "@article{fourth"]
+
+        f = tmp_path / "braces.bib"
+        f.write_text(text)
+        index = SourceIndex(str(f))
+        index.update()
+        assert [b['ID'] for b in index.get_entries()] == \
+            [b['ID'] for b in iter_bibtex(io.StringIO(text), 1)]
+        lines = [(segment.first_line, segment.last_line)
+                 for segment in (index.get_segment(key)
+                                 for key in ('second', 'fourth'))]
+        assert lines == [(5, 7), (13, 13)]
+
+    def test_split_for_parallel(self):
+        text = "".join(
+            ["@string{tcs = \"Theoretical Computer Science\"}\n"] +
+            ["@article{{e{0}, title = {{Title {0}}}, journal = tcs}}\n"
+             .format(i) for i in range(10)] +
+            ["@string{jacm = \"Journal of the ACM\"}\n",
+             "@article{last, title = {Last}, journal = jacm}\n"])
+
+        for chunk_count in (1, 3, 100):
+            jobs = split_for_parallel(text, chunk_count)
+            assert len(jobs) <= max(chunk_count, 12)
+            parsed = [result for job in jobs
+                      for result in parse_entries((None, True), job)]
+            assert [bentry for (bentry, _) in parsed] == \
+                list(read_bibtex(None, text).values())
+            assert parsed[-1][1].data['journal'] == 'Journal of the ACM'
+
+        # Without the entry dicts
+        parsed = [result for job in split_for_parallel(text, 3)
+                  for result in parse_entries((None, False), job)]
+        assert [(bentry, entry.get_id()) for (bentry, entry) in parsed] == \
+            [(None, key) for key in read_bibtex(None, text)]
+
+    def test_parser_releases_entries(self):
+        text = "@article{first,\n  title = {First}\n}\n"
+        assert parse_bibtex(text, backend='bibtexparser')[0]['ID'] == 'first'
+        # The cached parser does not keep the last results alive
+        assert parsing._LOCAL.parser.bib_database is None
+
+    def test_native_backend(self, datadir):
+        texts = [open(datadir[name]).read()
+                 for name in ('escaped.bib', 'authors.bib')]
+        texts.append("""\ufeff% Some comment
+@string{tcs = "Theoretical Computer Science"}
+@comment{Not an entry}
+@preamble{"\\newcommand{\\noop}[1]{}"}
+@article{first,
+  Title = {A {Nested} title
+           on two lines},
+  journal = tcs # " Letters",
+  month = jan,
+  year = 2020,
+  title = {Duplicate},
+  note = "Quoted {"} value",
+}
+@unknown{ignored, title={Ignored}}
+junk @article{junk, title={Junk}}
+@article{malformed, title={Unclosed}
+@Book {second, title = "Second" # {}, year = {}}@misc{third, note={{}}}
+""")
+
+        for text in texts:
+            assert parse_bibtex(text, backend='native') == \
+                parse_bibtex(text, backend='bibtexparser')
+
+        bentries = tokenize(texts[-1])
+        assert [b['ID'] for b in bentries] == ['first', 'second', 'third']
+        assert bentries[0]['title'] == 'A {Nested} title\non two lines'
+        assert bentries[0]['journal'] == 'Theoretical Computer Science Letters'
+        assert bentries[0]['month'] == 'January'
+
+        # Tabs are expanded, depending on their column
+        text = ("@string{s = \"a\tb\"}\n"
+                "@article{tabs,\n\ttitle = {A\tB\n\tC},\tnote = s # {\tD}}\n")
+        assert parse_bibtex(text, backend='native') == \
+            parse_bibtex(text, backend='bibtexparser')
+        bentry = tokenize(text)[0]
+        assert bentry['title'] == 'A      B\nC'
+        assert bentry['note'] == 'a  b    D'
+
+    def test_native_backend_fallback(self):
+        text = "@article(first, title = {First})\n"
+        strings = {}
+        with pytest.raises(UnsupportedSyntax):
+            tokenize(text, strings)
+        assert strings == {}
+
+        assert parse_bibtex(text, backend='native') == \
+            parse_bibtex(text, backend='bibtexparser')
+
+    def test_source_index(self, tmp_path):
+        text = ("% Some comment\n"
+                "@string{tcs = \"Theoretical Computer Science\"}\n"
+                "@article{first,\n  title = {First},\n  journal = tcs\n}\n"
+                "@article{second,\n  title = {Second}\n}\n")
+        f = tmp_path / "index.bib"
+        f.write_text(text)
+
+        index = SourceIndex(str(f))
+        assert index.update() == 3
+        assert index.get_entries() == list(read_bibtex(str(f)).values())
+        segment = index.get_segment('first')
+        assert (segment.first_line, segment.last_line) == (3, 6)
+        assert text.encode()[segment.start:segment.end].startswith(
+            b"@article{first,")
+        assert index.get_segment('unknown') is None
+
+        second = index.get_segment('second').bentries
+        f.write_text(text.replace("{First}", "{First, revised}"))
+        assert index.update() == 2
+        assert index.get_entries()[0]['title'] == 'First, revised'
+        assert index.get_segment('second').bentries is second
+
+        # Changed macros affect all following entries
+        f.write_text(text.replace("Theoretical", "Theoretical Computer"))
+        assert index.update() == 3
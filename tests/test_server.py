@@ -0,0 +1,146 @@
+import asyncio
+import threading
+
+from aiohttp import test_utils
+
+from testutils import FakeDoiSource, FakeSource, make_entry, set_config
+
+from bibchex import checker
+from bibchex.server import CheckServer
+from bibchex.sources import CachedSource
+from bibchex.ui import UI
+
+TITLE = {'title': "Linear Work Generation of R-MAT Graphs"}
+
+BIBTEX = """@article{barth2018,
+ title={Linear Work Generation of RMAT Graphs},
+ doi={10.1017/nws.2018.7}
+}
+"""
+
+
+class TestCachedSource:
+    def test_hit_and_miss(self, event_loop):
+        source = FakeSource(fields=TITLE)
+        cached = CachedSource(source)
+        first = make_entry({'doi': '10.1017/nws.2018.7'}, entryid='first')
+        second = make_entry({'doi': '10.1017/NWS.2018.7'}, entryid='second')
+        other = make_entry({'doi': '10.1017/other'}, entryid='other')
+
+        assert cached.get_cached(first) is None
+        (s1, _) = event_loop.run_until_complete(cached.query(first))
+        (s2, _) = event_loop.run_until_complete(cached.query(second))
+        assert len(source.queries) == 1
+        # Every caller gets its own copy
+        assert s1 is not s2
+        assert s2.get_entry() is second
+        assert s1.data == s2.data
+        assert cached.get_cached(second)[0].data == s1.data
+
+        event_loop.run_until_complete(cached.query(other))
+        assert len(source.queries) == 2
+
+    def test_concurrent_queries(self, event_loop):
+        source = FakeSource(fields=TITLE)
+        cached = CachedSource(source)
+        entries = [make_entry({'doi': '10.1017/nws.2018.7'}, entryid=str(i))
+                   for i in range(5)]
+
+        results = event_loop.run_until_complete(asyncio.gather(
+            *(cached.query(entry) for entry in entries)))
+        assert len(source.queries) == 1
+        assert [s.get_entry() for (s, _) in results] == entries
+
+    def test_failures_not_cached(self, event_loop):
+        source = FakeSource(fail=True)
+        cached = CachedSource(source)
+        entry = make_entry({'doi': '10.1017/nws.2018.7'})
+
+        for _ in range(2):
+            (result, error) = event_loop.run_until_complete(
+                cached.query(entry))
+            assert result is None
+            assert error == "Retrieval failed"
+        assert len(source.queries) == 2
+        assert cached.get_cached(entry) is None
+
+    def test_eviction(self, event_loop):
+        source = FakeSource(fields=TITLE)
+        cached = CachedSource(source, max_size=1)
+        a = make_entry({'doi': '10.1/a'})
+        b = make_entry({'doi': '10.1/b'})
+
+        for entry in (a, b, a):
+            event_loop.run_until_complete(cached.query(entry))
+        assert len(source.queries) == 3
+
+
+class TestCheckServer:
+    def make_server(self):
+        UI.select_silent()
+        server = CheckServer()
+        self.source = FakeSource(fields=TITLE)
+        server._sources = [CachedSource(self.source)]
+        server._doi_source = FakeDoiSource()
+        return server
+
+    def test_round_trip(self, event_loop):
+        set_config({'check_has_title': True})
+        server = self.make_server()
+
+        async def run():
+            client = test_utils.TestClient(
+                test_utils.TestServer(server._app))
+            await client.start_server()
+            try:
+                responses = []
+                for name in ('alice.bib', 'bob.bib'):
+                    response = await client.post(
+                        '/check', json={'bibtex': BIBTEX, 'name': name})
+                    assert response.status == 200
+                    responses.append(await response.json())
+
+                bad = await client.post('/check', json={'text': BIBTEX})
+                assert bad.status == 400
+                return responses
+            finally:
+                await client.close()
+
+        responses = event_loop.run_until_complete(run())
+
+        # The second request is answered from the shared cache
+        assert len(self.source.queries) == 1
+        for (response, name) in zip(responses, ('alice.bib', 'bob.bib')):
+            assert response['input_file'] == name
+            assert response['total_entries'] == 1
+            [entry] = response['entries']
+            assert entry['key'] == 'barth2018'
+            assert {
+                'field': 'title',
+                'source': 'fake',
+                'suggestion': ["Linear Work Generation of R-MAT Graphs"],
+                'old': "Linear Work Generation of RMAT Graphs"
+            } in entry['differences']
+
+    def test_parse_off_loop(self, event_loop, monkeypatch):
+        set_config({})
+        server = self.make_server()
+        served = threading.Event()
+        read_bibtex = checker.read_bibtex
+
+        def slow_read_bibtex(filename, text=None):
+            # Only finishes if the event loop keeps running meanwhile
+            assert served.wait(5)
+            return read_bibtex(filename, text)
+
+        monkeypatch.setattr(checker, 'read_bibtex', slow_read_bibtex)
+
+        async def serve():
+            await asyncio.sleep(0)
+            served.set()
+
+        async def run():
+            return await asyncio.gather(server.check(BIBTEX), serve())
+
+        (result, _) = event_loop.run_until_complete(run())
+        assert result['total_entries'] == 1
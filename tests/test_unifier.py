@@ -104,3 +104,55 @@ class TestUnifier:
 
         assert(sugg.data['booktitle'][0] ==
                ('Proceedings of some conference', Suggestion.KIND_PLAIN))
+
+    def test_combined_dispatch(self, datadir, event_loop):
+        rules = [
+            [r'(?P<prefix>.*)first(?P<suffix>.*)',
+                r'{prefix}1st{suffix}', 'kind:plain', 'priority:50'],
+            [r'(?P<prefix>.*) IEEE(?P<suffix>.*)',
+                r'{prefix}{suffix}', 'kind:regex'],
+            # Refers to a group by number, cannot be combined
+            [r'(a)\1(?P<rest>.*)', r'A{rest}', 'kind:plain'],
+            [r'(?P<prefix>.*) remove(?P<suffix>.*)',
+                r'{prefix}{suffix}', 'repeat', 'kind:plain'],
+        ]
+        values = ['Proceedings of the first IEEE conference on whatever',
+                  'aaProceedings remove of remove some conference',
+                  'Proceedings of something else']
+
+        results = []
+        for combined in (False, True):
+            set_config({'unify_booktitle': rules,
+                        'unify_combined_dispatch': combined})
+            u = Unifier()
+            result = []
+            for value in values:
+                sugg = u.unify_entry(make_entry({'booktitle': value}))
+                result.append(sugg.data.get('booktitle'))
+            results.append(result)
+
+        assert results[0] == results[1]
+        assert results[1][1] == [('AProceedings of some conference',
+                                  Suggestion.KIND_PLAIN)]
+        assert results[1][2] is None
+
+    def test_selective(self, datadir, event_loop):
+        set_config({'unify_booktitle': [
+            [r'(?P<prefix>.*) IEEE(?P<suffix>.*)',
+                r'{prefix}{suffix}', 'kind:plain'],
+        ], 'unify_journal': [
+            [r'(?P<prefix>.*) IEEE(?P<suffix>.*)',
+                r'{prefix}{suffix}', 'kind:plain'],
+        ]})
+
+        sugg = Suggestion('test', make_entry({}))
+        sugg.add_field('booktitle', 'Some IEEE Conference')
+        sugg.add_field('journal', 'Some IEEE Journal')
+
+        u = Unifier()
+        u.unify_suggestion(sugg, {'booktitle'})
+
+        assert sugg.data['booktitle'] == [('Some Conference',
+                                           Suggestion.KIND_PLAIN)]
+        assert sugg.data['journal'] == [('Some IEEE Journal',
+                                         Suggestion.KIND_PLAIN)]
@@ -1,25 +1,85 @@
-import math
+import itertools
 
-from bibchex.util import chunked_pairs
+import pytest
+from fuzzywuzzy import fuzz
 
+from bibchex.util import unlatexify, unbrace, translate_accents
+from bibchex.shard import shard_of, parse_shard_spec
+from bibchex.strutil import AbbrevFinder, PartialRatioCandidates
 
-class TestChunkedPairs:
-    def test_complete(self):
-        TESTSIZE = 10
-        CHUNKSIZES = [1, 2, 10]
-        items = list(range(0, TESTSIZE))
-        item_count = TESTSIZE**2 / 2
 
-        expected = set(((i, j)
-                        for i in range(0, TESTSIZE)
-                        for j in range(i+1, TESTSIZE)))
+class TestPartialRatioCandidates:
+    def test_no_missed_pairs(self):
+        names = ["Proceedings of the Symposium on Theory of Computing",
+                 "Symposium on Theory of Computing",
+                 "Symposium on the Theory of Computing",
+                 "Proc. Symp. Theory Comput.",
+                 "Journal of Algorithms",
+                 "Journal of Algorithm",
+                 "ACM Journal of Experimental Algorithmics",
+                 "Algorithmica",
+                 "Theoretical Computer Science",
+                 "SODA", "SODA'20", "Soda", "S", "", "ab", "ba"]
 
-        for cs in CHUNKSIZES:
-            chunk_count = int(math.floor(item_count / cs))
-            chunks = []
-            for i in range(0, chunk_count):
-                cp = list(chunked_pairs(items, chunk_count, i))
-                chunks.append(cp)
+        expected = [(i, j) for (i, j)
+                    in itertools.combinations(range(0, len(names)), 2)
+                    if fuzz.partial_ratio(names[i], names[j]) > 90]
+        candidates = PartialRatioCandidates(names, 90).get()
 
-            computed = set((item for chunk in chunks for item in chunk))
-            assert(expected == computed)
+        assert set(expected) <= set(candidates)
+        assert candidates == sorted(candidates)
+        assert len(candidates) < len(names) * (len(names) - 1) / 2
+
+
+class TestAbbrevFinder:
+    def test_indexed(self):
+        names = ["Journal of Algorithms", "J. Algorithms", "J. Alg.",
+                 "JOURNAL OF ALGORITHMS", "Theoretical Computer Science",
+                 "Theor. Comput. Sci.", "TCS", "Proc. STOC",
+                 "Proceedings of the Symposium on\nTheory of Computing",
+                 "Symp.\nTheory", "", "Stra\u00dfe", "STRASSE"]
+
+        for ignorecase in [True, False]:
+            expected = AbbrevFinder(names, ignorecase=ignorecase,
+                                    indexed=False).get()
+            assert AbbrevFinder(names, ignorecase=ignorecase).get() == \
+                expected
+
+        assert ("J. Alg.", "Journal of Algorithms") in expected
+        assert ("J. Algorithms", "J. Alg.") not in expected
+
+        finder = AbbrevFinder(names)
+        assert finder.get(range(0, 6)) + finder.get(range(6, len(names))) \
+            == finder.get()
+
+
+class TestUnlatexify:
+    def test_translation(self):
+        assert unlatexify(r"{G}{\"o}del's {\'E}cole") == "Gödel’s École"
+        assert unlatexify(r"Na\"{\i}ve \& Co") == "Naïve & Co"
+        assert unlatexify(r"``Quoted'' {A}lgorithms") == "‘‘Quoted’’ Algorithms"
+        assert unlatexify(r"Escaped \{braces\}") == "Escaped {braces}"
+
+    def test_sequential(self):
+        for s in [r"{\'E}t\'e", r"a\\'e \\~x", r"$\mu$\$\ge$ {\`a}",
+                  r"\copy{right} ,{},",
+                  r"Na\"{\i}ve \& Co, \c{c}a"]:
+            assert unlatexify(s) == translate_accents(unbrace(s))
+
+
+class TestShards:
+    def test_shard_of(self):
+        keys = ["key{}".format(i) for i in range(0, 1000)]
+        shards = [shard_of(key, 7) for key in keys]
+
+        assert all((0 <= shard < 7 for shard in shards))
+        assert shards == [shard_of(key, 7) for key in keys]
+        assert len(set(shards)) == 7
+        assert shard_of("foo", 1) == 0
+
+    def test_parse_shard_spec(self):
+        assert parse_shard_spec("0/4") == (0, 4)
+        assert parse_shard_spec("3/4") == (3, 4)
+        for invalid in ("4/4", "-1/4", "1", "a/b", "0/0"):
+            with pytest.raises(ValueError):
+                parse_shard_spec(invalid)
@@ -1,7 +1,8 @@
+import asyncio
 import json
 import pkgutil
 
-from bibchex.data import Entry
+from bibchex.data import Entry, Suggestion
 from bibchex.ui import SilentUI, UI
 from bibchex.checker import Checker
 from bibchex.config import Config, ConfigImpl
@@ -33,6 +34,69 @@ def make_entry(fields, entrytype="article", entryid="dummy"):
     return Entry(data, SilentUI())
 
 
+class FakeSource:
+    """A data source that suggests the same *fields* and *authors* (as
+    (first, last) tuples) for every entry. It applies to the entries that
+    have a value for *key_field*, which is also its cache key ('doi' means
+    the probable DOI), or to every entry if *key_field* is None. Queried
+    entry IDs are recorded in *queries*, and the source's name is appended
+    to *log* on every query, if given."""
+
+    def __init__(self, name='fake', fields=None, key_field='doi', cost=1,
+                 fail=False, log=None, authors=()):
+        self.NAME = name
+        self.COST = cost
+        self.SUGGESTION_SOURCES = (name,)
+        self.queries = []
+        self._fields = fields or {}
+        self._authors = authors
+        self._key_field = key_field
+        self._fail = fail
+        self._log = log
+
+    def applies_to(self, entry):
+        return self._key_field is None or self.cache_key(entry) is not None
+
+    def cache_key(self, entry):
+        if self._key_field is None:
+            return None
+        if self._key_field == 'doi':
+            doi = entry.get_probable_doi()
+            return doi.lower() if doi else None
+        return entry.data.get(self._key_field)
+
+    async def query(self, entry):
+        self.queries.append(entry.get_id())
+        if self._log is not None:
+            self._log.append(self.NAME)
+        await asyncio.sleep(0)
+        if self._fail:
+            return (None, "Retrieval failed")
+        s = Suggestion(self.NAME, entry)
+        for (k, v) in self._fields.items():
+            s.add_field(k, v)
+        for author in self._authors:
+            s.add_author(*author)
+        return (s, None)
+
+
+class FakeDoiSource:
+    """A DOI source that suggests *doi* for every entry, except for the
+    entries in *failing*, for which the search fails. Queried entry IDs are
+    recorded in *queries*."""
+
+    def __init__(self, doi=None, failing=()):
+        self.queries = []
+        self._doi = doi
+        self._failing = failing
+
+    async def get_doi(self, entry):
+        self.queries.append(entry.get_id())
+        if entry.get_id() in self._failing:
+            return (None, "Search failed")
+        return (self._doi, None)
+
+
 def set_config(options, keep_sub=False, deactivate_checks=True):
     default_options = json.loads(pkgutil.get_data('bibchex',
                                                   'data/default_config.json'))